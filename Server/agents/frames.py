@@ -0,0 +1,298 @@
+"""
+Serialización del estado del modelo para los clientes: el estado dinámico
+(coches y semáforos) en cada cuadro y las capas estáticas (carreteras,
+obstáculos y destinos) una sola vez por modelo.
+
+Las posiciones se envían en el sistema de Unity: x es la columna, y es 1
+porque los agentes están en un mundo 3D, y z es la fila del grid de mesa
+menos uno.
+"""
+
+import hashlib
+import json
+import struct
+import zlib
+import numpy as np
+from .tiles import ROAD, OBSTACLE, DESTINATION
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+# Capas estáticas del mapa: nombre -> (tipo de celda, prefijo del id)
+STATIC_LAYERS = {
+    "road": (ROAD, "road"),
+    "obstacles": (OBSTACLE, "ob"),
+    "destinations": (DESTINATION, "dest")
+}
+
+# Cuadros binarios: encabezado (firma, tipo, compresión, paso, número de
+# registros) seguido de un registro de ancho fijo por agente.
+FRAME_HEADER = struct.Struct("<2sBBiI")
+FRAME_MAGIC = b"TF"
+CARS_FRAME = 1
+LIGHTS_FRAME = 2
+CODECS = {"none": 0, "zlib": 1, "lz4": 2}
+CAR_DTYPE = np.dtype([("id", "<i4"), ("x", "<i2"), ("z", "<i2"),
+                      ("destX", "<i2"), ("destZ", "<i2")])
+LIGHT_DTYPE = np.dtype([("id", "<i4"), ("x", "<i2"), ("z", "<i2")])
+
+
+def car_record(car_id, pos, destination):
+    """
+    Convierte un coche en el diccionario que espera Unity.
+
+    Args:
+        car_id: Identificador del coche.
+        pos (tuple): Posición del coche en el grid.
+        destination (tuple): Destino del coche.
+
+    Returns:
+        dict: Id, posición y destino del coche.
+    """
+    x, z = pos
+    return {"id": str(car_id), "x": x, "y": 1, "z": z - 1, "destX": destination[0], "destZ": destination[1] - 1}
+
+
+def light_record(light):
+    """
+    Convierte un semáforo en el diccionario que espera Unity.
+
+    Args:
+        light (Traffic_Light): Semáforo.
+
+    Returns:
+        dict: Id, posición y estado del semáforo.
+    """
+    x, z = light.pos
+    return {"id": str(light.unique_id), "x": x, "y": 1, "z": z - 1, "state": light.state}
+
+
+def car_records(model):
+    """
+    Obtiene los diccionarios de todos los coches del modelo.
+
+    Args:
+        model (CityModel): Modelo.
+
+    Returns:
+        list: Un diccionario por coche.
+    """
+    return [car_record(*car) for car in model.iter_cars()]
+
+
+def light_records(model):
+    """
+    Obtiene los diccionarios de todos los semáforos del modelo.
+
+    Args:
+        model (CityModel): Modelo.
+
+    Returns:
+        list: Un diccionario por semáforo.
+    """
+    return [light_record(light) for light in model.traffic_lights]
+
+
+class DeltaTracker:
+    """
+    Calcula qué cambió en el modelo desde el último cuadro enviado a un cliente.
+
+    Guarda el último estado enviado (posición de cada coche y estado de cada
+    semáforo) y, en cada cuadro, devuelve solo los coches que se movieron,
+    aparecieron o llegaron a su destino y los semáforos que cambiaron.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Olvida el último cuadro enviado, de modo que el siguiente será completo.
+        """
+        self.step = None
+        self.cars = {}
+        self.lights = []
+
+    def frame(self, model, full=False, since=None):
+        """
+        Genera el siguiente cuadro para el cliente.
+
+        Args:
+            model (CityModel): Modelo.
+            full (bool): Si es True se envía el estado completo.
+            since (int): Último paso que recibió el cliente. Si no coincide con
+                el último cuadro enviado, se envía el estado completo.
+
+        Returns:
+            dict: Cuadro con el número de paso, el paso sobre el que se aplica
+            (base) y los cambios, o el estado completo si "full" es True.
+        """
+        cars = {str(car_id): (pos, destination)
+                for car_id, pos, destination in model.iter_cars()}
+        lights = [light.state for light in model.traffic_lights]
+
+        full = full or self.step is None or (
+            since is not None and since != self.step)
+        if full:
+            frame = {
+                "step": model.step_count,
+                "base": None,
+                "full": True,
+                "cars": [car_record(car_id, pos, destination) for car_id, (pos, destination) in cars.items()],
+                "lights": light_records(model)
+            }
+        else:
+            previous = self.cars
+            frame = {
+                "step": model.step_count,
+                "base": self.step,
+                "full": False,
+                "moved": [car_record(car_id, pos, destination) for car_id, (pos, destination) in cars.items()
+                          if car_id in previous and previous[car_id][0] != pos],
+                "spawned": [car_record(car_id, pos, destination) for car_id, (pos, destination) in cars.items()
+                            if car_id not in previous],
+                "arrived": [car_id for car_id in previous if car_id not in cars],
+                "lights": [light_record(light) for light, state, old_state in zip(model.traffic_lights, lights, self.lights)
+                           if state != old_state]
+            }
+
+        self.step = model.step_count
+        self.cars = cars
+        self.lights = lights
+        return frame
+
+
+def static_layer_records(tiles, kind, prefix):
+    """
+    Obtiene los diccionarios de todas las celdas de un tipo a partir de la capa
+    de celdas del mapa. Los ids son los mismos que usan los agentes estáticos
+    (prefijo y número de celda en el archivo del mapa).
+
+    Args:
+        tiles (TileLayer): Capa de celdas del mapa.
+        kind (int): Tipo de celda (ROAD, OBSTACLE o DESTINATION).
+        prefix (str): Prefijo del id.
+
+    Returns:
+        list: Un diccionario por celda, en el mismo orden que grid.coord_iter().
+    """
+    xs, ys = np.nonzero(tiles.kind == kind)
+    return [{"id": f"{prefix}_{(tiles.height - z - 1) * tiles.width + x}", "x": x, "y": 1, "z": z - 1}
+            for x, z in zip(xs.tolist(), ys.tolist())]
+
+
+class StaticLayers:
+    """
+    Respuestas ya serializadas de las capas que no cambian después de cargar el
+    mapa (carreteras, obstáculos y destinos).
+
+    Cada capa se codifica una sola vez en bytes JSON junto con un ETag que es
+    el hash de su contenido, así que el mismo mapa produce el mismo ETag en
+    cualquier modelo.
+
+    Args:
+        tiles (TileLayer): Capa de celdas del mapa.
+    """
+
+    def __init__(self, tiles):
+        self.layers = {}
+        for name, (kind, prefix) in STATIC_LAYERS.items():
+            body = json.dumps({"positions": static_layer_records(tiles, kind, prefix)},
+                              separators=(",", ":")).encode()
+            self.layers[name] = (body, hashlib.blake2b(
+                body, digest_size=16).hexdigest())
+
+    def get(self, name):
+        """
+        Obtiene una capa serializada.
+
+        Args:
+            name (str): "road", "obstacles" o "destinations".
+
+        Returns:
+            tuple: Cuerpo en bytes y ETag.
+        """
+        return self.layers[name]
+
+
+def available_codecs():
+    """
+    Obtiene las compresiones que se pueden usar en los cuadros binarios.
+
+    Returns:
+        list: Nombres de las compresiones. "lz4" solo aparece si está instalado.
+    """
+    return [codec for codec in CODECS if codec != "lz4" or lz4_frame is not None]
+
+
+def pack_frame(kind, step, count, payload, codec="none"):
+    """
+    Agrega el encabezado a un cuadro binario y comprime su contenido.
+
+    Args:
+        kind (int): CARS_FRAME o LIGHTS_FRAME.
+        step (int): Paso del modelo.
+        count (int): Número de registros.
+        payload (bytes): Registros del cuadro.
+        codec (str): "none", "zlib" o "lz4". Solo se comprime el contenido, no el encabezado.
+
+    Returns:
+        bytes: Cuadro completo.
+    """
+    if codec not in available_codecs():
+        raise ValueError(f"Compresión no disponible: {codec}")
+    if codec == "zlib":
+        payload = zlib.compress(payload)
+    elif codec == "lz4":
+        payload = lz4_frame.compress(payload)
+    return FRAME_HEADER.pack(FRAME_MAGIC, kind, CODECS[codec], step, count) + payload
+
+
+def encode_cars(model, codec="none"):
+    """
+    Codifica los coches del modelo en un cuadro binario. Cada coche ocupa un
+    registro CAR_DTYPE de 12 bytes con su número entero (asignado en
+    CityModel.add_car), su posición y su destino en el sistema de Unity.
+
+    Args:
+        model (CityModel): Modelo.
+        codec (str): Compresión del contenido.
+
+    Returns:
+        bytes: Cuadro binario.
+    """
+    numbers, positions, destinations = model.car_arrays()
+    records = np.empty(len(numbers), dtype=CAR_DTYPE)
+    records["id"] = numbers
+    records["x"] = positions[:, 0]
+    records["z"] = positions[:, 1] - 1
+    records["destX"] = destinations[:, 0]
+    records["destZ"] = destinations[:, 1] - 1
+    return pack_frame(CARS_FRAME, model.step_count, len(records), records.tobytes(), codec)
+
+
+def encode_lights(model, codec="none"):
+    """
+    Codifica los semáforos del modelo en un cuadro binario: un registro
+    LIGHT_DTYPE de 8 bytes por semáforo (índice en model.traffic_lights y
+    posición) seguido de los estados empaquetados en bits, un bit por
+    semáforo en el mismo orden (bit menos significativo primero, 1 es verde).
+
+    Args:
+        model (CityModel): Modelo.
+        codec (str): Compresión del contenido.
+
+    Returns:
+        bytes: Cuadro binario.
+    """
+    lights = model.traffic_lights
+    records = np.empty(len(lights), dtype=LIGHT_DTYPE)
+    records["id"] = np.arange(len(lights))
+    records["x"] = [light.pos[0] for light in lights]
+    records["z"] = [light.pos[1] - 1 for light in lights]
+    states = np.packbits(
+        np.array([light.state for light in lights], dtype=bool), bitorder="little")
+    return pack_frame(LIGHTS_FRAME, model.step_count, len(records),
+                      records.tobytes() + states.tobytes(), codec)
@@ -0,0 +1,161 @@
+"""
+Calendario de cambios de los semáforos.
+
+Un semáforo cambia de estado al inicio del paso k del calendario cuando
+k % timeToChange == 0. En lugar de avanzar cada semáforo en cada paso, los
+semáforos se agrupan en intersecciones (semáforos vecinos, incluyendo las
+diagonales) y cada intersección en fases (sus semáforos con el mismo
+periodo, que siempre cambian juntos). Un montículo guarda el siguiente paso
+en que cambia cada fase, así que en cada paso solo se tocan las fases que
+cambian.
+
+Como el patrón es periódico, el estado de cualquier semáforo en cualquier
+paso también se calcula sin simular (state_at y states_at).
+"""
+
+import heapq
+import numpy as np
+
+
+def group_intersections(positions):
+    """
+    Agrupa semáforos vecinos (incluyendo las diagonales) en intersecciones.
+
+    Args:
+        positions (list): Posición de cada semáforo.
+
+    Returns:
+        list: Una lista de índices de semáforos por intersección, ordenadas
+        por el primer semáforo de cada una.
+    """
+    index = {pos: i for i, pos in enumerate(positions)}
+    intersection = [-1] * len(positions)
+    intersections = []
+    for start in range(len(positions)):
+        if intersection[start] >= 0:
+            continue
+        intersection[start] = len(intersections)
+        members = [start]
+        pending = [start]
+        while pending:
+            x, y = positions[pending.pop()]
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    neighbor = index.get((x + dx, y + dy))
+                    if neighbor is not None and intersection[neighbor] < 0:
+                        intersection[neighbor] = len(intersections)
+                        members.append(neighbor)
+                        pending.append(neighbor)
+        intersections.append(sorted(members))
+    return intersections
+
+
+class LightScheduler:
+    """
+    Cambia los semáforos solo en los pasos en que les toca y predice su estado.
+
+    El estado de cada semáforo se guarda en el arreglo states y también en
+    el atributo state de su agente Traffic_Light, que es el que leen los
+    coches y los cuadros del servidor.
+
+    Args:
+        lights (list): Semáforos del modelo (model.traffic_lights).
+    """
+
+    def __init__(self, lights):
+        self.lights = lights
+        self.index = {light.pos: i for i, light in enumerate(lights)}
+        self.intersections = group_intersections([light.pos for light in lights])
+        self.reset(-1)
+
+    def reset(self, step):
+        """
+        Vuelve a leer el estado y el periodo de los semáforos y reconstruye
+        el calendario. Se llama cuando se cambian los semáforos desde fuera,
+        por ejemplo al restaurar un estado guardado.
+
+        Args:
+            step (int): Último paso cuyos cambios ya están en los semáforos.
+        """
+        self.step = step
+        self.states = np.array([light.state for light in self.lights], dtype=bool)
+        self.periods = np.array([light.timeToChange for light in self.lights], dtype=np.int64)
+
+        # Fases: semáforos de una intersección con el mismo periodo
+        self.phases = []
+        self.queue = []
+        for members in self.intersections:
+            by_period = {}
+            for i in members:
+                by_period.setdefault(int(self.periods[i]), []).append(i)
+            for period, phase in by_period.items():
+                due = (step // period + 1) * period
+                self.queue.append((due, len(self.phases), period))
+                self.phases.append(np.array(phase, dtype=np.intp))
+        heapq.heapify(self.queue)
+
+    def advance(self, step):
+        """
+        Aplica los cambios de todos los pasos hasta step, inclusive. Se llama
+        al inicio de cada paso, antes de mover los coches.
+
+        Args:
+            step (int): Paso del calendario que está por ejecutarse.
+
+        Returns:
+            int: Número de fases que cambiaron.
+        """
+        changed = 0
+        queue = self.queue
+        while queue and queue[0][0] <= step:
+            due, phase, period = queue[0]
+            members = self.phases[phase]
+            self.states[members] ^= True
+            for i, state in zip(members.tolist(), self.states[members].tolist()):
+                self.lights[i].state = state
+            heapq.heapreplace(queue, (due + period, phase, period))
+            changed += 1
+        self.step = max(self.step, step)
+        return changed
+
+    def state_at(self, index, step):
+        """
+        Calcula el estado de un semáforo durante un paso, sin simular.
+
+        Args:
+            index (int): Índice del semáforo en model.traffic_lights.
+            step (int): Paso del calendario.
+
+        Returns:
+            bool: True si el semáforo está en verde durante ese paso.
+        """
+        period = int(self.periods[index])
+        changes = step // period - self.step // period
+        return bool(self.states[index]) != (changes % 2 == 1)
+
+    def states_at(self, step):
+        """
+        Calcula el estado de todos los semáforos durante un paso, sin simular.
+
+        Args:
+            step (int): Paso del calendario.
+
+        Returns:
+            np.ndarray: True para los semáforos en verde durante ese paso.
+        """
+        changes = step // self.periods - self.step // self.periods
+        return self.states ^ (changes % 2 == 1)
+
+    def next_change(self, index, step):
+        """
+        Obtiene el primer paso posterior a step en que cambia un semáforo.
+
+        Args:
+            index (int): Índice del semáforo en model.traffic_lights.
+            step (int): Paso del calendario.
+
+        Returns:
+            int: Paso del siguiente cambio.
+        """
+        period = int(self.periods[index])
+        return (step // period + 1) * period
@@ -0,0 +1,218 @@
+"""
+Caché en disco de los mapas ya compilados.
+
+Compilar un mapa es convertir el archivo de texto y el diccionario del mapa
+en los arreglos de la capa de celdas, la lista de aristas del grafo con sus
+pesos y la lista de destinos, y guardarlos en un .npz dentro de
+MAP_CACHE_DIR. El nombre del archivo es un hash del contenido de los dos
+archivos de entrada (y de CACHE_VERSION), así que un mapa modificado se
+vuelve a compilar solo y uno sin cambios se carga sin volver a leerlo
+celda por celda.
+
+Las tablas de siguiente salto del Router se guardan aparte, una por
+destino en <hash>.table_<renglón>.npz, cuando un modelo con routing="table"
+construye la tabla de ese destino, porque los otros modos de ruteo no las
+necesitan y un modelo solo construye las de los destinos que usan sus coches.
+
+Uso:
+    python -m agents.mapcache 2021_base.txt 2022_base.txt 2023_base.txt
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+from .tiles import DESTINATION, TileLayer
+
+MAP_CACHE_DIR = os.path.join(os.path.dirname(__file__), '../map_cache')
+
+# Cambia cuando cambia el contenido de los archivos compilados o la forma de construir las aristas
+CACHE_VERSION = 2
+
+TILE_ARRAYS = ("symbols", "kind", "directions", "light_index")
+
+
+def map_key(city_path, dictionary_path):
+    """
+    Calcula la llave de un mapa compilado a partir del contenido de sus archivos.
+
+    Args:
+        city_path (str): Archivo del mapa.
+        dictionary_path (str): Diccionario del mapa.
+
+    Returns:
+        str: Hash hexadecimal.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(CACHE_VERSION).encode())
+    for path in (city_path, dictionary_path):
+        with open(path, "rb") as source:
+            content = source.read()
+        digest.update(len(content).to_bytes(8, "little"))
+        digest.update(content)
+    return digest.hexdigest()
+
+
+def save_arrays(path, **arrays):
+    # Se escribe a un archivo temporal y se renombra, para que otro proceso nunca lea un archivo a medias.
+    # mkstemp da un nombre único por llamada, así que dos hilos del mismo proceso tampoco comparten el temporal.
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as output:
+            np.savez(output, **arrays)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+class CompiledMap:
+    """
+    Mapa compilado: capa de celdas, aristas del grafo y destinos.
+
+    Args:
+        path (str): Archivo .npz del mapa compilado.
+        tiles (TileLayer): Capa de celdas.
+        sources (np.ndarray): Celda de origen de cada arista (índice plano x * height + y).
+        targets (np.ndarray): Celda de destino de cada arista.
+        weights (np.ndarray): Peso de cada arista.
+        destinations (list): Posiciones de los destinos, en el orden del mapa.
+    """
+
+    def __init__(self, path, tiles, sources, targets, weights, destinations):
+        self.path = path
+        self.tiles = tiles
+        self.sources = sources
+        self.targets = targets
+        self.weights = weights
+        self.destinations = destinations
+
+    def table_path(self, row):
+        return self.path[:-len(".npz")] + f".table_{row}.npz"
+
+    @classmethod
+    def load(cls, path):
+        """
+        Carga un mapa compilado.
+
+        Args:
+            path (str): Archivo .npz.
+
+        Returns:
+            CompiledMap: Mapa compilado.
+        """
+        with np.load(path) as data:
+            tiles = TileLayer.from_arrays(*(data[name] for name in TILE_ARRAYS))
+            destinations = [tuple(position) for position in data["destinations"].tolist()]
+            return cls(path, tiles, data["sources"], data["targets"], data["weights"], destinations)
+
+    def save(self):
+        save_arrays(self.path, sources=self.sources, targets=self.targets, weights=self.weights,
+                    destinations=np.array(self.destinations, dtype=np.int32).reshape(-1, 2),
+                    **{name: getattr(self.tiles, name) for name in TILE_ARRAYS})
+
+    def load_table(self, row):
+        """
+        Carga la tabla de siguiente salto de un destino, si ya se guardó.
+
+        Args:
+            row (int): Posición del destino en self.destinations.
+
+        Returns:
+            np.ndarray: Tabla del destino, o None si no está guardada.
+        """
+        path = self.table_path(row)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return data["next_hop"]
+
+    def save_table(self, row, table):
+        """
+        Guarda la tabla de siguiente salto de un destino.
+
+        Args:
+            row (int): Posición del destino en self.destinations.
+            table (np.ndarray): Tabla, como un renglón de Router.next_hop.
+        """
+        save_arrays(self.table_path(row), next_hop=table)
+
+
+def compile_map(city_path, dictionary_path, cache_dir=MAP_CACHE_DIR):
+    """
+    Compila un mapa y lo guarda en el caché.
+
+    Args:
+        city_path (str): Archivo del mapa.
+        dictionary_path (str): Diccionario del mapa.
+        cache_dir (str): Carpeta del caché.
+
+    Returns:
+        CompiledMap: Mapa compilado.
+    """
+    with open(city_path) as city_file:
+        lines = city_file.readlines()
+    with open(dictionary_path) as dictionary_file:
+        map_data = json.load(dictionary_file)
+    tiles = TileLayer(lines, map_data)
+
+    # Los semáforos "s" empiezan en verde, igual que en CityModel.create_agent
+    light_states = np.zeros(int((tiles.light_index >= 0).sum()), dtype=bool)
+    light_states[tiles.light_index[tiles.light_index >= 0]] = tiles.symbols[tiles.light_index >= 0] == "s"
+    sources, targets, weights = tiles.edges(map_data, light_states)
+
+    # Los destinos en el orden en que el modelo los crea: por renglón del archivo, de arriba a abajo
+    xs, ys = np.nonzero(tiles.kind == DESTINATION)
+    order = np.lexsort((xs, -ys))
+    destinations = list(zip(xs[order].tolist(), ys[order].tolist()))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, map_key(city_path, dictionary_path) + ".npz")
+    compiled = CompiledMap(path, tiles, sources, targets, weights, destinations)
+    compiled.save()
+    return compiled
+
+
+def load_map(city_path, dictionary_path, cache_dir=MAP_CACHE_DIR):
+    """
+    Carga un mapa del caché, compilándolo primero si su llave no está.
+
+    Args:
+        city_path (str): Archivo del mapa.
+        dictionary_path (str): Diccionario del mapa.
+        cache_dir (str): Carpeta del caché.
+
+    Returns:
+        CompiledMap: Mapa compilado.
+    """
+    path = os.path.join(cache_dir, map_key(city_path, dictionary_path) + ".npz")
+    if os.path.exists(path):
+        return CompiledMap.load(path)
+    return compile_map(city_path, dictionary_path, cache_dir)
+
+
+def main(argv=None):
+    from .model import CITY_FILES_DIR, CityModel, resolve_city_file
+
+    parser = argparse.ArgumentParser(description="Compila mapas al caché de mapas.")
+    parser.add_argument("maps", nargs="+", help="Archivos de mapa (ruta o nombre dentro de city_files).")
+    parser.add_argument("--cache-dir", default=MAP_CACHE_DIR, help="Carpeta del caché.")
+    parser.add_argument("--no-tables", action="store_true",
+                        help="No construye las tablas de siguiente salto (cada modelo construye las que usa).")
+    args = parser.parse_args(argv)
+
+    dictionary_path = os.path.join(CITY_FILES_DIR, "mapDictionary.json")
+    for city_file in args.maps:
+        city_path = resolve_city_file(city_file)
+        compiled = compile_map(city_path, dictionary_path, args.cache_dir)
+        if not args.no_tables:
+            # El Router guarda cada tabla junto al mapa compilado al construirla
+            CityModel(city_file=city_path, verbose=False, map_cache_dir=args.cache_dir).router.build_tables()
+        print(f"{city_file} -> {compiled.path}")
+
+
+if __name__ == "__main__":
+    main()
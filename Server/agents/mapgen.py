@@ -0,0 +1,213 @@
+"""
+Generador de mapas de ciudad sintéticos para pruebas de escala.
+
+Produce archivos con el mismo alfabeto que los mapas base (v ^ < > L Q A F
+S s # D): una cuadrícula de calles de dos carriles en un solo sentido, con
+un anillo en el perímetro, sentidos alternados en las calles interiores,
+cruces que permiten seguir o dar vuelta, semáforos antes de los cruces y
+destinos en las orillas de las manzanas.
+
+El número de destinos crece con el perímetro del mapa y no con su área
+(a lo más uno por calle), porque el Router construye una tabla de
+siguiente salto del tamaño del mapa por cada destino.
+
+Uso:
+    python -m agents.mapgen --width 500 --height 500 --seed 1 --output city_files/grid_500.txt
+"""
+
+import argparse
+import random
+import numpy as np
+
+# Carácter de cada cruce según (sentido de la calle vertical, sentido de la calle horizontal)
+CROSSINGS = {
+    ("Down", "Left"): "A",
+    ("Down", "Right"): "F",
+    ("Up", "Right"): "L",
+    ("Up", "Left"): "Q"
+}
+LANES = {"Down": "v", "Up": "^", "Left": "<", "Right": ">"}
+PLAIN_ROADS = "v^<>"
+
+
+def street_positions(length, block_size):
+    """
+    Reparte las calles a lo largo de un eje. La primera calle queda en la
+    orilla 0 y la última en la orilla opuesta, de modo que forman el anillo
+    del perímetro.
+
+    Args:
+        length (int): Largo del eje en celdas.
+        block_size (int): Ancho deseado de las manzanas.
+
+    Returns:
+        list: Coordenada del primer carril de cada calle.
+    """
+    pitch = block_size + 2
+    count = max(2, round((length - 2) / pitch) + 1)
+    return sorted({int(round(p)) for p in np.linspace(0, length - 2, count)})
+
+
+def street_directions(count, first, last, alternate):
+    """
+    Asigna el sentido de cada calle: las de los extremos forman el anillo y
+    las interiores se alternan.
+
+    Args:
+        count (int): Número de calles.
+        first (str): Sentido de la primera calle.
+        last (str): Sentido de la última calle.
+        alternate (tuple): Par de sentidos que se alternan en las calles interiores.
+
+    Returns:
+        list: Sentido de cada calle.
+    """
+    directions = [alternate[i % 2] for i in range(count)]
+    directions[0] = first
+    directions[-1] = last
+    return directions
+
+
+def generate_city(width, height, block_size=6, light_probability=0.5, destination_probability=0.3,
+                  max_destinations=None, seed=None):
+    """
+    Genera un mapa de ciudad en forma de cuadrícula.
+
+    Args:
+        width (int): Ancho del mapa en celdas.
+        height (int): Alto del mapa en celdas.
+        block_size (int): Ancho aproximado de las manzanas (mínimo 3).
+        light_probability (float): Probabilidad de poner semáforos en cada cruce.
+        destination_probability (float): Probabilidad de poner un destino en cada manzana.
+        max_destinations (int): Número máximo de destinos. Si es None, uno
+            por calle (la suma de calles verticales y horizontales).
+        seed (int): Semilla del generador aleatorio.
+
+    Returns:
+        list: Renglones del mapa, de arriba hacia abajo, terminados en salto de línea.
+    """
+    if block_size < 3:
+        raise ValueError("Las manzanas deben medir al menos 3 celdas.")
+    if width < block_size + 4 or height < block_size + 4:
+        raise ValueError("El mapa es demasiado pequeño para el tamaño de manzana.")
+
+    rng = random.Random(seed)
+    cells = np.full((width, height), "#", dtype="<U1")
+
+    xs = street_positions(width, block_size)
+    ys = street_positions(height, block_size)
+    # Anillo en sentido contrario a las manecillas: baja por la izquierda, va a
+    # la derecha por abajo, sube por la derecha y va a la izquierda por arriba.
+    vertical = street_directions(len(xs), "Down", "Up", ("Down", "Up"))
+    horizontal = street_directions(len(ys), "Right", "Left", ("Right", "Left"))
+
+    for y, direction in zip(ys, horizontal):
+        cells[:, y:y + 2] = LANES[direction]
+    for x, direction in zip(xs, vertical):
+        cells[x:x + 2, :] = LANES[direction]
+    for x, v_direction in zip(xs, vertical):
+        for y, h_direction in zip(ys, horizontal):
+            cells[x:x + 2, y:y + 2] = CROSSINGS[(v_direction, h_direction)]
+
+    # Semáforos en la última celda antes de cada cruce: "S" en la calle
+    # vertical y "s" en la horizontal, para que empiecen en fases opuestas.
+    for x, v_direction in zip(xs, vertical):
+        for y, h_direction in zip(ys, horizontal):
+            if rng.random() >= light_probability:
+                continue
+            light_y = y + 2 if v_direction == "Down" else y - 1
+            light_x = x + 2 if h_direction == "Left" else x - 1
+            place_lights(cells, [(x, light_y), (x + 1, light_y)], "S")
+            place_lights(cells, [(light_x, y), (light_x, y + 1)], "s")
+
+    # Destinos en la orilla de las manzanas, junto a un carril normal. Si
+    # salen más manzanas que el máximo, se eligen al azar entre ellas.
+    if max_destinations is None:
+        max_destinations = len(xs) + len(ys)
+    blocks = [(left, right, bottom, top)
+              for left, right in zip(xs, xs[1:])
+              for bottom, top in zip(ys, ys[1:])
+              if rng.random() < destination_probability]
+    if len(blocks) > max_destinations:
+        blocks = sorted(rng.sample(blocks, max_destinations))
+    for left, right, bottom, top in blocks:
+        place_destination(cells, rng, left + 2, right - 1, bottom + 2, top - 1)
+
+    if not (cells == "D").any():
+        place_destination(cells, rng, xs[0] + 2, xs[1] - 1, ys[0] + 2, ys[1] - 1)
+
+    return ["".join(cells[:, y]) + "\n" for y in range(height - 1, -1, -1)]
+
+
+def place_lights(cells, positions, symbol):
+    """
+    Pone semáforos en las posiciones dadas si todas son carriles normales.
+
+    Args:
+        cells (np.ndarray): Mapa en construcción.
+        positions (list): Posiciones de los semáforos.
+        symbol (str): "S" o "s".
+    """
+    width, height = cells.shape
+    if all(0 <= x < width and 0 <= y < height and cells[x, y] in PLAIN_ROADS for x, y in positions):
+        for x, y in positions:
+            cells[x, y] = symbol
+
+
+def place_destination(cells, rng, x0, x1, y0, y1):
+    """
+    Pone un destino en una celda de la orilla de la manzana [x0, x1) x [y0, y1)
+    que tenga al lado un carril normal.
+
+    Args:
+        cells (np.ndarray): Mapa en construcción.
+        rng (random.Random): Generador aleatorio.
+        x0 (int): Primera columna de la manzana.
+        x1 (int): Columna siguiente a la última.
+        y0 (int): Primera fila de la manzana.
+        y1 (int): Fila siguiente a la última.
+    """
+    width, height = cells.shape
+    border = [(x, y) for x in range(x0, x1) for y in range(y0, y1)
+              if x in (x0, x1 - 1) or y in (y0, y1 - 1)]
+    rng.shuffle(border)
+    for x, y in border:
+        for dx, dy in ((0, 1), (0, -1), (1, 0), (-1, 0)):
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < width and 0 <= ny < height and cells[nx, ny] in PLAIN_ROADS:
+                cells[x, y] = "D"
+                return
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Genera un mapa de ciudad sintético.")
+    parser.add_argument("--width", type=int, required=True,
+                        help="Ancho del mapa.")
+    parser.add_argument("--height", type=int, required=True,
+                        help="Alto del mapa.")
+    parser.add_argument("--block-size", type=int, default=6,
+                        help="Ancho aproximado de las manzanas.")
+    parser.add_argument("--light-probability", type=float, default=0.5,
+                        help="Probabilidad de poner semáforos en cada cruce.")
+    parser.add_argument("--destination-probability", type=float, default=0.3,
+                        help="Probabilidad de poner un destino en cada manzana.")
+    parser.add_argument("--max-destinations", type=int, default=None,
+                        help="Número máximo de destinos. Por defecto, uno por calle.")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Semilla del generador aleatorio.")
+    parser.add_argument("--output", required=True,
+                        help="Archivo de salida.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    lines = generate_city(args.width, args.height, args.block_size, args.light_probability,
+                          args.destination_probability, args.max_destinations, args.seed)
+    with open(args.output, "w") as output:
+        output.writelines(lines)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,16 @@
 from mesa import Model
-from mesa.time import RandomActivation
 from mesa.space import MultiGrid
 from .agent import *
+from .congestion import CongestionMonitor
+from .lights import LightScheduler
+from .mapcache import MAP_CACHE_DIR, load_map
+from .routing import LightPhases, Router
+from .scheduler import ActivityScheduler
+from .tiles import TileLayer, ROAD, TRAFFIC_LIGHT, DESTINATION
+from .vector import VectorCarEngine
+import numpy as np
+import copy
+from collections import OrderedDict
 import json
 import random
 import requests
@@ -9,36 +18,121 @@ import os
 import networkx as nx
 import matplotlib.pyplot as plt
 
+CITY_FILES_DIR = os.path.join(os.path.dirname(__file__), '../city_files')
+
+# Atributo "type" de los nodos del grafo según el tipo de celda
+NODE_TYPES = {ROAD: 'road', TRAFFIC_LIGHT: 'traffic_light', DESTINATION: 'destination'}
+
+# Atributos de Car que cambian durante la simulación y se guardan en snapshot()
+CAR_STATE = ("destination", "spawn_step", "origin", "direction", "path", "stopped",
+             "time_since_lane_change", "lane_change_cooldown", "just_arrived")
+
+# Número máximo de coches que se guardan para reutilizarlos. Un coche guardado ya salió del calendario y
+# del grid, y Mesa 2.1.5 no lleva otro registro de agentes, así que solo queda en CityModel.car_pool.
+CAR_POOL_SIZE = 256
+
+
+def resolve_city_file(city_file):
+    """
+    Obtiene la ruta de un archivo de mapa.
+
+    Args:
+        city_file (str): Ruta al archivo, o nombre de un archivo dentro de city_files.
+
+    Returns:
+        str: Ruta al archivo del mapa.
+    """
+    if os.path.exists(city_file):
+        return city_file
+    return os.path.join(CITY_FILES_DIR, city_file)
+
 
 class CityModel(Model):
     """ 
     Crea un modelo basado en un mapa de ciudad.
 
     Args:
-        N: Número de agentes en la simulación
+        routing (str): Modo de ruteo de los coches, "table" (tablas de
+            siguiente salto por destino, o "astar" si el mapa es demasiado
+            grande para ellas; ver Router), "astar" (A* con caché LRU) o
+            "timed" (A* que considera la espera en los semáforos en rojo).
+        path_cache_size (int): Tamaño máximo del caché de caminos de A* (ver
+            Router). None para el tamaño por omisión del modo de ruteo.
+        backend (str): Motor de los coches, "agents" (un agente Car por
+            coche) o "vector" (todos los coches en arreglos de NumPy).
+        city_file (str): Archivo del mapa, ya sea una ruta o un nombre dentro de city_files.
+        spawn_interval (int): Cada cuántos pasos se agregan coches en las esquinas.
+        verbose (bool): Si es False, step() no imprime el estado de la simulación.
+        seed (int): Semilla del generador aleatorio del modelo (la usa Mesa).
+        light_timings (dict): Tiempos de cambio que reemplazan a los del
+            diccionario del mapa, por ejemplo {"S": 5, "s": 9}.
+        lane_change_cooldown (int): Pasos mínimos entre dos cambios de carril de un coche.
+        congestion_threshold (float): Si se da, las rutas de los coches se
+            reparan cuando la congestión de un corredor que cruzan cambia al
+            menos este valor (entre 0 y 1). Solo con el motor "agents".
+        map_cache_dir (str): Carpeta del caché de mapas compilados. El mapa y
+            sus tablas de ruteo se cargan de ahí si ya se compilaron con el
+            mismo contenido. None para no usar el caché.
+        static_agents (bool): Si es False, las carreteras, obstáculos y
+            destinos solo existen en la capa de celdas (self.tiles): no se
+            crea un agente ni se ocupa el grid por cada una de esas celdas, y
+            solo los coches y los semáforos son agentes.
     """
 
-    def __init__(self):
+    BACKENDS = ("agents", "vector")
 
-        dir_path = os.path.dirname(__file__)
+    def __init__(self, routing="table", path_cache_size=None, backend="agents",
+                 city_file="2023_base.txt", spawn_interval=1, verbose=True, seed=None,
+                 light_timings=None, lane_change_cooldown=4, congestion_threshold=None,
+                 map_cache_dir=MAP_CACHE_DIR, static_agents=True):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Motor de coches desconocido: {backend}")
+        if backend == "vector" and routing != "table":
+            raise ValueError("El motor vectorizado necesita routing='table'.")
+        if backend == "vector" and congestion_threshold is not None:
+            raise ValueError("El reruteo por congestión necesita backend='agents'.")
 
         map_dictionary_path = os.path.join(
-            dir_path, '../city_files/mapDictionary.json')
-        city_base_path = os.path.join(dir_path, '../city_files/2023_base.txt')
+            CITY_FILES_DIR, 'mapDictionary.json')
+        city_base_path = resolve_city_file(city_file)
 
         # Cargar el diccionario del mapa. El diccionario mapea los caracteres en el archivo del mapa con el agente correspondiente.
         self.map_data = json.load(open(map_dictionary_path))
+        if light_timings:
+            self.map_data.update(light_timings)
+        self.compiled_map = load_map(city_base_path, map_dictionary_path,
+                                     map_cache_dir) if map_cache_dir else None
         self.traffic_lights = []
         self.destinations = []
         self.step_count = 0
         self.city_graph = nx.DiGraph()
         self.car_counter = 0
+        self.next_car_number = 0
+        # Coches que ya llegaron a su destino, para reutilizarlos en new_car
+        self.car_pool = []
         self.carsInDestination = 0
+        self.backend = backend
+        self.spawn_interval = spawn_interval
+        self.lane_change_cooldown = lane_change_cooldown
+        self.verbose = verbose
+        self.static_agents = static_agents
         self.load_city_map(city_base_path)
-        self.add_cars()
+        # Los semáforos no están en el calendario: cambian según self.light_scheduler
+        self.light_scheduler = LightScheduler(self.traffic_lights)
+        self.engine = VectorCarEngine(
+            self, lane_change_cooldown) if backend == "vector" else None
+        self.create_city_graph()
+        self.router = Router(self.city_graph, self.width, self.height,
+                             self.destinations, routing, path_cache_size,
+                             LightPhases(self) if routing == "timed" else None, self.compiled_map)
+        if backend == "vector" and self.router.mode != "table":
+            raise ValueError("El mapa tiene demasiados destinos y celdas para las tablas que necesita el motor vectorizado.")
+        self.congestion = CongestionMonitor(
+            self, congestion_threshold) if congestion_threshold is not None else None
+        self.reachable_destinations = {}
 
         self.running = True
-        self.create_city_graph()
+        self.add_cars()
 
     def load_city_map(self, city_base_path):
         """
@@ -53,12 +147,43 @@ class CityModel(Model):
             self.height = len(lines)
 
             self.grid = MultiGrid(self.width, self.height, torus=False)
-            self.schedule = RandomActivation(self)
-
+            self.schedule = ActivityScheduler(self)
+            self.tiles = self.compiled_map.tiles if self.compiled_map is not None else TileLayer(
+                lines, self.map_data)
+            # Mapa de ocupación de coches. Solo cambia en place_car, move_car y remove_car.
+            self.occupancy = np.zeros((self.width, self.height), dtype=bool)
+
+            if not self.static_agents:
+                self.load_tile_table()
+                return
             for r, row in enumerate(lines):
                 for c, col in enumerate(row):
                     self.create_agent(r, c, col)
 
+    def load_tile_table(self):
+        """
+        Crea los nodos del grafo, los semáforos y la lista de destinos a partir
+        de la capa de celdas, sin crear agentes para las celdas estáticas. Todo
+        queda en el mismo orden que al recorrer el mapa con create_agent.
+        """
+        xs, ys = np.nonzero(self.tiles.walkable)
+        # Por renglón del archivo (de arriba a abajo) y luego por columna
+        order = np.lexsort((xs, -ys))
+        xs, ys = xs[order].tolist(), ys[order].tolist()
+        kinds = self.tiles.kind[xs, ys].tolist()
+        self.city_graph.add_nodes_from(((x, y), {'type': NODE_TYPES[kind]})
+                                       for x, y, kind in zip(xs, ys, kinds))
+
+        for x, y, kind in zip(xs, ys, kinds):
+            if kind == TRAFFIC_LIGHT:
+                symbol = self.tiles.symbols[x, y]
+                traffic_light_agent = Traffic_Light(
+                    f"tl_{(self.height - y - 1) * self.width + x}", self, symbol == "s", int(self.map_data[symbol]))
+                self.grid.place_agent(traffic_light_agent, (x, y))
+                self.traffic_lights.append(traffic_light_agent)
+            elif kind == DESTINATION:
+                self.destinations.append((x, y))
+
     def create_agent(self, r, c, col):
         """
         Crea un agente según el carácter en la posición dada del mapa.
@@ -79,7 +204,6 @@ class CityModel(Model):
                 f"tl_{r*self.width+c}", self, False if col == "S" else True, int(self.map_data[col]))
             self.grid.place_agent(traffic_light_agent,
                                   (c, self.height - r - 1))
-            self.schedule.add(traffic_light_agent)
             self.traffic_lights.append(traffic_light_agent)
             self.city_graph.add_node(
                 (c, self.height - r - 1), type='traffic_light')
@@ -112,16 +236,116 @@ class CityModel(Model):
             # Check if the position is available
             if self.is_position_available(x, y):
                 # Once a position is available, add the car
-                destination = random.choice(self.destinations)
-                road_direction = self.get_road_direction(x, y)
-                car_agent = Car(
-                    f"car_{self.step_count}_{x}_{y}", self, destination)
-                car_agent.direction = road_direction
-                self.grid.place_agent(car_agent, (x, y))
-                self.schedule.add(car_agent)
+                destinations = self.get_reachable_destinations(x, y)
+                if destinations:
+                    destination = self.random.choice(destinations)
+                    self.add_car((x, y), destination)
+
+    def get_reachable_destinations(self, x, y):
+        """
+        Obtiene los destinos a los que se puede llegar desde una posición. El
+        resultado se guarda, porque la conectividad del grafo no cambia.
+
+        Args:
+            x (int): Coordenada x.
+            y (int): Coordenada y.
+
+        Returns:
+            list: Destinos alcanzables, en el mismo orden que self.destinations.
+        """
+        if (x, y) not in self.reachable_destinations:
+            # Una sola búsqueda desde la posición, sin construir las tablas de ruteo de todos los destinos
+            reachable = nx.descendants(self.city_graph, (x, y)) if (x, y) in self.city_graph else set()
+            self.reachable_destinations[(x, y)] = [
+                destination for destination in self.destinations if destination in reachable
+            ]
+        return self.reachable_destinations[(x, y)]
+
+    def add_car(self, pos, destination):
+        """
+        Agrega un coche en la posición dada con el destino dado.
+
+        Args:
+            pos (tuple): Posición inicial del coche. Debe estar disponible.
+            destination (tuple): Destino del coche.
+        """
+        x, y = pos
+        road_direction = self.get_road_direction(x, y)
+        # Número entero del coche para los cuadros binarios
+        number = self.next_car_number
+        self.next_car_number += 1
+        if self.engine is not None:
+            self.engine.spawn(pos, destination, road_direction, number)
+        else:
+            car_agent = self.new_car(number, destination)
+            car_agent.spawn_step = self.step_count
+            car_agent.origin = pos
+            car_agent.direction = road_direction
+            car_agent.lane_change_cooldown = self.lane_change_cooldown
+            self.place_car(car_agent, pos)
+            self.schedule.add(car_agent)
+
+        # Incrementar el contador de carros
+        self.car_counter += 1
+
+    def new_car(self, unique_id, destination):
+        """
+        Obtiene un coche sin colocar, reutilizando uno que ya llegó a su
+        destino si hay alguno guardado.
+
+        Args:
+            unique_id (int): Número del coche.
+            destination (tuple): Destino del coche.
+
+        Returns:
+            Car: Coche inicializado.
+        """
+        if self.car_pool:
+            car = self.car_pool.pop()
+            car.reset(unique_id, destination)
+            return car
+        return Car(unique_id, self, destination)
+
+    def iter_cars(self):
+        """
+        Recorre los coches del modelo sin importar el motor que se use.
 
-                # Incrementar el contador de carros
-                self.car_counter += 1
+        Returns:
+            list: Tuplas (id, posición, destino) de cada coche.
+        """
+        if self.engine is not None:
+            return self.engine.positions()
+        return [(agent.name, agent.pos, agent.destination)
+                for agent in self.schedule.agents if isinstance(agent, Car)]
+
+    def car_arrays(self):
+        """
+        Obtiene el estado de todos los coches en arreglos, sin importar el
+        motor que se use.
+
+        Returns:
+            tuple: Identificadores numéricos (n,), posiciones (n, 2) y destinos (n, 2).
+        """
+        if self.engine is not None:
+            return self.engine.car_arrays()
+        cars = [agent for agent in self.schedule.agents if isinstance(agent, Car)]
+        return (np.array([car.number for car in cars], dtype=np.int64),
+                np.array([car.pos for car in cars], dtype=np.int64).reshape(-1, 2),
+                np.array([car.destination for car in cars], dtype=np.int64).reshape(-1, 2))
+
+    def car_spawns(self):
+        """
+        Obtiene el paso y la posición en que apareció cada coche, con los que
+        se arma su id de texto, en el mismo orden que car_arrays().
+
+        Returns:
+            tuple: Pasos de aparición (n,) y posiciones de origen (n, 2).
+        """
+        if self.engine is not None:
+            return self.engine.car_spawns()
+        cars = [agent for agent in self.schedule.agents if isinstance(agent, Car)]
+        return (np.array([car.spawn_step for car in cars], dtype=np.int64),
+                np.array([car.origin for car in cars], dtype=np.int64).reshape(-1, 2))
 
     def get_road_direction(self, x, y):
         """
@@ -134,11 +358,11 @@ class CityModel(Model):
         Returns:
             str: Dirección del camino ('Up', 'Down', 'Left', 'Right').
         """
-        possible_roads = self.grid.get_neighbors(
-            (x, y), moore=True, include_center=True, radius=1)
-        for road in possible_roads:
-            if isinstance(road, Road):
-                return road.direction
+        # Se revisan los vecinos en el mismo orden que MultiGrid.get_neighbors
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                if self.tiles.kind_at(x + dx, y + dy) == ROAD:
+                    return self.map_data[self.tiles.symbols[x + dx, y + dy]]
 
         return "Undefined"
 
@@ -153,143 +377,114 @@ class CityModel(Model):
         Returns:
             bool: True si la posición está disponible, False de lo contrario.
         """
-        return self.validPosition(x, y) and not any(isinstance(agent, Car) for agent in self.grid.get_cell_list_contents((x, y)))
+        return self.validPosition(x, y) and not self.occupancy[x, y]
 
-    def validPosition(self, x, y):
+    def is_occupied(self, x, y):
         """
-        Verifica si la posición dada en el mapa es válida.
+        Verifica si hay un coche en la posición dada.
 
         Args:
             x (int): Coordenada x.
             y (int): Coordenada y.
 
         Returns:
-            bool: True si la posición es válida, False de lo contrario.
+            bool: True si hay un coche en la posición, False de lo contrario.
         """
-        return 0 <= x < self.width and 0 <= y < self.height and (
-            any(isinstance(agent, (Road, Traffic_Light, Destination))
-                for agent in self.grid.get_cell_list_contents((x, y)))
-        )
+        return 0 <= x < self.width and 0 <= y < self.height and bool(self.occupancy[x, y])
 
-    def add_traffic_light_edges(self, x, y, directions):
+    def count_cars_around(self, x, y, radius=1):
         """
-        Agrega bordes al grafo de la ciudad para los semáforos en la posición dada.
+        Cuenta los coches en la vecindad de Moore de una posición, incluyendo el centro.
 
         Args:
-            x (int): Coordenada x del semáforo.
-            y (int): Coordenada y del semáforo.
-            directions (dict): Direcciones permitidas desde el semáforo.
-        """
-        for direction_name, (dx, dy) in directions.items():
-            adjacent_x, adjacent_y = x + dx, y + dy
-            if self.validPosition(adjacent_x, adjacent_y) and any(isinstance(agent, Road) for agent in self.grid.get_cell_list_contents((adjacent_x, adjacent_y))):
-                adjacent_agents = self.grid.get_cell_list_contents(
-                    (adjacent_x, adjacent_y))
-                road_agent = next(
-                    (agent for agent in adjacent_agents if isinstance(agent, Road)), None)
-                if road_agent:
-                    if self.aligning_directions(road_agent, x, y, adjacent_x, adjacent_y):
-                        self.city_graph.add_edge((adjacent_x, adjacent_y), (x, y), weight=self.calculate_edge_weight(
-                            adjacent_x, adjacent_y, x, y))
-                    else:
-                        self.city_graph.add_edge((x, y), (adjacent_x, adjacent_y), weight=self.calculate_edge_weight(
-                            x, y, adjacent_x, adjacent_y))
-
-    def aligning_directions(self, road_agent, tl_x, tl_y, road_x, road_y):
-        """
-        Verifica si el semáforo y la carretera están alineados en la misma dirección.
+            x (int): Coordenada x.
+            y (int): Coordenada y.
+            radius (int): Radio de la vecindad.
 
-        Args:
-            road_agent: Agente de la carretera.
-            tl_x (int): Coordenada x del semáforo.
-            tl_y (int): Coordenada y del semáforo.
-            road_x (int): Coordenada x de la carretera.
-            road_y (int): Coordenada y de la carretera.
+        Returns:
+            int: Número de coches en la vecindad.
+        """
+        return int(self.occupancy[max(x - radius, 0):x + radius + 1,
+                                  max(y - radius, 0):y + radius + 1].sum())
+
+    def car_density(self):
+        """
+        Calcula la fracción de celdas transitables ocupadas por coches.
 
         Returns:
-            bool: True si están alineados, False de lo contrario.
-        """
-        if road_agent.direction == "Up" and road_y < tl_y:
-            return True
-        if road_agent.direction == "Down" and road_y > tl_y:
-            return True
-        if road_agent.direction == "Left" and road_x > tl_x:
-            return True
-        if road_agent.direction == "Right" and road_x < tl_x:
-            return True
-        return False
-
-    def calculate_edge_weight(self, x, y, nx, ny):
-        base_weight = 1
-        next_agents = self.grid.get_cell_list_contents((nx, ny))
-        if any(isinstance(agent, Traffic_Light) and agent.state for agent in next_agents):
-            return base_weight * 5
-        return base_weight
+            float: Densidad de coches en el mapa.
+        """
+        return float(self.occupancy.sum()) / max(int(self.tiles.walkable.sum()), 1)
 
-    def create_city_graph(self):
+    def place_car(self, car, pos):
         """
-        Crea el grafo de la ciudad con nodos y bordes.
+        Coloca un coche en el grid y marca la celda como ocupada.
+
+        Args:
+            car (Car): Coche a colocar.
+            pos (tuple): Posición del coche.
         """
-        directions = {'Up': (0, 1), 'Down': (
-            0, -1), 'Left': (-1, 0), 'Right': (1, 0)}
-        diagonal_directions = {
-            'Right': [('Right', 'Up'), ('Right', 'Down')],
-            'Up': [('Up', 'Right'), ('Up', 'Left')],
-            'Left': [('Left', 'Up'), ('Left', 'Down')],
-            'Down': [('Down', 'Right'), ('Down', 'Left')]
-        }
+        self.grid.place_agent(car, pos)
+        self.occupancy[pos] = True
+        self.schedule.cell_entered(pos)
 
-        for x in range(self.width):
-            for y in range(self.height):
-                agents = self.grid.get_cell_list_contents((x, y))
-                if any(isinstance(agent, Destination) for agent in agents):
-                    self.destination_edges(x, y, directions)
-                elif any(isinstance(agent, Road) for agent in agents):
-                    road_agent = next(
-                        (agent for agent in agents if isinstance(agent, Road)), None)
-                    if road_agent:
-                        self.road_edges(x, y, road_agent,
-                                        directions, diagonal_directions)
-                elif any(isinstance(agent, Traffic_Light) for agent in agents):
-                    self.add_traffic_light_edges(x, y, directions)
+    def move_car(self, car, pos):
+        """
+        Mueve un coche en el grid y actualiza el mapa de ocupación.
 
-    def destination_edges(self, x, y, directions):
+        Args:
+            car (Car): Coche a mover.
+            pos (tuple): Nueva posición del coche.
         """
-        Agrega bordes al grafo de la ciudad para las destinos en la posición dada.
+        old_pos = car.pos
+        self.occupancy[old_pos] = False
+        self.grid.move_agent(car, pos)
+        self.occupancy[pos] = True
+        self.schedule.cell_vacated(old_pos)
+        self.schedule.cell_entered(pos)
+
+    def validPosition(self, x, y):
+        """
+        Verifica si la posición dada en el mapa es válida.
 
         Args:
-            x (int): Coordenada x del destino.
-            y (int): Coordenada y del destino.
-            directions (dict): Direcciones permitidas desde el destino.
-        """
-        for direction in directions.values():
-            dx, dy = direction
-            nx, ny = x + dx, y + dy
-            if self.validPosition(nx, ny) and any(isinstance(agent, Road) for agent in self.grid.get_cell_list_contents((nx, ny))):
-                weight = self.calculate_edge_weight(x, y, nx, ny)
-                self.city_graph.add_edge((nx, ny), (x, y), weight=weight)
-
-    def road_edges(self, x, y, road_agent, directions, diagonal_directions):
-        road_directions = road_agent.direction if isinstance(
-            road_agent.direction, list) else [road_agent.direction]
-        for direction in road_directions:
-            dx, dy = directions[direction]
-            nx, ny = x + dx, y + dy
-            if self.validPosition(nx, ny) and not any(isinstance(agent, Traffic_Light) for agent in self.grid.get_cell_list_contents((nx, ny))):
-                weight = self.calculate_edge_weight(x, y, nx, ny)
-                self.city_graph.add_edge((x, y), (nx, ny), weight=weight)
-                if direction in diagonal_directions:
-                    for diag in diagonal_directions[direction]:
-                        ddx, ddy = (directions[diag[0]][0] + directions[diag[1]]
-                                    [0], directions[diag[0]][1] + directions[diag[1]][1])
-                        nnx, nny = x + ddx, y + ddy
-                        if self.validPosition(nnx, nny) and not any(isinstance(agent, Traffic_Light) for agent in self.grid.get_cell_list_contents((nnx, nny))):
-                            self.city_graph.add_edge(
-                                (x, y), (nnx, nny), weight=weight * 2)
+            x (int): Coordenada x.
+            y (int): Coordenada y.
+
+        Returns:
+            bool: True si la posición es válida, False de lo contrario.
+        """
+        return self.tiles.is_walkable(x, y)
+
+    def create_city_graph(self):
+        """
+        Crea el grafo de la ciudad con nodos y bordes. Los bordes se calculan
+        sobre los arreglos de la capa de celdas, o se leen del mapa compilado,
+        y se cargan de una vez.
+        """
+        if self.compiled_map is not None:
+            compiled = self.compiled_map
+            sources, targets, weights = compiled.sources, compiled.targets, compiled.weights
+        else:
+            sources, targets, weights = self.tiles.edges(
+                self.map_data, [light.state for light in self.traffic_lights])
+        source_x, source_y = np.divmod(sources, self.height)
+        target_x, target_y = np.divmod(targets, self.height)
+        self.city_graph.add_edges_from(
+            ((x, y), (nx, ny), {'weight': weight})
+            for x, y, nx, ny, weight in zip(source_x.tolist(), source_y.tolist(),
+                                            target_x.tolist(), target_y.tolist(), weights.tolist()))
 
     def remove_car(self, car):
+        if self.congestion is not None:
+            self.congestion.forget(car)
+        pos = car.pos
+        self.occupancy[pos] = False
         self.schedule.remove(car)
         self.grid.remove_agent(car)
+        self.schedule.cell_vacated(pos)
+        if len(self.car_pool) < CAR_POOL_SIZE:
+            self.car_pool.append(car)
 
         # Decrementar el contador de carros
         self.car_counter -= 1
@@ -313,15 +508,163 @@ class CityModel(Model):
             return base_weight * 10
         return base_weight
 
+    def snapshot(self):
+        """
+        Guarda el estado dinámico del modelo: coches (posición, ruta y tiempo
+        de espera para cambiar de carril), semáforos, contadores, ocupación,
+        congestión medida y estado de los generadores aleatorios. El mapa, el
+        grafo, el Router y los agentes estáticos no se copian.
+
+        Returns:
+            dict: Estado que se puede pasar a restore() o a fork(), o guardar con pickle.
+        """
+        cars = [agent for agent in self.schedule.agents if isinstance(agent, Car)]
+        return {
+            "step_count": self.step_count,
+            "car_counter": self.car_counter,
+            "next_car_number": self.next_car_number,
+            "carsInDestination": self.carsInDestination,
+            "schedule_steps": self.schedule.steps,
+            "schedule_time": self.schedule.time,
+            "random_state": self.random.getstate(),
+            "occupancy": self.occupancy.copy(),
+            "lights": [(light.state, light.timeToChange) for light in self.traffic_lights],
+            "order": [agent.unique_id for agent in self.schedule.agents],
+            "activity": self.schedule.snapshot(),
+            "cars": [(car.unique_id, car.pos, {name: copy.copy(getattr(car, name)) for name in CAR_STATE})
+                     for car in cars],
+            "engine": self.engine.snapshot() if self.engine is not None else None,
+            "congestion": self.congestion.snapshot() if self.congestion is not None else None
+        }
+
+    def restore(self, snapshot):
+        """
+        Regresa el modelo a un estado guardado con snapshot(). El estado debe
+        venir de un modelo con el mismo mapa y el mismo motor de coches.
+
+        Args:
+            snapshot (dict): Estado guardado.
+        """
+        for agent in self.schedule.agents:
+            if isinstance(agent, Car):
+                self.grid.remove_agent(agent)
+        # En su lugar, porque el motor vectorizado usa una vista de este arreglo
+        self.occupancy[:] = snapshot["occupancy"]
+
+        self.step_count = snapshot["step_count"]
+        self.car_counter = snapshot["car_counter"]
+        self.next_car_number = snapshot["next_car_number"]
+        self.carsInDestination = snapshot["carsInDestination"]
+        self.random.setstate(snapshot["random_state"])
+        for light, (state, time_to_change) in zip(self.traffic_lights, snapshot["lights"]):
+            light.state = state
+            light.timeToChange = time_to_change
+
+        agents = {}
+        for unique_id, pos, state in snapshot["cars"]:
+            car = self.new_car(unique_id, state["destination"])
+            for name, value in state.items():
+                setattr(car, name, copy.copy(value))
+            self.grid.place_agent(car, pos)
+            agents[unique_id] = car
+
+        # El orden del calendario importa para que se sorteen las mismas llaves en el mismo orden
+        self.schedule = ActivityScheduler(self)
+        for unique_id in snapshot["order"]:
+            self.schedule.add(agents[unique_id])
+        self.schedule.steps = snapshot["schedule_steps"]
+        self.schedule.time = snapshot["schedule_time"]
+        self.light_scheduler.reset(self.schedule.steps - 1)
+        self.schedule.restore(snapshot["activity"])
+
+        if self.engine is not None:
+            self.engine.restore(snapshot["engine"])
+        if self.congestion is not None:
+            self.congestion.restore(snapshot["congestion"])
+
+    def fork(self, snapshot=None, light_timings=None, seed=None):
+        """
+        Crea una copia independiente del modelo a partir de un estado guardado.
+
+        La copia comparte por referencia los datos estáticos: el mapa, la capa
+        de celdas, el grafo, el Router (incluido su caché de caminos) y los
+        agentes Road, Obstacle y Destination. Solo los semáforos, los coches,
+        el grid, el calendario y la ocupación son nuevos.
+
+        Args:
+            snapshot (dict): Estado del que parte la copia. Si es None se usa el estado actual.
+            light_timings (dict): Pasos entre cambios de los semáforos de la copia por carácter ("S", "s").
+            seed (int): Si se da, la copia usa esta semilla después de restaurar el
+                estado, para seguir con otra secuencia aleatoria.
+
+        Returns:
+            CityModel: Copia del modelo.
+        """
+        if snapshot is None:
+            snapshot = self.snapshot()
+
+        clone = copy.copy(self)
+        clone.random = random.Random()
+        clone.map_data = dict(self.map_data, **(light_timings or {}))
+        clone.grid = MultiGrid(self.width, self.height, torus=False)
+        clone.schedule = ActivityScheduler(clone)
+        clone.occupancy = np.zeros_like(self.occupancy)
+        clone.car_pool = []
+
+        for agents, pos in self.grid.coord_iter():
+            for agent in agents:
+                if not isinstance(agent, (Car, Traffic_Light)):
+                    clone.grid.place_agent(agent, pos)
+        clone.traffic_lights = []
+        for light in self.traffic_lights:
+            clone_light = Traffic_Light(
+                light.unique_id, clone, light.state, light.timeToChange)
+            clone.grid.place_agent(clone_light, light.pos)
+            clone.traffic_lights.append(clone_light)
+        clone.light_scheduler = LightScheduler(clone.traffic_lights)
+
+        clone.engine = VectorCarEngine(
+            clone, self.lane_change_cooldown) if self.engine is not None else None
+        if self.congestion is not None:
+            clone.congestion = copy.copy(self.congestion)
+            clone.congestion.model = clone
+        clone.restore(snapshot)
+
+        if light_timings:
+            for light in clone.traffic_lights:
+                symbol = clone.tiles.symbols[light.pos]
+                if symbol in light_timings:
+                    light.timeToChange = int(light_timings[symbol])
+            clone.light_scheduler.reset(clone.schedule.steps - 1)
+        if self.router.light_phases is not None:
+            # Los caminos del modo "timed" dependen de los semáforos de cada copia
+            clone.router = copy.copy(self.router)
+            clone.router.light_phases = LightPhases(clone)
+            clone.router.path_cache = OrderedDict()
+        if seed is not None:
+            clone.random.seed(seed)
+            if clone.engine is not None:
+                clone.engine.rng = np.random.default_rng(seed)
+        return clone
+
     def step(self):
         """
-        Avanza un paso en la simulación.
+        Avanza un paso en la simulación. Los semáforos a los que les toca
+        cambiar lo hacen antes de que se muevan los coches.
         """
+        self.light_scheduler.advance(self.schedule.steps)
         self.schedule.step()
+        if self.congestion is not None:
+            self.congestion.step()
+        if self.engine is not None:
+            arrived = self.engine.step()
+            self.carsInDestination += arrived
+            self.car_counter -= arrived
         self.step_count += 1
-        print(self.car_counter)
-        print(f"Carros en destino: {self.carsInDestination}")
-        if self.step_count % 1 == 0:
+        if self.verbose:
+            print(self.car_counter)
+            print(f"Carros en destino: {self.carsInDestination}")
+        if self.step_count % self.spawn_interval == 0:
             self.add_cars()
         # if self.step_count % 100 == 0:
             # post(self.carsInDestination)
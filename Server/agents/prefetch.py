@@ -0,0 +1,176 @@
+"""
+Avance anticipado de una sesión en un hilo aparte.
+
+El hilo avanza el modelo hasta "depth" pasos por delante del cliente más
+atrasado y guarda, por paso, las respuestas ya serializadas de /getCars y
+/getTrafficLights en un búfer acotado. /update solo mueve el cursor del
+cliente al siguiente cuadro terminado, así que el costo del paso se traslapa
+con la red y el render del cliente en lugar de sumarse a ellos.
+
+Si los clientes se atrasan el búfer se llena y el hilo se detiene hasta que
+el más lento avance (contrapresión). Un cliente que deja de pedir cuadros
+por más de client_timeout segundos deja de contar como el más lento.
+
+Si un paso del modelo lanza una excepción el hilo se detiene, la guarda y
+despierta a los clientes; advance() la vuelve a lanzar como RuntimeError.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from .frames import car_records, light_records
+
+DEFAULT_CLIENT = "default"
+
+
+class Prefetcher:
+    """
+    Búfer de cuadros calculados por adelantado para una sesión.
+
+    Args:
+        session (Session): Sesión cuyo modelo se avanza.
+        depth (int): Número máximo de pasos por delante del cliente más lento.
+        client_timeout (float): Segundos sin pedir cuadros tras los que se olvida a un cliente.
+        clock (callable): Reloj usado para medir la inactividad de los clientes.
+    """
+
+    def __init__(self, session, depth=4, client_timeout=30, clock=time.monotonic):
+        if depth < 1:
+            raise ValueError("La profundidad debe ser al menos 1.")
+        self.session = session
+        self.depth = depth
+        self.client_timeout = client_timeout
+        self.clock = clock
+        self.condition = threading.Condition()
+        # Cuadros de los pasos base_step a base_step + len(frames) - 1
+        self.frames = deque()
+        self.base_step = session.current_step
+        # Cliente -> [paso que está viendo, última vez que pidió algo]
+        self.cursors = {}
+        self.running = True
+        # Excepción con la que se detuvo el hilo, si falló un paso
+        self.error = None
+
+        with session.lock:
+            self.frames.append(self.capture())
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def capture(self):
+        """
+        Serializa el estado actual del modelo. Se llama con el candado de la sesión tomado.
+
+        Returns:
+            tuple: Respuestas de /getCars y /getTrafficLights en bytes JSON.
+        """
+        model = self.session.model
+        return (json.dumps({"positions": car_records(model)}).encode(),
+                json.dumps({"positions": light_records(model)}).encode())
+
+    def head_step(self):
+        return self.base_step + len(self.frames) - 1
+
+    def slowest_step(self):
+        if not self.cursors:
+            return self.base_step
+        return min(cursor[0] for cursor in self.cursors.values())
+
+    def forget_stale_clients(self):
+        now = self.clock()
+        for client in [client for client, (_, last_seen) in self.cursors.items()
+                       if now - last_seen > self.client_timeout]:
+            del self.cursors[client]
+        self.trim()
+
+    def trim(self):
+        """
+        Descarta los cuadros que ya vieron todos los clientes.
+        """
+        slowest = self.slowest_step()
+        while self.base_step < slowest and len(self.frames) > 1:
+            self.frames.popleft()
+            self.base_step += 1
+
+    def cursor(self, client):
+        cursor = self.cursors.get(client)
+        if cursor is None:
+            cursor = self.cursors[client] = [self.base_step, self.clock()]
+        cursor[1] = self.clock()
+        return cursor
+
+    def run(self):
+        """
+        Ciclo del hilo: avanza el modelo mientras haya lugar en el búfer.
+        """
+        while True:
+            with self.condition:
+                self.forget_stale_clients()
+                while self.running and self.head_step() - self.slowest_step() >= self.depth:
+                    self.condition.wait(timeout=1)
+                    self.forget_stale_clients()
+                if not self.running:
+                    return
+
+            try:
+                with self.session.lock:
+                    self.session.model.step()
+                    self.session.current_step += 1
+                    frame = self.capture()
+            except Exception as error:
+                with self.condition:
+                    self.error = error
+                    self.running = False
+                    self.condition.notify_all()
+                return
+
+            with self.condition:
+                self.frames.append(frame)
+                self.condition.notify_all()
+
+    def advance(self, client=DEFAULT_CLIENT):
+        """
+        Pasa al cliente al siguiente cuadro, esperando solo si todavía no está listo.
+
+        Args:
+            client (str): Id del cliente dentro de la sesión.
+
+        Returns:
+            int: Paso que ve el cliente ahora.
+
+        Raises:
+            RuntimeError: Si el hilo se detuvo por un error antes de terminar el cuadro.
+        """
+        with self.condition:
+            cursor = self.cursor(client)
+            cursor[0] += 1
+            self.trim()
+            self.condition.notify_all()
+            while self.running and self.thread.is_alive() and self.head_step() < cursor[0]:
+                self.condition.wait(timeout=1)
+            if self.head_step() < cursor[0] and self.error is not None:
+                cursor[0] = self.head_step()
+                raise RuntimeError(f"El avance anticipado se detuvo: {self.error!r}") from self.error
+            return cursor[0]
+
+    def frame(self, client=DEFAULT_CLIENT):
+        """
+        Obtiene el cuadro que está viendo el cliente.
+
+        Args:
+            client (str): Id del cliente dentro de la sesión.
+
+        Returns:
+            tuple: Paso y respuestas de /getCars y /getTrafficLights en bytes.
+        """
+        with self.condition:
+            step = self.cursor(client)[0]
+            return (step, *self.frames[min(step, self.head_step()) - self.base_step])
+
+    def stop(self):
+        """
+        Detiene el hilo y despierta a los clientes que esperan un cuadro.
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
@@ -0,0 +1,501 @@
+from collections import OrderedDict
+import heapq
+import itertools
+import math
+import numpy as np
+import networkx as nx
+
+# Número máximo de entradas de todas las tablas de siguiente salto (destinos por celdas del mapa) en
+# modo "table": 2 ** 24 enteros int32 son 64 MiB. Con más, el Router usa el modo "astar".
+MAX_TABLE_ENTRIES = 2 ** 24
+
+
+def manhattan_distance(a, b):
+    """
+    Heurística de A*: distancia Manhattan entre dos celdas.
+
+    Es admisible porque cada arista recta cuesta al menos 1 y cada arista
+    diagonal (que avanza dos unidades de distancia Manhattan) cuesta al
+    menos 2.
+
+    Args:
+        a (tuple): Primera posición (x, y).
+        b (tuple): Segunda posición (x, y).
+
+    Returns:
+        int: Distancia Manhattan entre a y b.
+    """
+    return abs(a[0] - b[0]) + abs(a[1] - b[1])
+
+
+class LightPhases:
+    """
+    Predice el estado de los semáforos en pasos futuros.
+
+    Las predicciones vienen del calendario de semáforos del modelo
+    (LightScheduler), que calcula el estado de cualquier paso sin simular.
+
+    Args:
+        model (CityModel): Modelo con los semáforos y el calendario.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.scheduler = model.light_scheduler
+        self.lights = self.scheduler.index
+        # Periodo del patrón conjunto de todos los semáforos
+        self.period = math.lcm(
+            *(2 * light.timeToChange for light in model.traffic_lights)) if model.traffic_lights else 1
+
+    def now(self):
+        """
+        Obtiene el paso del calendario durante el que se hará el siguiente movimiento.
+
+        Returns:
+            int: Número de pasos ya ejecutados por el calendario.
+        """
+        return self.model.schedule.steps
+
+    def is_green(self, pos, step):
+        """
+        Predice si el semáforo en pos estará en verde durante un paso futuro.
+
+        Args:
+            pos (tuple): Posición del semáforo.
+            step (int): Paso del calendario (mayor o igual que now()).
+
+        Returns:
+            bool: True si estará en verde.
+        """
+        return self.scheduler.state_at(self.lights[pos], step)
+
+    def wait(self, pos, step):
+        """
+        Calcula cuántos pasos hay que esperar para entrar a una celda.
+
+        Args:
+            pos (tuple): Celda a la que se quiere entrar.
+            step (int): Paso del calendario en que se llegaría.
+
+        Returns:
+            int: 0 si la celda no es un semáforo o está en verde; si no, los
+            pasos hasta el siguiente cambio.
+        """
+        if pos not in self.lights or self.is_green(pos, step):
+            return 0
+        return self.scheduler.next_change(self.lights[pos], step) - step
+
+
+class Router:
+    """
+    Capa de ruteo compartida por todos los coches del modelo.
+
+    En modo "table" se construye, para cada destino, el árbol inverso de
+    caminos más cortos y se guarda como una tabla de siguiente salto (un
+    renglón de enteros por destino en el arreglo next_hop). Consultar la
+    siguiente celda hacia un destino es entonces una lectura O(1) en lugar de
+    una búsqueda en el grafo. Cada tabla se construye la primera vez que se
+    pide un camino hacia su destino, no al crear el Router, y si las tablas
+    de todos los destinos tendrían más de max_table_entries entradas el
+    Router usa el modo "astar".
+
+    En modo "astar" (y para destinos sin tabla) los caminos se calculan con
+    A* usando la distancia Manhattan como heurística. El caché guarda, por
+    destino, la siguiente celda de cada celda por la que ya pasó un camino
+    calculado: como cualquier tramo final de un camino más corto también es
+    un camino más corto, un coche que sale de una de esas celdas (por
+    ejemplo, después de un cambio de carril) reutiliza el resto del camino
+    sin volver a buscar. Se descarta primero el destino menos usado.
+
+    En modo "timed" el costo de entrar a un semáforo depende del paso en que
+    se llega: se suma la espera hasta que esté en verde según LightPhases.
+    Los caminos se calculan con A* dependiente del tiempo y se guardan en el
+    mismo caché con la fase actual de los semáforos como parte de la llave.
+
+    Args:
+        city_graph (nx.DiGraph): Grafo de la ciudad.
+        width (int): Ancho del mapa.
+        height (int): Alto del mapa.
+        destinations (list): Posiciones de los destinos.
+        mode (str): "table", "astar" o "timed".
+        cache_size (int): Tamaño máximo del caché LRU: celdas guardadas en
+            modo "astar" y caminos en modo "timed". Si es None, en modo
+            "astar" caben todas las celdas de todos los destinos y en modo
+            "timed" 1024 caminos.
+        light_phases (LightPhases): Predicción de los semáforos. Solo se usa, y es obligatoria, en modo "timed".
+        table_cache: Caché de tablas de este grafo con load_table(renglón) y
+            save_table(renglón, tabla), como CompiledMap. Cada tabla se busca
+            ahí antes de construirla y se guarda ahí después. None para no usarlo.
+        max_table_entries (int): Entradas máximas de las tablas en modo "table".
+    """
+
+    MODES = ("table", "astar", "timed")
+
+    def __init__(self, city_graph, width, height, destinations, mode="table", cache_size=None, light_phases=None,
+                 table_cache=None, max_table_entries=MAX_TABLE_ENTRIES):
+        if mode not in self.MODES:
+            raise ValueError(f"Modo de ruteo desconocido: {mode}")
+        if mode == "timed" and light_phases is None:
+            raise ValueError("El modo 'timed' necesita light_phases.")
+
+        self.city_graph = city_graph
+        self.width = width
+        self.height = height
+        self.destinations = list(destinations)
+        if mode == "table" and len(self.destinations) * width * height > max_table_entries:
+            mode = "astar"
+        self.mode = mode
+        self.light_phases = light_phases
+        if cache_size is None:
+            cache_size = len(self.destinations) * city_graph.number_of_nodes() if mode == "astar" else 1024
+        self.cache_size = cache_size
+        # Modo "timed": (inicio, destino, fase) -> camino. Modo "astar": destino -> {celda: siguiente celda}
+        self.path_cache = OrderedDict()
+        # Celdas guardadas en el caché del modo "astar"
+        self.cached_cells = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.table_cache = table_cache
+        # Renglón de next_hop de cada destino
+        self.destination_rows = {destination: row for row, destination in enumerate(self.destinations)}
+        # Una tabla por destino. Sin inicializar: un renglón solo es válido si su destino está en built.
+        # Las páginas de memoria de un renglón solo se ocupan cuando se escribe su tabla.
+        self.next_hop = np.empty((len(self.destinations) if self.mode == "table" else 0, width * height),
+                                 dtype=np.int32)
+        self.built = np.zeros(len(self.next_hop), dtype=bool)
+        # Aumenta cada vez que se reconstruyen las tablas
+        self.version = 0
+
+    def cell_index(self, pos):
+        """
+        Convierte una posición (x, y) en el índice plano usado por las tablas.
+
+        Args:
+            pos (tuple): Coordenadas de la celda.
+
+        Returns:
+            int: Índice de la celda en un arreglo de tamaño width * height.
+        """
+        return pos[0] * self.height + pos[1]
+
+    def cell_position(self, index):
+        """
+        Convierte un índice plano en la posición (x, y) correspondiente.
+
+        Args:
+            index (int): Índice de la celda.
+
+        Returns:
+            tuple: Coordenadas de la celda.
+        """
+        return divmod(int(index), self.height)
+
+    def build_tables(self, rows=None):
+        """
+        Construye las tablas de siguiente salto que todavía no existen.
+
+        Args:
+            rows (iterable): Renglones de next_hop (índices en destinations).
+                Si es None, los de todos los destinos.
+        """
+        for row in range(len(self.next_hop)) if rows is None else rows:
+            if not self.built[row]:
+                self.load_table(row)
+
+    def load_table(self, row):
+        """
+        Llena un renglón de next_hop desde el caché de tablas o, si no está
+        ahí, construyéndolo y guardándolo en el caché.
+
+        Args:
+            row (int): Renglón del destino.
+        """
+        table = self.table_cache.load_table(row) if self.table_cache is not None else None
+        if table is None:
+            table = self.build_table(self.destinations[row])
+            if self.table_cache is not None:
+                self.table_cache.save_table(row, table)
+        self.next_hop[row] = table
+        self.built[row] = True
+
+    def table(self, goal):
+        """
+        Obtiene la tabla de siguiente salto hacia un destino, construyéndola si hace falta.
+
+        Args:
+            goal (tuple): Destino.
+
+        Returns:
+            np.ndarray: Tabla del destino, o None si el Router no usa tablas o goal no es un destino.
+        """
+        row = self.destination_rows.get(goal)
+        if row is None or row >= len(self.next_hop):
+            return None
+        if not self.built[row]:
+            self.load_table(row)
+        return self.next_hop[row]
+
+    def table_bytes(self):
+        """
+        Calcula la memoria de las tablas ya construidas.
+
+        Returns:
+            int: Bytes de los renglones de next_hop que ya tienen tabla.
+        """
+        return int(self.built.sum()) * self.next_hop.shape[1] * self.next_hop.itemsize
+
+    def build_table(self, destination):
+        """
+        Construye la tabla de siguiente salto hacia un destino a partir del
+        árbol inverso de caminos más cortos.
+
+        Args:
+            destination (tuple): Posición del destino.
+
+        Returns:
+            np.ndarray: Arreglo int32 donde cada celda guarda el índice de la
+            siguiente celda hacia el destino, o -1 si no hay camino.
+        """
+        table = np.full(self.width * self.height, -1, dtype=np.int32)
+        if destination not in self.city_graph:
+            return table
+
+        # En el grafo invertido los predecesores de un nodo son sus sucesores
+        # en el grafo original, es decir, el siguiente salto hacia el destino.
+        # Entre caminos del mismo costo se prefiere el de menos saltos, como
+        # hace A*, así que el número de saltos se suma como costo secundario.
+        hop_scale = self.city_graph.number_of_nodes() + 1
+        reverse_graph = self.city_graph.reverse(copy=False)
+        predecessors, _ = nx.dijkstra_predecessor_and_distance(
+            reverse_graph, destination,
+            weight=lambda u, v, data: data['weight'] * hop_scale + 1)
+
+        for node, next_nodes in predecessors.items():
+            if next_nodes:
+                # Si aún hay empate se sigue de frente antes que cambiar de
+                # carril, de modo que el cambio de carril ocurra lo más tarde
+                # posible.
+                next_node = min(
+                    next_nodes, key=lambda n: self.city_graph[node][n]['weight'])
+                table[self.cell_index(node)] = self.cell_index(next_node)
+        table[self.cell_index(destination)] = self.cell_index(destination)
+        return table
+
+    def next_position(self, start, goal):
+        """
+        Obtiene la siguiente celda en el camino más corto hacia un destino.
+
+        Args:
+            start (tuple): Posición actual.
+            goal (tuple): Destino.
+
+        Returns:
+            tuple: Siguiente posición, o None si no hay camino.
+        """
+        table = self.table(goal)
+        next_index = table[self.cell_index(start)]
+        if next_index < 0:
+            return None
+        return self.cell_position(next_index)
+
+    def has_path(self, start, goal):
+        """
+        Verifica si existe un camino desde start hasta goal.
+
+        Args:
+            start (tuple): Posición inicial.
+            goal (tuple): Destino.
+
+        Returns:
+            bool: True si hay camino.
+        """
+        table = self.table(goal)
+        if table is None:
+            return start in self.city_graph and goal in self.city_graph and nx.has_path(self.city_graph, start, goal)
+        return table[self.cell_index(start)] >= 0
+
+    def path(self, start, goal):
+        """
+        Calcula el camino más corto desde start hasta goal.
+
+        Args:
+            start (tuple): Posición inicial.
+            goal (tuple): Destino.
+
+        Returns:
+            list: Celdas del camino, sin incluir la posición inicial.
+
+        Raises:
+            nx.NetworkXNoPath: Si no existe un camino hasta el destino.
+        """
+        if self.mode == "timed":
+            return self.timed_path(start, goal)
+        table = self.table(goal)
+        if table is None:
+            return self.astar_path(start, goal)
+
+        index = self.cell_index(start)
+        goal_index = self.cell_index(goal)
+        path = []
+        while index != goal_index:
+            index = table[index]
+            if index < 0:
+                raise nx.NetworkXNoPath(
+                    f"No hay camino de {start} a {goal}.")
+            path.append(self.cell_position(index))
+        return path
+
+    def astar_path(self, start, goal):
+        """
+        Calcula el camino más corto con A* y heurística Manhattan, pasando
+        primero por el caché del destino.
+
+        Args:
+            start (tuple): Posición inicial.
+            goal (tuple): Destino.
+
+        Returns:
+            list: Celdas del camino, sin incluir la posición inicial. Es una
+            lista nueva, así que el coche puede consumirla libremente.
+
+        Raises:
+            nx.NetworkXNoPath: Si no existe un camino hasta el destino.
+        """
+        successors = self.path_cache.get(goal)
+        if successors is not None:
+            self.path_cache.move_to_end(goal)
+            if start in successors:
+                self.cache_hits += 1
+                path = []
+                node = start
+                while node != goal:
+                    node = successors[node]
+                    path.append(node)
+                return path
+
+        self.cache_misses += 1
+        path = nx.astar_path(self.city_graph, start, goal,
+                             heuristic=manhattan_distance, weight='weight')
+
+        if self.cache_size > 0:
+            if successors is None:
+                successors = self.path_cache[goal] = {}
+            # Si una celda ya estaba, las dos siguientes celdas llevan al destino por caminos igual de cortos
+            for node, next_node in zip(path, path[1:]):
+                if node not in successors:
+                    successors[node] = next_node
+                    self.cached_cells += 1
+            while self.cached_cells > self.cache_size and len(self.path_cache) > 1:
+                _, evicted = self.path_cache.popitem(last=False)
+                self.cached_cells -= len(evicted)
+        return path[1:]
+
+    def timed_path(self, start, goal):
+        """
+        Calcula el camino que llega antes al destino considerando la espera
+        en los semáforos en rojo, con A* dependiente del tiempo.
+
+        Cada movimiento toma un paso y un cambio de carril cuesta un paso
+        extra, como en el grafo. Si la celda siguiente es un semáforo que
+        estará en rojo al llegar, se suma la espera hasta el siguiente verde.
+        El costo de cada celda solo depende del paso de llegada, así que no
+        hace falta reconstruir el grafo cuando cambian los semáforos.
+
+        Args:
+            start (tuple): Posición inicial.
+            goal (tuple): Destino.
+
+        Returns:
+            list: Celdas del camino, sin incluir la posición inicial.
+
+        Raises:
+            nx.NetworkXNoPath: Si no existe un camino hasta el destino.
+        """
+        now = self.light_phases.now()
+        key = (start, goal, now % self.light_phases.period)
+        cached = self.path_cache.get(key)
+        if cached is not None:
+            self.path_cache.move_to_end(key)
+            self.cache_hits += 1
+            return list(cached)
+        self.cache_misses += 1
+
+        if start not in self.city_graph or goal not in self.city_graph:
+            raise nx.NetworkXNoPath(f"No hay camino de {start} a {goal}.")
+
+        # Cola de (costo + heurística, costo, desempate, nodo, pasos transcurridos)
+        counter = itertools.count()
+        queue = [(manhattan_distance(start, goal), 0, next(counter), start, 0)]
+        best = {start: 0}
+        parents = {start: None}
+        while queue:
+            _, cost, _, node, elapsed = heapq.heappop(queue)
+            if node == goal:
+                break
+            if cost > best[node]:
+                continue
+            for neighbor in self.city_graph.successors(node):
+                lane_change = node[0] != neighbor[0] and node[1] != neighbor[1]
+                wait = self.light_phases.wait(neighbor, now + elapsed)
+                new_cost = cost + 1 + wait + lane_change
+                if new_cost < best.get(neighbor, math.inf):
+                    best[neighbor] = new_cost
+                    parents[neighbor] = node
+                    heapq.heappush(queue, (new_cost + manhattan_distance(neighbor, goal), new_cost,
+                                           next(counter), neighbor, elapsed + 1 + wait))
+        else:
+            raise nx.NetworkXNoPath(f"No hay camino de {start} a {goal}.")
+
+        path = []
+        node = goal
+        while node != start:
+            path.append(node)
+            node = parents[node]
+        path = tuple(reversed(path))
+
+        if self.cache_size > 0:
+            self.path_cache[key] = path
+            if len(self.path_cache) > self.cache_size:
+                self.path_cache.popitem(last=False)
+        return list(path)
+
+    def set_edge_weights(self, weights):
+        """
+        Cambia el peso de varias aristas del grafo e invalida los caminos
+        calculados con los pesos anteriores.
+
+        Args:
+            weights (dict): Diccionario (origen, destino) -> nuevo peso.
+        """
+        for (u, v), weight in weights.items():
+            self.city_graph[u][v]['weight'] = weight
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Descarta el caché de caminos y reconstruye las tablas de siguiente
+        salto que ya se habían construido, en su lugar. Debe llamarse siempre
+        que cambien los pesos de city_graph. Las tablas del caché de tablas
+        son de los pesos originales, así que ya no se usa.
+        """
+        self.path_cache.clear()
+        self.cached_cells = 0
+        self.table_cache = None
+        for row in np.flatnonzero(self.built).tolist():
+            self.next_hop[row] = self.build_table(self.destinations[row])
+        self.version += 1
+
+    def cache_info(self):
+        """
+        Obtiene las estadísticas del caché de caminos.
+
+        Returns:
+            dict: Aciertos, fallos, tamaño actual y tamaño máximo del caché
+            (en celdas en modo "astar" y en caminos en modo "timed").
+        """
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "size": self.cached_cells if self.mode == "astar" else len(self.path_cache),
+            "max_size": self.cache_size
+        }
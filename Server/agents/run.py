@@ -0,0 +1,147 @@
+"""
+Ejecuta CityModel sin servidor HTTP ni visualización y guarda sus métricas.
+
+Uso:
+    python -m agents.run --map 2023_base.txt --steps 5000 --seed 1 --spawn-interval 1 --output resultados.csv
+    python -m agents.run --steps 1000 --seed 1 --record trajectories/corrida.trj
+"""
+
+import argparse
+import csv
+import json
+import sys
+import time
+from .model import CityModel
+from .routing import Router
+from .trajectory import TrajectoryRecorder
+
+STEP_FIELDS = ["step", "arrivals", "total_arrivals", "live_cars", "wall_time_ms"]
+
+
+def run_simulation(steps, on_step=None, record=None, model=None, **model_args):
+    """
+    Crea un modelo y lo avanza el número de pasos indicado sin imprimir nada.
+
+    Args:
+        steps (int): Número de pasos a simular.
+        on_step (callable): Función que recibe el diccionario de métricas de cada paso.
+        record (str): Archivo donde se graba la trayectoria del estado inicial y de cada paso.
+        model (CityModel): Modelo ya creado (por ejemplo con CityModel.fork) que se
+            avanza en lugar de crear uno nuevo. En ese caso model_args solo se usan en el resumen.
+        **model_args: Argumentos para CityModel (city_file, seed, spawn_interval, ...).
+
+    Returns:
+        dict: Resumen de la ejecución.
+    """
+    model_args["verbose"] = False
+    start = time.perf_counter()
+    if model is None:
+        model = CityModel(**model_args)
+    else:
+        model.verbose = False
+    build_time = time.perf_counter() - start
+
+    recorder = TrajectoryRecorder(record, model) if record else None
+    if recorder is not None:
+        recorder.record()
+
+    step_times = []
+    for _ in range(steps):
+        arrived_before = model.carsInDestination
+        step_start = time.perf_counter()
+        model.step()
+        step_time = time.perf_counter() - step_start
+        step_times.append(step_time)
+        if recorder is not None:
+            recorder.record()
+
+        if on_step is not None:
+            on_step({
+                "step": model.step_count,
+                "arrivals": model.carsInDestination - arrived_before,
+                "total_arrivals": model.carsInDestination,
+                "live_cars": model.car_counter,
+                "wall_time_ms": step_time * 1000
+            })
+
+    if recorder is not None:
+        recorder.close()
+
+    total_time = sum(step_times)
+    summary = dict(model_args)
+    summary.pop("verbose")
+    summary.update({
+        "steps": steps,
+        "total_arrivals": model.carsInDestination,
+        "live_cars": model.car_counter,
+        "build_time_s": build_time,
+        "run_time_s": total_time,
+        "mean_step_ms": total_time / steps * 1000 if steps else 0.0,
+        "max_step_ms": max(step_times) * 1000 if steps else 0.0,
+        "steps_per_second": steps / total_time if total_time else 0.0
+    })
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Ejecuta la simulación de tráfico sin servidor.")
+    parser.add_argument("--map", dest="city_file", default="2023_base.txt",
+                        help="Archivo del mapa (ruta o nombre dentro de city_files).")
+    parser.add_argument("--steps", type=int, default=1000,
+                        help="Número de pasos a simular.")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Semilla del generador aleatorio.")
+    parser.add_argument("--spawn-interval", type=int, default=1,
+                        help="Cada cuántos pasos se agregan coches.")
+    parser.add_argument("--backend", choices=CityModel.BACKENDS, default="agents",
+                        help="Motor de los coches.")
+    parser.add_argument("--routing", choices=Router.MODES, default="table",
+                        help="Modo de ruteo.")
+    parser.add_argument("--congestion-threshold", type=float, default=None,
+                        help="Repara las rutas que cruzan corredores cuya congestión cambie al menos este valor.")
+    parser.add_argument("--per-step", action="store_true",
+                        help="Guarda las métricas de cada paso además del resumen.")
+    parser.add_argument("--output", default=None,
+                        help="Archivo de salida (.csv o .json). Si no se da, el resumen se imprime en JSON.")
+    parser.add_argument("--record", default=None,
+                        help="Graba la trayectoria en este archivo para reproducirla en el servidor.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    model_args = {
+        "city_file": args.city_file,
+        "seed": args.seed,
+        "spawn_interval": args.spawn_interval,
+        "backend": args.backend,
+        "routing": args.routing,
+        "congestion_threshold": args.congestion_threshold
+    }
+
+    rows = []
+    on_step = rows.append if args.per_step else None
+    summary = run_simulation(args.steps, on_step, args.record, **model_args)
+
+    if args.output is None:
+        json.dump({"summary": summary, "steps": rows} if args.per_step else summary,
+                  sys.stdout, indent=2)
+        print()
+    elif args.output.endswith(".csv"):
+        with open(args.output, "w", newline="") as output:
+            if args.per_step:
+                writer = csv.DictWriter(output, fieldnames=STEP_FIELDS)
+                writer.writeheader()
+                writer.writerows(rows)
+            else:
+                writer = csv.DictWriter(output, fieldnames=list(summary))
+                writer.writeheader()
+                writer.writerow(summary)
+    else:
+        with open(args.output, "w") as output:
+            json.dump({"summary": summary, "steps": rows}, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""
+Calendario de coches que no activa a los coches detenidos.
+
+Un coche que no pudo avanzar porque lo detiene un semáforo en rojo o un
+coche que tampoco avanza se estaciona: deja de activarse y se registra en lo
+único que puede desbloquearlo, que es que se desocupe la celda de
+enfrente o que su semáforo se ponga en verde. Si tiene a dónde cambiar de
+carril también se registra en lo que puede habilitar el cambio: que entre un
+coche a las celdas que cuenta check_for_lane_change o que se desocupe una de
+las diagonales, o, si todavía no pasa lane_change_cooldown, un temporizador
+para el paso en que se cumple. Cuando pasa alguna de esas cosas o su ruta
+cambia desde fuera (reruteo por congestión) el coche se despierta.
+
+Mientras está estacionado, cada paso del coche sería el mismo intento
+fallido, así que al despertarlo solo se suman a time_since_lane_change los
+pasos que se saltó, y un paso cuesta lo mismo que el número de coches que
+se mueven.
+
+El orden de activación es equivalente al de RandomActivation: en cada paso
+cada coche activo recibe una llave aleatoria uniforme y se activan en orden
+de llave. Un coche estacionado que se despierta a mitad del paso recibe su
+llave en ese momento; si es mayor que la del coche que lo despertó se
+activa en este mismo paso, y si no, es como si ya se hubiera activado antes
+(sin poder moverse) y espera al siguiente.
+"""
+
+import heapq
+from mesa.time import BaseScheduler
+from .tiles import DESTINATION
+
+
+class ActivityScheduler(BaseScheduler):
+    """
+    Calendario que solo activa los coches que se pueden mover.
+
+    El modelo avisa con cell_vacated y cell_entered cada vez que un coche
+    sale de una celda o entra a ella.
+
+    Args:
+        model (CityModel): Modelo con motor "agents".
+    """
+
+    def __init__(self, model):
+        super().__init__(model)
+        # Coches que se activan en el siguiente paso (dict para conservar el orden)
+        self.active = {}
+        # Coche -> paso en que se estacionó
+        self.parked = {}
+        # Posición -> coche estacionado en ella
+        self.parked_cells = {}
+        # Posición -> coche activo que no pudo avanzar en su último paso
+        self.blocked_cells = {}
+        # Coche -> (celdas que espera que se desocupen, celdas en las que espera
+        # que entre un coche, semáforo, paso del temporizador)
+        self.watches = {}
+        # Celda -> coches estacionados que esperan que se desocupe
+        self.vacate_waiters = {}
+        # Celda -> coches estacionados que esperan que entre un coche
+        self.enter_waiters = {}
+        # Índice del semáforo -> coches estacionados esperando el verde
+        self.light_waiters = {}
+        # Paso -> coches que se despiertan al inicio de ese paso
+        self.timers = {}
+        # Coches despertados que todavía se activan en el paso actual: (llave, número, coche)
+        self.woken = []
+        # Llave del coche que se está activando; None fuera de step()
+        self.current = None
+
+    def add(self, agent):
+        super().add(agent)
+        self.active[agent] = None
+
+    def remove(self, agent):
+        super().remove(agent)
+        self.active.pop(agent, None)
+        if agent in self.parked:
+            self.unpark(agent)
+
+    def lane_change_cells(self, car):
+        """
+        Obtiene las celdas de las que depende el cambio de carril de un coche detenido.
+
+        Args:
+            car (Car): Coche detenido.
+
+        Returns:
+            tuple: Diagonales a las que podría cambiarse (ver
+            Car.execute_lane_change) y celdas que cuenta
+            Car.check_for_lane_change, o None si el coche no puede cambiar de
+            carril desde donde está.
+        """
+        model = self.model
+        front_cell = car.get_cell_in_front() if car.direction else None
+        if front_cell is None or not model.validPosition(*front_cell):
+            return None
+        x, y = car.pos
+        diagonals = [(x + dx, y + dy) for dx, dy in ((1, 1), (1, -1), (-1, 1), (-1, -1))]
+        diagonals = [pos for pos in diagonals if model.validPosition(*pos) and not car.is_opposite_direction(pos)
+                     and model.tiles.kind[pos] != DESTINATION]
+        if not diagonals:
+            return None
+        front_x, front_y = front_cell
+        counted = [(front_x + dx, front_y + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+        return diagonals, counted
+
+    def park(self, car, parked_at):
+        """
+        Estaciona un coche que no pudo avanzar y lo registra en lo que lo
+        puede desbloquear.
+
+        Args:
+            car (Car): Coche con ruta que no se movió en su último paso.
+            parked_at (int): Paso de su último intento.
+        """
+        model = self.model
+        self.active.pop(car, None)
+        self.parked[car] = parked_at
+        self.parked_cells[car.pos] = car
+
+        vacate = []
+        enter = []
+        light = -1
+        next_position = car.path[0]
+        light_index = model.tiles.light_at(*next_position)
+        if light_index >= 0 and not model.traffic_lights[light_index].state:
+            light = light_index
+            self.light_waiters.setdefault(light, {})[car] = None
+        else:
+            vacate.append(next_position)
+
+        timer = None
+        lane_change = self.lane_change_cells(car)
+        if lane_change is not None:
+            wait = car.lane_change_cooldown - car.time_since_lane_change
+            if wait > 0:
+                timer = parked_at + wait
+                self.timers.setdefault(timer, []).append(car)
+            else:
+                diagonals, enter = lane_change
+                vacate += diagonals
+
+        for cell in vacate:
+            self.vacate_waiters.setdefault(cell, {})[car] = None
+        for cell in enter:
+            self.enter_waiters.setdefault(cell, {})[car] = None
+        self.watches[car] = (vacate, enter, light, timer)
+
+    def unpark(self, car):
+        """
+        Quita un coche de los registros de coches estacionados.
+
+        Args:
+            car (Car): Coche estacionado.
+
+        Returns:
+            int: Paso en que se estacionó.
+        """
+        vacate, enter, light, timer = self.watches.pop(car)
+        del self.parked_cells[car.pos]
+        for cells, waiters in ((vacate, self.vacate_waiters), (enter, self.enter_waiters)):
+            for cell in cells:
+                cars = waiters.get(cell)
+                if cars is not None:
+                    cars.pop(car, None)
+                    if not cars:
+                        del waiters[cell]
+        if light >= 0:
+            cars = self.light_waiters[light]
+            cars.pop(car, None)
+            if not cars:
+                del self.light_waiters[light]
+        if timer is not None and timer in self.timers:
+            self.timers[timer] = [other for other in self.timers[timer] if other is not car]
+        return self.parked.pop(car)
+
+    def wake(self, car):
+        """
+        Despierta un coche estacionado y le suma los pasos que se saltó.
+
+        Args:
+            car (Car): Coche. Si no está estacionado no se hace nada.
+        """
+        if car not in self.parked:
+            return
+        parked_at = self.unpark(car)
+        if self.current is not None:
+            # Si se estacionó en este paso su turno ya pasó; si no, se sortea ahora
+            if parked_at < self.steps:
+                key = self.model.random.random()
+                if key > self.current:
+                    car.time_since_lane_change += self.steps - parked_at - 1
+                    heapq.heappush(self.woken, (key, car.unique_id, car))
+                    return
+            car.time_since_lane_change += self.steps - parked_at
+        else:
+            car.time_since_lane_change += self.steps - parked_at - 1
+        self.active[car] = None
+
+    def cell_vacated(self, pos):
+        """
+        Despierta los coches que esperan que se desocupe una celda.
+
+        Args:
+            pos (tuple): Celda de la que salió un coche.
+        """
+        waiters = self.vacate_waiters.get(pos)
+        if waiters:
+            for car in list(waiters):
+                self.wake(car)
+
+    def cell_entered(self, pos):
+        """
+        Despierta los coches que esperan que entre un coche a una celda.
+
+        Args:
+            pos (tuple): Celda a la que entró un coche.
+        """
+        waiters = self.enter_waiters.get(pos)
+        if waiters:
+            for car in list(waiters):
+                self.wake(car)
+
+    def is_held(self, car):
+        """
+        Indica si lo que bloquea a un coche detenido va a seguir ahí: un
+        semáforo en rojo, un coche estacionado o un coche que tampoco pudo
+        avanzar en su último paso. Detrás de un coche que sí avanza conviene
+        seguir activando al coche, porque casi siempre se desbloquea en el
+        mismo paso o en el siguiente.
+
+        Args:
+            car (Car): Coche que no pudo avanzar.
+
+        Returns:
+            bool: True si conviene estacionarlo.
+        """
+        next_position = car.path[0]
+        light_index = self.model.tiles.light_at(*next_position)
+        if light_index >= 0 and not self.model.traffic_lights[light_index].state:
+            return True
+        return next_position in self.parked_cells or next_position in self.blocked_cells
+
+    def activate(self, car):
+        # Lo que decide el paso de un coche detenido; si cambió durante el paso
+        # (por ejemplo, la primera ruta de un coche nuevo) el siguiente puede ser distinto
+        pos = car.pos
+        direction = car.direction
+        next_position = car.path[0] if car.path else None
+        if self.blocked_cells.get(pos) is car:
+            del self.blocked_cells[pos]
+        car.step()
+        # Un coche que llegó a su destino ya no tiene posición, y time_since_lane_change
+        # en 0 indica que cambió de carril (y pudo regresar a la misma celda)
+        if car.pos == pos and car.time_since_lane_change > 0 and car.path and car.path[0] == next_position \
+                and car.direction == direction:
+            if self.is_held(car):
+                self.park(car, self.steps)
+            else:
+                self.blocked_cells[pos] = car
+
+    def step(self):
+        """
+        Activa, en orden aleatorio, los coches activos y los que se
+        despiertan durante el paso.
+        """
+        for car in self.timers.pop(self.steps, ()):
+            self.wake(car)
+        states = self.model.light_scheduler.states
+        for light in [light for light in self.light_waiters if states[light]]:
+            for car in list(self.light_waiters.get(light, ())):
+                self.wake(car)
+
+        # Un orden aleatorio con una llave uniforme por coche, para comparar con las de los que se despierten
+        random = self.model.random
+        cars = list(self.active)
+        random.shuffle(cars)
+        keys = sorted([random.random() for _ in cars])
+        woken = self.woken = []
+        activate = self.activate
+        for car, key in zip(cars, keys):
+            while woken and woken[0][0] < key:
+                self.current, _, woken_car = heapq.heappop(woken)
+                self.active[woken_car] = None
+                activate(woken_car)
+            self.current = key
+            activate(car)
+        while woken:
+            self.current, _, woken_car = heapq.heappop(woken)
+            self.active[woken_car] = None
+            activate(woken_car)
+        self.current = None
+        self.steps += 1
+        self.time += 1
+
+    def snapshot(self):
+        """
+        Copia qué coches están activos y cuáles estacionados.
+
+        Returns:
+            dict: Ids de los coches activos en orden, (id, paso) de los
+            estacionados e ids de los que no pudieron avanzar sin estacionarse.
+        """
+        return {
+            "active": [car.unique_id for car in self.active],
+            "parked": [(car.unique_id, parked_at) for car, parked_at in self.parked.items()],
+            "blocked": [car.unique_id for car in self.blocked_cells.values()]
+        }
+
+    def restore(self, state):
+        """
+        Vuelve a estacionar los coches según un estado guardado con
+        snapshot(). Los coches ya deben estar en el calendario.
+
+        Args:
+            state (dict): Estado guardado.
+        """
+        self.active = {self._agents[unique_id]: None for unique_id in state["active"]}
+        for unique_id, parked_at in state["parked"]:
+            self.park(self._agents[unique_id], parked_at)
+        for unique_id in state["blocked"]:
+            car = self._agents[unique_id]
+            self.blocked_cells[car.pos] = car
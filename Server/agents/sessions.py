@@ -0,0 +1,311 @@
+"""
+Registro de sesiones para que un solo servidor atienda varias simulaciones.
+
+Cada /init crea una sesión con su propio modelo y un id que el cliente manda
+en las demás rutas. El registro limita el número de modelos vivos (se
+descarta el que lleva más tiempo sin usarse), elimina las sesiones inactivas
+y estima cuánta memoria ocupa cada una.
+"""
+
+import secrets
+import sys
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from .frames import DeltaTracker, StaticLayers
+from .prefetch import Prefetcher
+
+
+def model_memory(model):
+    """
+    Estima la memoria de un modelo en bytes.
+
+    Cuenta de forma exacta los arreglos de NumPy (capa de celdas, ocupación,
+    tablas de ruteo y arreglos del motor vectorizado) y de forma aproximada
+    (tamaño superficial) los agentes y el grafo de la ciudad.
+
+    Args:
+        model (CityModel): Modelo.
+
+    Returns:
+        int: Bytes estimados.
+    """
+    arrays = [model.occupancy]
+    arrays += [value for value in vars(model.tiles).values()
+               if isinstance(value, np.ndarray)]
+    if model.engine is not None:
+        # El motor usa las tablas del Router sin copiarlas; ya se cuentan en table_bytes()
+        arrays += [value for value in vars(model.engine).values()
+                   if isinstance(value, np.ndarray) and value is not model.router.next_hop]
+    total = sum(array.nbytes for array in arrays) + model.router.table_bytes()
+
+    for agent in model.schedule.agents:
+        total += sys.getsizeof(agent)
+        # Los coches usan __slots__; pedir vars() les crearía un diccionario
+        if not hasattr(type(agent), "__slots__"):
+            total += sys.getsizeof(vars(agent))
+    graph = model.city_graph
+    total += sum(sys.getsizeof(neighbors) for neighbors in graph.adj.values())
+    total += graph.number_of_edges() * sys.getsizeof({})
+    return total
+
+
+class Session:
+    """
+    Estado de una simulación: el modelo y lo que el servidor guarda para su cliente.
+
+    Args:
+        model (CityModel): Modelo de la sesión.
+        clock (callable): Reloj usado para medir la inactividad.
+    """
+
+    def __init__(self, model, clock=time.monotonic):
+        self.model = model
+        self.replay = None
+        self.current_step = 0
+        self.delta_tracker = DeltaTracker()
+        self.static_layers = StaticLayers(model.tiles)
+        self.memory = model_memory(model)
+        self.created = clock()
+        self.last_used = self.created
+        # Evita que dos hilos avancen el modelo al mismo tiempo
+        self.lock = threading.Lock()
+        self.prefetcher = None
+
+    def start_prefetch(self, depth):
+        """
+        Empieza a avanzar el modelo por adelantado en un hilo aparte.
+
+        Args:
+            depth (int): Número máximo de pasos por delante del cliente más lento.
+        """
+        if self.prefetcher is None:
+            self.prefetcher = Prefetcher(self, depth)
+
+    def close(self):
+        """
+        Libera los recursos de la sesión cuando sale del registro.
+        """
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+
+    def describe(self, now):
+        """
+        Resume la sesión y actualiza su memoria estimada, que cambia con el
+        número de coches. Toma el candado de la sesión, porque otro hilo
+        puede estar avanzando el modelo.
+
+        Args:
+            now (float): Hora actual según el reloj del registro.
+
+        Returns:
+            dict: Paso actual, coches, segundos sin usarse y memoria estimada.
+        """
+        with self.lock:
+            self.memory = model_memory(self.model)
+            cars = self.model.car_counter
+        return {
+            "step": self.current_step,
+            "prefetch": self.prefetcher.depth if self.prefetcher else 0,
+            "cars": cars,
+            "idle_s": now - self.last_used,
+            "memory_bytes": self.memory
+        }
+
+
+class ReplaySession:
+    """
+    Sesión que reproduce una trayectoria grabada en lugar de simular.
+
+    Tiene los mismos atributos que Session, pero sin modelo: los coches y
+    semáforos de cada paso se leen del archivo. El lector guarda el último
+    paso reconstruido, así que se usa siempre con el candado de la sesión.
+
+    Args:
+        reader (TrajectoryReader): Trayectoria abierta.
+        clock (callable): Reloj usado para medir la inactividad.
+    """
+
+    def __init__(self, reader, clock=time.monotonic):
+        self.model = None
+        self.replay = reader
+        self.current_step = reader.first_step
+        self.static_layers = StaticLayers(reader.tiles)
+        self.memory = len(reader.buffer)
+        self.created = clock()
+        self.last_used = self.created
+        self.lock = threading.Lock()
+        self.prefetcher = None
+
+    def advance(self):
+        """
+        Pasa al siguiente paso grabado, sin pasar del último.
+
+        Returns:
+            int: Paso actual.
+        """
+        with self.lock:
+            self.current_step = min(self.current_step + 1, self.replay.last_step)
+            return self.current_step
+
+    def describe(self, now):
+        return {
+            "step": self.current_step,
+            "prefetch": 0,
+            "replay_steps": len(self.replay),
+            "idle_s": now - self.last_used,
+            "memory_bytes": self.memory
+        }
+
+    def close(self):
+        # Espera a que termine la lectura en curso antes de cerrar el archivo
+        with self.lock:
+            self.replay.close()
+
+
+class SessionRegistry:
+    """
+    Sesiones vivas ordenadas de la menos a la más recientemente usada.
+
+    Args:
+        max_sessions (int): Número máximo de modelos vivos. Al crear uno más
+            se descarta el menos recientemente usado.
+        idle_timeout (float): Segundos sin usarse tras los que se elimina una
+            sesión. None para no eliminarlas nunca.
+        max_memory (int): Memoria estimada máxima de todas las sesiones en
+            bytes. None para no limitarla.
+        clock (callable): Reloj usado para medir la inactividad.
+    """
+
+    def __init__(self, max_sessions=16, idle_timeout=600, max_memory=None, clock=time.monotonic):
+        if max_sessions < 1:
+            raise ValueError("Debe haber al menos una sesión.")
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_memory = max_memory
+        self.clock = clock
+        self.sessions = OrderedDict()
+        # Ids en el orden en que se crearon sus sesiones
+        self.creation_order = []
+        # Última sesión creada que sigue viva, para los clientes que no mandan un id
+        self.default_id = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def create(self, model):
+        """
+        Registra un modelo nuevo y descarta las sesiones que sobren.
+
+        Args:
+            model (CityModel): Modelo de la sesión.
+
+        Returns:
+            str: Id de la sesión.
+        """
+        return self.add(Session(model, self.clock))
+
+    def add(self, session):
+        """
+        Registra una sesión ya creada (Session o ReplaySession) y descarta las que sobren.
+
+        Args:
+            session: Sesión.
+
+        Returns:
+            str: Id de la sesión.
+        """
+        session_id = secrets.token_hex(8)
+        with self.lock:
+            self.sessions[session_id] = session
+            self.creation_order.append(session_id)
+            self.default_id = session_id
+            self.evict()
+        return session_id
+
+    def get(self, session_id=None):
+        """
+        Obtiene una sesión y la marca como usada.
+
+        Args:
+            session_id (str): Id de la sesión. Si es None se usa la última creada.
+
+        Returns:
+            Session: La sesión, o None si no existe o ya se eliminó.
+        """
+        with self.lock:
+            self.evict()
+            session_id = session_id or self.default_id
+            session = self.sessions.get(session_id)
+            if session is not None:
+                session.last_used = self.clock()
+                self.sessions.move_to_end(session_id)
+            return session
+
+    def remove(self, session_id):
+        """
+        Elimina una sesión.
+
+        Args:
+            session_id (str): Id de la sesión.
+
+        Returns:
+            bool: True si la sesión existía.
+        """
+        with self.lock:
+            return self.discard(session_id)
+
+    def discard(self, session_id):
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return False
+        self.creation_order.remove(session_id)
+        if session_id == self.default_id:
+            # Los clientes sin id pasan a la sesión creada más recientemente que sigue viva
+            self.default_id = self.creation_order[-1] if self.creation_order else None
+        session.close()
+        return True
+
+    def total_memory(self):
+        return sum(session.memory for session in self.sessions.values())
+
+    def evict(self):
+        """
+        Elimina las sesiones inactivas y, empezando por la menos recientemente
+        usada, las que excedan el número máximo de sesiones o de memoria. La
+        sesión más reciente nunca se elimina por memoria. Se llama con el
+        candado tomado.
+        """
+        if self.idle_timeout is not None:
+            now = self.clock()
+            for session_id in [session_id for session_id, session in self.sessions.items()
+                               if now - session.last_used > self.idle_timeout]:
+                self.discard(session_id)
+
+        while len(self.sessions) > self.max_sessions:
+            self.discard(next(iter(self.sessions)))
+        if self.max_memory is not None:
+            while len(self.sessions) > 1 and self.total_memory() > self.max_memory:
+                self.discard(next(iter(self.sessions)))
+
+    def describe(self):
+        """
+        Resume todas las sesiones vivas.
+
+        Returns:
+            dict: Límites, memoria total y resumen de cada sesión.
+        """
+        with self.lock:
+            self.evict()
+            now = self.clock()
+            sessions = list(self.sessions.items())
+        # Sin el candado del registro: describir una sesión espera a que termine su paso en curso
+        sessions = {session_id: session.describe(now) for session_id, session in sessions}
+        return {
+            "max_sessions": self.max_sessions,
+            "idle_timeout_s": self.idle_timeout,
+            "memory_bytes": sum(session["memory_bytes"] for session in sessions.values()),
+            "sessions": sessions
+        }
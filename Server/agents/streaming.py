@@ -0,0 +1,131 @@
+"""
+Avance de sesiones en segundo plano para enviar cuadros por WebSocket.
+
+Mientras una sesión tiene suscriptores, una tarea de asyncio la avanza a una
+frecuencia fija y reparte el cuadro de cada paso (el mismo formato que la
+ruta /step) a todos ellos. El paso del modelo corre en un hilo aparte para
+no bloquear el ciclo de eventos.
+"""
+
+import asyncio
+import json
+from .frames import DeltaTracker
+
+DEFAULT_TICK_RATE = 10
+MAX_TICK_RATE = 60
+
+# Cuadros que se guardan por suscriptor antes de considerarlo atrasado
+SUBSCRIBER_QUEUE_SIZE = 8
+
+
+class Subscriber:
+    """
+    Cola de mensajes de un cliente conectado.
+
+    Un suscriptor nuevo, o uno que se atrasó y perdió cuadros, recibe un
+    cuadro completo en el siguiente paso y después solo cambios.
+    """
+
+    def __init__(self):
+        self.queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        self.needs_full = True
+
+    def push(self, message):
+        """
+        Agrega un mensaje a la cola. Si la cola está llena se vacía y el
+        suscriptor pasa a necesitar un cuadro completo.
+
+        Args:
+            message (str): Cuadro en JSON, o None para terminar la conexión.
+        """
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.needs_full = True
+            if message is None:
+                self.queue.put_nowait(None)
+
+
+class SessionStream:
+    """
+    Avanza una sesión a una frecuencia fija mientras tenga suscriptores.
+
+    Args:
+        registry (SessionRegistry): Registro de sesiones.
+        session_id (str): Id de la sesión.
+        tick_rate (float): Pasos por segundo.
+    """
+
+    def __init__(self, registry, session_id, tick_rate=DEFAULT_TICK_RATE):
+        self.registry = registry
+        self.session_id = session_id
+        self.tick_rate = min(max(tick_rate, 0.1), MAX_TICK_RATE)
+        self.subscribers = set()
+        self.tracker = DeltaTracker()
+        self.task = None
+
+    def subscribe(self):
+        """
+        Agrega un suscriptor y arranca la tarea si no estaba corriendo.
+
+        Returns:
+            Subscriber: Suscriptor nuevo.
+        """
+        subscriber = Subscriber()
+        self.subscribers.add(subscriber)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    def advance(self, session, needs_full):
+        """
+        Avanza la sesión un paso. Se ejecuta en un hilo aparte.
+
+        Args:
+            session (Session): Sesión.
+            needs_full (bool): Si algún suscriptor necesita el cuadro completo.
+
+        Returns:
+            tuple: Cuadro de cambios y cuadro completo (o None) en JSON.
+        """
+        with session.lock:
+            session.model.step()
+            session.current_step += 1
+            delta = json.dumps(self.tracker.frame(session.model))
+            full = json.dumps(DeltaTracker().frame(
+                session.model, full=True)) if needs_full else None
+        return delta, full
+
+    async def run(self):
+        """
+        Ciclo de la tarea: avanza la sesión y reparte los cuadros hasta que no
+        queden suscriptores o la sesión se elimine del registro.
+        """
+        loop = asyncio.get_running_loop()
+        interval = 1 / self.tick_rate
+        next_tick = loop.time()
+        while self.subscribers:
+            session = self.registry.get(self.session_id)
+            if session is None:
+                for subscriber in list(self.subscribers):
+                    subscriber.push(None)
+                break
+
+            subscribers = list(self.subscribers)
+            delta, full = await asyncio.to_thread(
+                self.advance, session, any(subscriber.needs_full for subscriber in subscribers))
+            for subscriber in subscribers:
+                if subscriber.needs_full:
+                    subscriber.needs_full = False
+                    subscriber.push(full)
+                else:
+                    subscriber.push(delta)
+
+            # Si un paso tarda más que el intervalo no se acumulan pasos atrasados
+            next_tick = max(next_tick + interval, loop.time())
+            await asyncio.sleep(next_tick - loop.time())
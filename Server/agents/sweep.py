@@ -0,0 +1,237 @@
+"""
+Barrido de parámetros de CityModel en paralelo.
+
+Cada combinación de parámetros se ejecuta en un proceso del pool (un modelo
+por proceso a la vez) y los resultados se escriben en cuanto terminan, como
+una línea JSON por combinación.
+
+Con --warm-start N, cada combinación parte del estado del paso N de un
+modelo con los mismos parámetros salvo los tiempos de los semáforos. Ese
+paso de inicio se simula una sola vez por grupo de combinaciones en todo el
+barrido, y cada combinación lo copia con CityModel.fork.
+
+Uso:
+    python -m agents.sweep --steps 2000 --seed 1 2 3 --light-S 5 7 9 --light-s 5 7 9 \\
+        --spawn-interval 1 2 --lane-change-cooldown 2 4 --output barrido.jsonl
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from .model import CityModel
+from .run import run_simulation
+
+
+def expand_grid(grid):
+    """
+    Expande una malla de parámetros en todas sus combinaciones.
+
+    Args:
+        grid (dict): Diccionario nombre -> lista de valores.
+
+    Returns:
+        list: Un diccionario de parámetros por combinación.
+    """
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def split_params(params):
+    """
+    Separa los parámetros de una combinación en los argumentos de CityModel
+    y los tiempos de los semáforos.
+
+    Args:
+        params (dict): Parámetros de la combinación.
+
+    Returns:
+        tuple: Argumentos de CityModel sin los tiempos de los semáforos, y
+        tiempos de los semáforos por carácter ("S", "s").
+    """
+    model_args = {key: value for key, value in params.items()
+                  if not key.startswith("light_")}
+    light_timings = {key[len("light_"):]: value for key, value in params.items()
+                     if key.startswith("light_")}
+    return model_args, light_timings
+
+
+def group_points(points):
+    """
+    Agrupa las combinaciones que solo difieren en los tiempos de los
+    semáforos, que son las que comparten el paso de inicio.
+
+    Args:
+        points (list): Parámetros de cada combinación.
+
+    Returns:
+        dict: Argumentos de CityModel en JSON -> combinaciones del grupo.
+    """
+    groups = {}
+    for params in points:
+        model_args, _ = split_params(params)
+        groups.setdefault(json.dumps(model_args, sort_keys=True), []).append(params)
+    return groups
+
+
+def warm_start_snapshot(model_args, backend, warm_start):
+    """
+    Avanza un modelo hasta el paso de inicio y guarda su estado. Se ejecuta
+    una vez por grupo de combinaciones (ver run_sweep), y el modelo no se
+    conserva: solo el estado, que se manda a cada combinación del grupo.
+
+    Args:
+        model_args (dict): Argumentos de CityModel sin los tiempos de los semáforos.
+        backend (str): Motor de los coches.
+        warm_start (int): Paso de inicio.
+
+    Returns:
+        dict: Estado guardado con snapshot().
+    """
+    model = CityModel(backend=backend, verbose=False, **model_args)
+    for _ in range(warm_start):
+        model.step()
+    return model.snapshot()
+
+
+def run_point(params, steps, backend="agents", warm_start=0, snapshot=None):
+    """
+    Ejecuta una combinación de parámetros. Se llama dentro de un proceso del pool.
+
+    Args:
+        params (dict): Parámetros de la combinación (city_file, seed,
+            spawn_interval, lane_change_cooldown, light_S, light_s).
+        steps (int): Número de pasos a simular.
+        backend (str): Motor de los coches.
+        warm_start (int): Si es mayor que 0, la combinación parte del paso
+            warm_start de un modelo con sus mismos parámetros salvo los semáforos.
+        snapshot (dict): Estado de ese modelo en el paso warm_start, de
+            warm_start_snapshot. Si es None y warm_start es mayor que 0, se simula aquí.
+
+    Returns:
+        dict: Parámetros de la combinación y resumen de la ejecución, o el error si falló.
+    """
+    model_args, light_timings = split_params(params)
+    # Los tiempos de los semáforos solo llegan a CityModel si no hay paso de inicio; si no, van a fork() y al resumen
+    run_args = dict(model_args, light_timings=light_timings) if light_timings else model_args
+
+    try:
+        model = None
+        if warm_start > 0:
+            if snapshot is None:
+                snapshot = warm_start_snapshot(model_args, backend, warm_start)
+            # El modelo base solo aporta el mapa, el grafo y el Router; fork() le pone el estado guardado
+            base = CityModel(backend=backend, verbose=False, **model_args)
+            model = base.fork(snapshot, light_timings)
+        summary = run_simulation(steps, model=model, backend=backend, **run_args)
+    except Exception:
+        return {"params": params, "error": traceback.format_exc()}
+    if warm_start > 0:
+        # total_arrivals incluye las llegadas antes del paso de inicio
+        summary["warm_start"] = warm_start
+    return {"params": params, "summary": summary}
+
+
+def run_sweep(grid, steps, workers=None, backend="agents", warm_start=0):
+    """
+    Ejecuta todas las combinaciones de la malla en un ProcessPoolExecutor.
+
+    Con warm_start, las combinaciones que solo difieren en los tiempos de
+    los semáforos forman un grupo: primero se simula en el pool el paso de
+    inicio de cada grupo, una sola vez, y cuando termina se reparten las
+    combinaciones del grupo entre los procesos junto con el estado guardado.
+
+    Args:
+        grid (dict): Diccionario nombre -> lista de valores.
+        steps (int): Número de pasos por combinación.
+        workers (int): Número de procesos. Por defecto, uno por núcleo.
+        backend (str): Motor de los coches.
+        warm_start (int): Paso del que parten las combinaciones (ver run_point).
+
+    Yields:
+        dict: Resultado de cada combinación, en el orden en que terminan.
+    """
+    points = expand_grid(grid)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        if warm_start > 0:
+            # Futuro del paso de inicio -> combinaciones de su grupo
+            prefixes = {}
+            for group in group_points(points).values():
+                model_args, _ = split_params(group[0])
+                prefixes[executor.submit(warm_start_snapshot, model_args, backend, warm_start)] = group
+            pending = set(prefixes)
+        else:
+            prefixes = {}
+            pending = {executor.submit(run_point, params, steps, backend) for params in points}
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                group = prefixes.pop(future, None)
+                if group is None:
+                    yield future.result()
+                elif future.exception() is not None:
+                    error = "".join(traceback.format_exception(future.exception()))
+                    for params in group:
+                        yield {"params": params, "error": error}
+                else:
+                    pending |= {executor.submit(run_point, params, steps, backend, warm_start, future.result())
+                                for params in group}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Barrido de parámetros de la simulación de tráfico.")
+    parser.add_argument("--steps", type=int, default=1000,
+                        help="Número de pasos por combinación.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Número de procesos en paralelo.")
+    parser.add_argument("--backend", choices=("agents", "vector"), default="agents",
+                        help="Motor de los coches.")
+    parser.add_argument("--map", dest="city_file", nargs="+", default=["2023_base.txt"],
+                        help="Archivos de mapa.")
+    parser.add_argument("--seed", type=int, nargs="+", default=[0],
+                        help="Semillas.")
+    parser.add_argument("--spawn-interval", type=int, nargs="+", default=[1],
+                        help="Intervalos de aparición de coches.")
+    parser.add_argument("--lane-change-cooldown", type=int, nargs="+", default=[4],
+                        help="Tiempos de espera entre cambios de carril.")
+    parser.add_argument("--light-S", dest="light_S", type=int, nargs="+", default=None,
+                        help="Tiempos de cambio de los semáforos 'S' (inician en rojo).")
+    parser.add_argument("--light-s", dest="light_s", type=int, nargs="+", default=None,
+                        help="Tiempos de cambio de los semáforos 's' (inician en verde).")
+    parser.add_argument("--warm-start", type=int, default=0,
+                        help="Paso del que parten las combinaciones; solo los semáforos cambian desde ahí.")
+    parser.add_argument("--output", default=None,
+                        help="Archivo JSON Lines de salida. Si no se da, se escribe en la salida estándar.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    grid = {
+        "city_file": args.city_file,
+        "seed": args.seed,
+        "spawn_interval": args.spawn_interval,
+        "lane_change_cooldown": args.lane_change_cooldown
+    }
+    if args.light_S:
+        grid["light_S"] = args.light_S
+    if args.light_s:
+        grid["light_s"] = args.light_s
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for result in run_sweep(grid, args.steps, args.workers, args.backend, args.warm_start):
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
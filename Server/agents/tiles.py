@@ -0,0 +1,248 @@
+import numpy as np
+
+# Tipos de celda del mapa
+EMPTY = 0
+ROAD = 1
+TRAFFIC_LIGHT = 2
+OBSTACLE = 3
+DESTINATION = 4
+
+# Bits de las direcciones permitidas en una celda de carretera
+DIRECTION_BITS = {'Up': 1, 'Down': 2, 'Left': 4, 'Right': 8}
+
+# Caracteres de carretera del mapa
+ROAD_SYMBOLS = ["v", "^", ">", "<", "L", "Q", "A", "F"]
+
+# Desplazamiento de cada dirección, en el orden en que se agregan las aristas
+DIRECTION_VECTORS = {'Up': (0, 1), 'Down': (0, -1), 'Left': (-1, 0), 'Right': (1, 0)}
+OPPOSITE_DIRECTIONS = {'Up': 'Down', 'Down': 'Up', 'Left': 'Right', 'Right': 'Left'}
+# Direcciones que se combinan con cada dirección para los cambios de carril en diagonal
+LANE_CHANGE_DIRECTIONS = {'Right': ('Up', 'Down'), 'Up': ('Right', 'Left'),
+                          'Left': ('Up', 'Down'), 'Down': ('Right', 'Left')}
+
+
+class TileLayer:
+    """
+    Capa estática del mapa guardada en arreglos de NumPy de forma (width, height).
+
+    Las celdas del mapa no cambian después de cargarlo, así que las preguntas
+    "¿es carretera?", "¿hay un semáforo?" o "¿hacia dónde se puede avanzar?"
+    se responden con una lectura de arreglo en lugar de recorrer el contenido
+    de la celda en el MultiGrid.
+
+    Args:
+        lines (list): Renglones del archivo del mapa.
+        map_data (dict): Diccionario que mapea cada carácter del mapa con su significado.
+    """
+
+    def __init__(self, lines, map_data):
+        rows = [line.rstrip('\n') for line in lines]
+        self.width = len(lines[0]) - 1
+        self.height = len(lines)
+
+        shape = (self.width, self.height)
+        self.symbols = np.full(shape, ' ', dtype='<U1')
+        self.kind = np.zeros(shape, dtype=np.uint8)
+        self.directions = np.zeros(shape, dtype=np.uint8)
+        self.light_index = np.full(shape, -1, dtype=np.int32)
+
+        light_count = 0
+        for r, row in enumerate(rows):
+            y = self.height - r - 1
+            for x, symbol in enumerate(row[:self.width]):
+                self.symbols[x, y] = symbol
+                if symbol in ROAD_SYMBOLS:
+                    self.kind[x, y] = ROAD
+                    self.directions[x, y] = direction_mask(map_data[symbol])
+                elif symbol in ["S", "s"]:
+                    # Los índices siguen el mismo orden en que el modelo crea los semáforos
+                    self.kind[x, y] = TRAFFIC_LIGHT
+                    self.light_index[x, y] = light_count
+                    light_count += 1
+                elif symbol == "#":
+                    self.kind[x, y] = OBSTACLE
+                elif symbol == "D":
+                    self.kind[x, y] = DESTINATION
+
+        self.walkable = np.isin(self.kind, (ROAD, TRAFFIC_LIGHT, DESTINATION))
+
+    @classmethod
+    def from_arrays(cls, symbols, kind, directions, light_index):
+        """
+        Crea la capa a partir de arreglos ya calculados, por ejemplo los de un mapa compilado.
+
+        Args:
+            symbols (np.ndarray): Carácter de cada celda.
+            kind (np.ndarray): Tipo de cada celda.
+            directions (np.ndarray): Máscara de direcciones de cada celda.
+            light_index (np.ndarray): Índice del semáforo de cada celda, o -1.
+
+        Returns:
+            TileLayer: Capa de celdas.
+        """
+        tiles = cls.__new__(cls)
+        tiles.width, tiles.height = symbols.shape
+        tiles.symbols = symbols
+        tiles.kind = kind
+        tiles.directions = directions
+        tiles.light_index = light_index
+        tiles.walkable = np.isin(kind, (ROAD, TRAFFIC_LIGHT, DESTINATION))
+        return tiles
+
+    def edges(self, map_data, light_states):
+        """
+        Construye las aristas del grafo de la ciudad a partir de los arreglos
+        del mapa, con unas cuantas operaciones vectorizadas por dirección.
+
+        Las aristas son las mismas, con los mismos pesos y en el mismo orden,
+        que si se recorriera cada celda (x, y) en orden:
+
+        - Destino: una arista de peso 1 desde cada carretera vecina.
+        - Carretera: por cada dirección permitida, una arista de peso 1 hacia
+          la celda siguiente y dos de peso 2 hacia las diagonales de cambio de
+          carril, si son transitables y no son semáforos.
+        - Semáforo: con cada carretera vecina, una arista hacia el semáforo si
+          la carretera apunta hacia él (peso 5 si el semáforo empieza en
+          verde, si no 1) o una de peso 1 desde el semáforo en otro caso.
+
+        Args:
+            map_data (dict): Diccionario del mapa, para el orden de las direcciones de cada carácter.
+            light_states (list): Estado inicial de cada semáforo, por índice.
+
+        Returns:
+            tuple: Arreglos de origen, destino (índices planos x * height + y)
+            y peso de cada arista.
+        """
+        kind = np.pad(self.kind, 1, constant_values=EMPTY)
+        directions = np.pad(self.directions, 1)
+        target_ok = np.isin(kind, (ROAD, DESTINATION))
+        light_weights = np.where(np.asarray(light_states, dtype=bool), 5, 1)
+        # Cada arista se ordena por la celda que la agrega y su posición dentro de ella
+        orders, sources, targets, weights = [], [], [], []
+
+        def add(xs, ys, rank, source, target, weight):
+            orders.append((xs * self.height + ys) * 16 + rank)
+            sources.append(source[0] * self.height + source[1])
+            targets.append(target[0] * self.height + target[1])
+            weights.append(np.broadcast_to(weight, xs.shape))
+
+        def neighbors(xs, ys, dx, dy):
+            # Índices en los arreglos con orilla
+            return xs + dx + 1, ys + dy + 1
+
+        xs, ys = np.nonzero(self.kind == DESTINATION)
+        for rank, (dx, dy) in enumerate(DIRECTION_VECTORS.values()):
+            mask = kind[neighbors(xs, ys, dx, dy)] == ROAD
+            cx, cy = xs[mask], ys[mask]
+            add(cx, cy, rank, (cx + dx, cy + dy), (cx, cy), 1)
+
+        for symbol in ROAD_SYMBOLS:
+            if symbol not in map_data:
+                continue
+            xs, ys = np.nonzero(self.symbols == symbol)
+            road_directions = map_data[symbol] if isinstance(map_data[symbol], list) else [map_data[symbol]]
+            for k, direction in enumerate(road_directions):
+                dx, dy = DIRECTION_VECTORS[direction]
+                mask = target_ok[neighbors(xs, ys, dx, dy)]
+                cx, cy = xs[mask], ys[mask]
+                add(cx, cy, 3 * k, (cx, cy), (cx + dx, cy + dy), 1)
+                for j, side in enumerate(LANE_CHANGE_DIRECTIONS[direction]):
+                    sx, sy = DIRECTION_VECTORS[side]
+                    diagonal = target_ok[neighbors(cx, cy, dx + sx, dy + sy)]
+                    add(cx[diagonal], cy[diagonal], 3 * k + 1 + j, (cx[diagonal], cy[diagonal]),
+                        (cx[diagonal] + dx + sx, cy[diagonal] + dy + sy), 2)
+
+        xs, ys = np.nonzero(self.kind == TRAFFIC_LIGHT)
+        for rank, (direction, (dx, dy)) in enumerate(DIRECTION_VECTORS.items()):
+            road = neighbors(xs, ys, dx, dy)
+            mask = kind[road] == ROAD
+            aligned = directions[road] == DIRECTION_BITS[OPPOSITE_DIRECTIONS[direction]]
+            incoming = mask & aligned
+            cx, cy = xs[incoming], ys[incoming]
+            add(cx, cy, rank, (cx + dx, cy + dy), (cx, cy), light_weights[self.light_index[cx, cy]])
+            outgoing = mask & ~aligned
+            cx, cy = xs[outgoing], ys[outgoing]
+            add(cx, cy, rank, (cx, cy), (cx + dx, cy + dy), 1)
+
+        orders = np.concatenate(orders)
+        sources, targets, weights = (np.concatenate(array)[np.argsort(orders, kind="stable")]
+                                     for array in (sources, targets, weights))
+        # Una arista repetida conserva su primera posición y su último peso, como en add_edge
+        pairs = sources.astype(np.int64) * self.width * self.height + targets
+        _, first = np.unique(pairs, return_index=True)
+        last = len(pairs) - 1 - np.unique(pairs[::-1], return_index=True)[1]
+        first_order = np.argsort(first)
+        return sources[first[first_order]], targets[first[first_order]], weights[last[first_order]]
+
+    def in_bounds(self, x, y):
+        """
+        Verifica si la posición está dentro del mapa.
+
+        Args:
+            x (int): Coordenada x.
+            y (int): Coordenada y.
+
+        Returns:
+            bool: True si la posición está dentro del mapa.
+        """
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def is_walkable(self, x, y):
+        """
+        Verifica si un coche puede ocupar la posición (carretera, semáforo o destino).
+
+        Args:
+            x (int): Coordenada x.
+            y (int): Coordenada y.
+
+        Returns:
+            bool: True si la posición es transitable.
+        """
+        return 0 <= x < self.width and 0 <= y < self.height and bool(self.walkable[x, y])
+
+    def kind_at(self, x, y):
+        """
+        Obtiene el tipo de celda en la posición dada.
+
+        Args:
+            x (int): Coordenada x.
+            y (int): Coordenada y.
+
+        Returns:
+            int: Tipo de celda, o EMPTY si la posición está fuera del mapa.
+        """
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return int(self.kind[x, y])
+        return EMPTY
+
+    def light_at(self, x, y):
+        """
+        Obtiene el índice del semáforo en la posición dada.
+
+        Args:
+            x (int): Coordenada x.
+            y (int): Coordenada y.
+
+        Returns:
+            int: Índice en la lista de semáforos del modelo, o -1 si no hay semáforo.
+        """
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return int(self.light_index[x, y])
+        return -1
+
+
+def direction_mask(direction):
+    """
+    Convierte una dirección (o lista de direcciones) del diccionario del mapa en una máscara de bits.
+
+    Args:
+        direction (str | list): Dirección o direcciones permitidas.
+
+    Returns:
+        int: Máscara de bits con las direcciones permitidas.
+    """
+    directions = direction if isinstance(direction, list) else [direction]
+    mask = 0
+    for name in directions:
+        mask |= DIRECTION_BITS[name]
+    return mask
@@ -0,0 +1,266 @@
+"""
+Grabación de trayectorias en un archivo binario y su reproducción sin modelo.
+
+Formato del archivo (todo en little-endian):
+
+- Encabezado HEADER: firma, ancho, alto, número de semáforos e intervalo
+  entre cuadros clave, seguido del texto del mapa (un renglón por línea).
+- Un bloque por paso grabado: encabezado BLOCK (paso, tipo, bytes de
+  semáforos y número de registros) y después los registros de ancho fijo de
+  los coches que aparecieron (SPAWN_DTYPE), los que se movieron (MOVE_DTYPE)
+  y los números de los que llegaron (int32), y los estados de los semáforos
+  empaquetados en bits. Cada keyframe_interval pasos el bloque es un cuadro
+  clave con todos los coches en lugar de los cambios.
+- Índice de pasos (INDEX_DTYPE) con la posición de cada bloque en el archivo.
+- Pie FOOTER con la posición del índice y el número de bloques.
+
+El lector abre el archivo con mmap y, para ir a un paso, parte del cuadro
+clave anterior y aplica los cambios; avanzar de un paso al siguiente solo
+aplica un bloque.
+"""
+
+import json
+import mmap
+import os
+import struct
+import numpy as np
+from .frames import car_record
+from .model import CITY_FILES_DIR
+from .tiles import TileLayer
+
+HEADER = struct.Struct("<4sHHHI")
+HEADER_MAGIC = b"TRJ1"
+BLOCK = struct.Struct("<iBBHIII")
+FOOTER = struct.Struct("<qI4s")
+FOOTER_MAGIC = b"TEND"
+DELTA_BLOCK = 0
+KEYFRAME_BLOCK = 1
+
+SPAWN_DTYPE = np.dtype([("number", "<i4"), ("spawn_step", "<i4"), ("origin_x", "<i2"), ("origin_y", "<i2"),
+                        ("x", "<i2"), ("y", "<i2"), ("dest_x", "<i2"), ("dest_y", "<i2")])
+MOVE_DTYPE = np.dtype([("number", "<i4"), ("x", "<i2"), ("y", "<i2")])
+INDEX_DTYPE = np.dtype(
+    [("offset", "<i8"), ("step", "<i4"), ("kind", "<i4")])
+
+
+class TrajectoryRecorder:
+    """
+    Agrega al archivo el estado del modelo cada vez que se llama record().
+
+    El id de cada coche en la reproducción se arma con el paso y la posición
+    en que apareció (CityModel.car_spawns), igual que el id que manda el
+    servidor en vivo, aunque la grabación empiece a media corrida.
+
+    Args:
+        path (str): Archivo de salida.
+        model (CityModel): Modelo a grabar.
+        keyframe_interval (int): Cada cuántos bloques se graba un cuadro clave.
+    """
+
+    def __init__(self, path, model, keyframe_interval=100):
+        self.model = model
+        self.keyframe_interval = keyframe_interval
+        self.file = open(path, "wb")
+        self.index = []
+
+        # Coches del último bloque, ordenados por número
+        self.numbers = np.empty(0, dtype=np.int64)
+        self.positions = np.empty((0, 2), dtype=np.int64)
+
+        tiles = model.tiles
+        lines = ["".join(tiles.symbols[:, y]) + "\n" for y in range(tiles.height - 1, -1, -1)]
+        self.file.write(HEADER.pack(HEADER_MAGIC, tiles.width, tiles.height,
+                                    len(model.traffic_lights), keyframe_interval))
+        self.file.write("".join(lines).encode("ascii"))
+
+    def record(self):
+        """
+        Graba el estado actual del modelo como un bloque.
+        """
+        step = self.model.step_count
+        numbers, positions, destinations = self.model.car_arrays()
+        spawn_steps, origins = self.model.car_spawns()
+        order = np.argsort(numbers, kind="stable")
+        numbers, positions, destinations = numbers[order], positions[order], destinations[order]
+        spawn_steps, origins = spawn_steps[order], origins[order]
+
+        known = np.isin(numbers, self.numbers)
+        previous = np.searchsorted(self.numbers, numbers[known])
+
+        keyframe = len(self.index) % self.keyframe_interval == 0
+        spawned = np.ones(len(numbers), dtype=bool) if keyframe else ~known
+        spawns = np.empty(int(spawned.sum()), dtype=SPAWN_DTYPE)
+        spawns["number"] = numbers[spawned]
+        spawns["spawn_step"] = spawn_steps[spawned]
+        spawns["origin_x"], spawns["origin_y"] = origins[spawned].T
+        spawns["x"], spawns["y"] = positions[spawned].T
+        spawns["dest_x"], spawns["dest_y"] = destinations[spawned].T
+
+        if keyframe:
+            moves = np.empty(0, dtype=MOVE_DTYPE)
+            arrived = np.empty(0, dtype="<i4")
+        else:
+            moved = (positions[known] != self.positions[previous]).any(axis=1)
+            moves = np.empty(int(moved.sum()), dtype=MOVE_DTYPE)
+            moves["number"] = numbers[known][moved]
+            moves["x"], moves["y"] = positions[known][moved].T
+            arrived = self.numbers[~np.isin(self.numbers, numbers)].astype("<i4")
+
+        lights = np.packbits(np.array([light.state for light in self.model.traffic_lights], dtype=bool),
+                             bitorder="little")
+
+        self.index.append((self.file.tell(), step,
+                          KEYFRAME_BLOCK if keyframe else DELTA_BLOCK))
+        self.file.write(BLOCK.pack(step, KEYFRAME_BLOCK if keyframe else DELTA_BLOCK, 0,
+                                   len(lights), len(spawns), len(moves), len(arrived)))
+        for array in (spawns, moves, arrived, lights):
+            self.file.write(array.tobytes())
+
+        self.numbers, self.positions = numbers, positions
+
+    def close(self):
+        """
+        Escribe el índice y el pie y cierra el archivo.
+        """
+        if self.file.closed:
+            return
+        index_offset = self.file.tell()
+        self.file.write(np.array(self.index, dtype=INDEX_DTYPE).tobytes())
+        self.file.write(FOOTER.pack(index_offset, len(self.index), FOOTER_MAGIC))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TrajectoryReader:
+    """
+    Lee un archivo de trayectorias con mmap y reconstruye el estado de cualquier paso.
+
+    El lector guarda el último paso reconstruido (position, cars, lights),
+    así que no se debe usar desde varios hilos a la vez sin un candado.
+
+    Args:
+        path (str): Archivo grabado con TrajectoryRecorder.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.width, self.height, self.light_count, self.keyframe_interval = HEADER.unpack_from(
+            self.buffer)
+        index_offset, count, footer_magic = FOOTER.unpack_from(
+            self.buffer, len(self.buffer) - FOOTER.size)
+        if magic != HEADER_MAGIC or footer_magic != FOOTER_MAGIC:
+            self.close()
+            raise ValueError(f"{path} no es un archivo de trayectorias completo.")
+
+        map_size = (self.width + 1) * self.height
+        lines = self.buffer[HEADER.size:HEADER.size + map_size].decode("ascii").splitlines(keepends=True)
+        with open(os.path.join(CITY_FILES_DIR, "mapDictionary.json")) as map_dictionary:
+            self.tiles = TileLayer(lines, json.load(map_dictionary))
+
+        lights = sorted(zip(self.tiles.light_index[self.tiles.light_index >= 0].tolist(),
+                            *np.nonzero(self.tiles.light_index >= 0)))
+        self.light_positions = [(int(x), int(y)) for _, x, y in lights]
+
+        self.index = np.frombuffer(self.buffer, dtype=INDEX_DTYPE, count=count, offset=index_offset)
+        self.steps = self.index["step"]
+        self.position = None
+        self.cars = {}
+        self.lights = np.zeros(self.light_count, dtype=bool)
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def first_step(self):
+        return int(self.steps[0])
+
+    @property
+    def last_step(self):
+        return int(self.steps[-1])
+
+    def apply(self, position):
+        """
+        Aplica el bloque en la posición dada del índice al estado actual.
+
+        Args:
+            position (int): Posición del bloque en el índice.
+        """
+        offset = int(self.index["offset"][position])
+        _, kind, _, light_bytes, spawned, moved, arrived = BLOCK.unpack_from(self.buffer, offset)
+        offset += BLOCK.size
+        spawns = np.frombuffer(self.buffer, dtype=SPAWN_DTYPE, count=spawned, offset=offset)
+        offset += spawns.nbytes
+        moves = np.frombuffer(self.buffer, dtype=MOVE_DTYPE, count=moved, offset=offset)
+        offset += moves.nbytes
+        arrivals = np.frombuffer(self.buffer, dtype="<i4", count=arrived, offset=offset)
+        offset += arrivals.nbytes
+        bits = np.frombuffer(self.buffer, dtype=np.uint8, count=light_bytes, offset=offset)
+
+        if kind == KEYFRAME_BLOCK:
+            self.cars = {}
+        for number in arrivals.tolist():
+            del self.cars[number]
+        for number, x, y in moves.tolist():
+            self.cars[number][3:5] = [x, y]
+        for number, *car in spawns.tolist():
+            self.cars[number] = car
+        self.lights = np.unpackbits(bits, bitorder="little")[
+            :self.light_count].astype(bool)
+        self.position = position
+
+    def seek(self, step):
+        """
+        Reconstruye el estado del último paso grabado que no sea posterior a "step".
+
+        Args:
+            step (int): Paso del modelo.
+        """
+        target = max(int(np.searchsorted(self.steps, step, side="right")) - 1, 0)
+        if self.position is None or target < self.position or \
+                target - self.position > self.keyframe_interval:
+            start = target - target % self.keyframe_interval
+        else:
+            start = self.position + 1
+        for position in range(start, target + 1):
+            self.apply(position)
+
+    def car_records(self, step):
+        """
+        Obtiene los coches de un paso con el mismo formato que /getCars.
+
+        Args:
+            step (int): Paso del modelo.
+
+        Returns:
+            list: Un diccionario por coche.
+        """
+        self.seek(step)
+        return [car_record(f"car_{spawn_step}_{origin_x}_{origin_y}", (x, y), (dest_x, dest_y))
+                for spawn_step, origin_x, origin_y, x, y, dest_x, dest_y in self.cars.values()]
+
+    def light_records(self, step):
+        """
+        Obtiene los semáforos de un paso con el mismo formato que /getTrafficLights.
+
+        Args:
+            step (int): Paso del modelo.
+
+        Returns:
+            list: Un diccionario por semáforo.
+        """
+        self.seek(step)
+        return [{"id": f"tl_{(self.height - z - 1) * self.width + x}", "x": x, "y": 1, "z": z - 1, "state": bool(state)}
+                for (x, z), state in zip(self.light_positions, self.lights.tolist())]
+
+    def close(self):
+        # Los arreglos que apuntan al mmap deben soltarse antes de cerrarlo
+        self.index = self.steps = None
+        self.buffer.close()
+        self.file.close()
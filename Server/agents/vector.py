@@ -0,0 +1,496 @@
+import numpy as np
+from .tiles import DESTINATION
+
+# Códigos de dirección guardados en VectorCarEngine.heading
+NO_HEADING = 0
+HEADING_CODES = {'Up': 1, 'Down': 2, 'Left': 3, 'Right': 4}
+UP, DOWN, LEFT, RIGHT = 1, 2, 3, 4
+
+# Dirección de un movimiento según el signo de (dx + 1) * 3 + (dy + 1), como Car.get_direction
+HEADING_TABLE = np.array([LEFT, LEFT, LEFT, DOWN, NO_HEADING, UP, RIGHT, RIGHT, RIGHT], dtype=np.int8)
+
+# Desplazamiento a la celda de enfrente según el código de dirección
+FRONT_OFFSETS = np.array([(0, 0), (0, 1), (0, -1), (-1, 0), (1, 0)])
+
+# Vecindad de Moore (incluyendo el centro) que cuenta Car.check_for_lane_change
+AREA_OFFSETS = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+
+# Celdas diagonales en el mismo orden que Car.execute_lane_change
+DIAGONALS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+DIAGONAL_OFFSETS = np.array(DIAGONALS)
+
+# Número de coches en la vecindad de la celda de enfrente que provoca un cambio de carril
+VISION_RANGE = 3
+
+# Arreglos paralelos con el estado de cada coche
+CAR_FIELDS = ("car_id", "spawn_step", "origin", "cell", "destination", "path_cursor",
+              "stopped", "time_since_lane_change", "routed", "heading")
+
+
+class VectorCarEngine:
+    """
+    Motor de coches en estructura de arreglos (struct-of-arrays).
+
+    En lugar de un agente Car por coche, todos los coches se guardan en
+    arreglos paralelos de NumPy y cada paso avanza a todos a la vez. Sigue las
+    mismas reglas que Car.move, Car.try_to_move y Car.check_for_lane_change:
+
+    - Un coche que está en su destino se retira del mapa.
+    - Si hay al menos VISION_RANGE coches alrededor de la celda de enfrente y
+      ya pasó el tiempo de espera, el coche cambia a la primera diagonal libre.
+    - Después intenta avanzar a la siguiente celda de su ruta si no hay un
+      coche ni un semáforo en rojo.
+
+    El orden aleatorio de RandomActivation se reproduce con una prioridad
+    aleatoria por coche en cada paso, y los turnos se resuelven por rondas
+    con el mismo resultado que si los coches se movieran uno por uno en ese
+    orden: en cada ronda actúan a la vez todos los coches pendientes que no
+    leen ninguna celda que pueda cambiar un coche pendiente anterior a ellos
+    (ver footprint()), y siempre hay al menos uno, el primero de los
+    pendientes. Cada coche lee la ocupación como estaba en su turno (ver
+    occupied_at()), así que no le afectan los coches posteriores que ya
+    actuaron.
+
+    Args:
+        model (CityModel): Modelo al que pertenece el motor.
+        lane_change_cooldown (int): Pasos mínimos entre dos cambios de carril.
+    """
+
+    def __init__(self, model, lane_change_cooldown=4):
+        self.model = model
+        self.lane_change_cooldown = lane_change_cooldown
+        self.width = model.width
+        self.height = model.height
+        self.rng = np.random.default_rng(model.random.getrandbits(32))
+
+        # Capa estática aplanada con el mismo índice de celda que el Router (x * height + y)
+        tiles = model.tiles
+        self.walkable = tiles.walkable.ravel()
+        self.is_destination = (tiles.kind == DESTINATION).ravel()
+        self.light_index = tiles.light_index.ravel()
+        self.occupancy = model.occupancy.reshape(-1)
+
+        # Estado dinámico de los coches
+        self.car_id = np.empty(0, dtype=np.int64)
+        self.spawn_step = np.empty(0, dtype=np.int32)
+        self.origin = np.empty(0, dtype=np.int32)
+        self.cell = np.empty(0, dtype=np.int32)
+        self.destination = np.empty(0, dtype=np.int32)
+        self.path_cursor = np.empty(0, dtype=np.int32)
+        self.stopped = np.empty(0, dtype=bool)
+        self.time_since_lane_change = np.empty(0, dtype=np.int32)
+        self.routed = np.empty(0, dtype=bool)
+        self.heading = np.empty(0, dtype=np.int8)
+
+        self.pending_spawns = []
+        self.destination_index = {}
+        self.destination_cells = np.empty(0, dtype=np.int32)
+        self.hops = None
+        self.hops_version = None
+
+    def __len__(self):
+        return len(self.cell) + len(self.pending_spawns)
+
+    def load_routes(self):
+        """
+        Toma el arreglo (destinos, celdas) de tablas de siguiente salto del
+        Router, sin copiarlo. Solo se vuelve a hacer si el Router reconstruyó
+        sus tablas. Las tablas de cada destino se construyen cuando aparece
+        el primer coche que va hacia él (ver flush_spawns y restore).
+        """
+        router = self.model.router
+        if self.hops_version == router.version:
+            return
+        if router.mode != "table":
+            raise ValueError(
+                "El motor vectorizado necesita el Router en modo 'table'.")
+
+        destinations = router.destinations
+        self.destination_index = {
+            destination: i for i, destination in enumerate(destinations)}
+        self.destination_cells = np.array(
+            [router.cell_index(destination) for destination in destinations], dtype=np.int32)
+        self.hops = router.next_hop
+        self.hops_version = router.version
+
+    def spawn(self, pos, destination, direction="Undefined", car_id=0):
+        """
+        Agrega un coche en la posición dada. El coche se incorpora a los
+        arreglos al inicio del siguiente paso, pero su celda se marca como
+        ocupada de inmediato.
+
+        Args:
+            pos (tuple): Posición inicial del coche.
+            destination (tuple): Destino del coche.
+            direction (str | list): Dirección de la carretera donde aparece.
+            car_id (int): Identificador numérico del coche, asignado por el modelo.
+        """
+        heading = HEADING_CODES.get(direction, NO_HEADING) if isinstance(
+            direction, str) else NO_HEADING
+        self.pending_spawns.append(
+            (car_id, self.model.step_count, pos, destination, heading))
+        self.occupancy[pos[0] * self.height + pos[1]] = True
+
+    def flush_spawns(self):
+        """
+        Incorpora a los arreglos los coches agregados desde el último paso.
+        """
+        if not self.pending_spawns:
+            return
+        self.load_routes()
+
+        spawns = self.pending_spawns
+        self.pending_spawns = []
+        count = len(spawns)
+        cells = np.array([pos[0] * self.height + pos[1]
+                         for _, _, pos, _, _ in spawns], dtype=np.int32)
+
+        self.car_id = np.concatenate(
+            (self.car_id, np.array([s[0] for s in spawns], dtype=np.int64)))
+        self.spawn_step = np.concatenate(
+            (self.spawn_step, np.array([s[1] for s in spawns], dtype=np.int32)))
+        self.origin = np.concatenate((self.origin, cells))
+        self.cell = np.concatenate((self.cell, cells))
+        destinations = np.array([self.destination_index[s[3]] for s in spawns], dtype=np.int32)
+        self.model.router.build_tables(np.unique(destinations).tolist())
+        self.destination = np.concatenate((self.destination, destinations))
+        self.path_cursor = np.concatenate(
+            (self.path_cursor, np.zeros(count, dtype=np.int32)))
+        self.stopped = np.concatenate(
+            (self.stopped, np.zeros(count, dtype=bool)))
+        self.time_since_lane_change = np.concatenate(
+            (self.time_since_lane_change, np.zeros(count, dtype=np.int32)))
+        self.routed = np.concatenate(
+            (self.routed, np.zeros(count, dtype=bool)))
+        self.heading = np.concatenate((self.heading, np.array(
+            [s[4] for s in spawns], dtype=np.int8)))
+
+    def snapshot(self):
+        """
+        Copia el estado dinámico del motor.
+
+        Returns:
+            dict: Arreglos de los coches, coches por incorporar y estado del generador aleatorio.
+        """
+        state = {name: getattr(self, name).copy() for name in CAR_FIELDS}
+        state["pending_spawns"] = list(self.pending_spawns)
+        state["rng"] = self.rng.bit_generator.state
+        return state
+
+    def restore(self, state):
+        """
+        Regresa el motor a un estado guardado con snapshot(). La ocupación la
+        restaura el modelo.
+
+        Args:
+            state (dict): Estado guardado.
+        """
+        for name in CAR_FIELDS:
+            setattr(self, name, state[name].copy())
+        self.pending_spawns = list(state["pending_spawns"])
+        self.rng.bit_generator.state = state["rng"]
+        # El estado puede venir de otro modelo, cuyo Router ya tenía las tablas de estos destinos
+        self.load_routes()
+        self.model.router.build_tables(np.unique(self.destination).tolist())
+
+    def keep(self, mask):
+        """
+        Conserva solo los coches indicados por la máscara.
+
+        Args:
+            mask (np.ndarray): Máscara booleana de los coches que se conservan.
+        """
+        for name in CAR_FIELDS:
+            setattr(self, name, getattr(self, name)[mask])
+
+    def headings(self, source, target):
+        """
+        Calcula la dirección de un movimiento como lo hace Car.get_direction
+        (primero el eje x y después el eje y).
+
+        Args:
+            source (np.ndarray): Celdas de origen.
+            target (np.ndarray): Celdas de destino.
+
+        Returns:
+            np.ndarray: Códigos de dirección.
+        """
+        dx = np.sign(target // self.height - source // self.height)
+        dy = np.sign(target % self.height - source % self.height)
+        return HEADING_TABLE[(dx + 1) * 3 + dy + 1]
+
+    def flat_cells(self, x, y):
+        """
+        Convierte coordenadas en índices de celda.
+
+        Args:
+            x (np.ndarray): Coordenadas x.
+            y (np.ndarray): Coordenadas y.
+
+        Returns:
+            np.ndarray: Índice de cada celda, o -1 si está fuera del mapa.
+        """
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        return np.where(inside, x * self.height + y, -1)
+
+    def light_states(self):
+        """
+        Obtiene el estado actual de todos los semáforos.
+
+        Returns:
+            np.ndarray: True para los semáforos en verde.
+        """
+        return self.model.light_scheduler.states
+
+    def step(self):
+        """
+        Avanza un paso a todos los coches.
+
+        Returns:
+            int: Número de coches que llegaron a su destino en este paso.
+        """
+        self.flush_spawns()
+        if not len(self.cell):
+            return 0
+        self.load_routes()
+
+        count = len(self.cell)
+        priority = self.rng.permutation(count)
+        self.time_since_lane_change += 1
+        arrived = self.cell == self.destination_cells[self.destination]
+        footprint = self.footprint(arrived)
+        reads, writes = footprint[0], footprint[1]
+        # Ocupación al inicio del paso y turno en que se desocupó o se ocupó cada celda
+        history = (self.occupancy.copy(), np.full(self.occupancy.size, count, dtype=np.int64),
+                   np.full(self.occupancy.size, count, dtype=np.int64))
+
+        pending = np.arange(count)
+        while len(pending):
+            # Un coche actúa cuando ya actuaron todos los coches anteriores que pueden cambiar una celda que él lee
+            first_write = self.first_use(writes[pending], priority[pending], count)
+            blocking = np.where(reads[pending] >= 0, first_write[reads[pending]], count).min(axis=1)
+            ready = blocking >= priority[pending]
+            self.act(pending[ready], priority, arrived, footprint, history)
+            pending = pending[~ready]
+
+        if arrived.any():
+            self.keep(~arrived)
+        return int(arrived.sum())
+
+    def footprint(self, arrived):
+        """
+        Calcula, para cada coche, las celdas que su turno lee y las que
+        puede cambiar. Solo dependen del estado del propio coche, que no
+        cambia hasta su turno.
+
+        Un coche que llegó a su destino solo desocupa su celda. Los demás leen
+        y pueden ocupar la siguiente celda de su ruta. Los que pueden cambiar
+        de carril (ya tienen ruta y pasó el tiempo de espera) leen además la
+        vecindad de la celda de enfrente, que cuenta Car.check_for_lane_change,
+        y pueden ocupar las diagonales a las que podrían cambiarse y la
+        siguiente celda de la ruta desde cada una, salvo que no tengan
+        ninguna diagonal a la cual cambiarse o que esa vecindad no pueda
+        llegar a VISION_RANGE coches en este paso.
+
+        Args:
+            arrived (np.ndarray): Máscara de los coches que están en su destino.
+
+        Returns:
+            tuple: Celdas leídas (n, 18) y celdas que puede cambiar (n, 10),
+            siguiente celda de la ruta (n,), vecindad de la celda de enfrente
+            (n, 9), diagonales (n, 4) y siguiente celda desde cada diagonal
+            (n, 4). Las celdas que no aplican son -1.
+        """
+        h = self.height
+        count = len(self.cell)
+        cells = self.cell
+        next_cells = np.where(arrived, -1, self.hops[self.destination, cells])
+        front_area = np.full((count, 9), -1, dtype=np.int64)
+        diagonals = np.full((count, 4), -1, dtype=np.int64)
+        diagonal_next = np.full((count, 4), -1, dtype=np.int64)
+
+        eligible = self.routed & (next_cells >= 0) & (
+            self.time_since_lane_change >= self.lane_change_cooldown)
+        candidates = np.flatnonzero(eligible)
+        source = cells[candidates]
+        x, y = source // h, source % h
+
+        # Celda de enfrente según la dirección del siguiente paso de la ruta
+        offset = FRONT_OFFSETS[self.headings(source, next_cells[candidates])]
+        fx, fy = x + offset[:, 0], y + offset[:, 1]
+        front = self.flat_cells(fx, fy)
+        valid = (front >= 0) & self.walkable[front]
+        candidates, x, y, fx, fy = candidates[valid], x[valid], y[valid], fx[valid], fy[valid]
+
+        # Un cambio de carril necesita una diagonal a la que se pueda entrar
+        options = self.flat_cells(x[:, None] + DIAGONAL_OFFSETS[:, 0], y[:, None] + DIAGONAL_OFFSETS[:, 1])
+        current = self.heading[candidates, None]
+        opposite = np.where(DIAGONAL_OFFSETS[:, 0] == 1, current == LEFT, current == RIGHT)
+        usable = (options >= 0) & self.walkable[options] & ~self.is_destination[options] & ~opposite
+        valid = usable.any(axis=1)
+        candidates, usable, options = candidates[valid], usable[valid], options[valid]
+        diagonals[candidates] = np.where(usable, options, -1)
+        diagonal_next[candidates] = np.where(
+            usable, self.hops[self.destination[candidates, None], options], -1)
+        front_area[candidates] = self.flat_cells(fx[valid, None] + AREA_OFFSETS[:, 0],
+                                                 fy[valid, None] + AREA_OFFSETS[:, 1])
+
+        # Si ni contando las celdas a las que algún coche podría entrar se
+        # juntan VISION_RANGE coches, el coche no puede cambiar de carril en este paso
+        while len(candidates):
+            possible = self.occupancy.copy()
+            for targets in (next_cells, diagonals, diagonal_next):
+                possible[targets[targets >= 0]] = True
+            area = front_area[candidates]
+            crowded = np.where(area >= 0, possible[area], False).sum(axis=1) >= VISION_RANGE
+            if crowded.all():
+                break
+            calm = candidates[~crowded]
+            front_area[calm] = diagonals[calm] = diagonal_next[calm] = -1
+            candidates = candidates[crowded]
+
+        reads = np.concatenate(
+            (next_cells[:, None], front_area, diagonals, diagonal_next), axis=1)
+        writes = np.concatenate(
+            (cells[:, None], next_cells[:, None], diagonals, diagonal_next), axis=1)
+        return reads, writes, next_cells, front_area, diagonals, diagonal_next
+
+    def first_use(self, cells, priority, count):
+        """
+        Obtiene la prioridad más baja de los coches que usan cada celda.
+
+        Args:
+            cells (np.ndarray): Celdas de cada coche (n, k), -1 las que no aplican.
+            priority (np.ndarray): Prioridad de cada coche (n,).
+            count (int): Valor para las celdas que ningún coche usa.
+
+        Returns:
+            np.ndarray: Prioridad por celda. La última posición recibe el
+            relleno (-1) y no se debe leer.
+        """
+        first = np.full(self.occupancy.size + 1, count, dtype=np.int64)
+        np.minimum.at(first, cells.ravel(), np.repeat(priority, cells.shape[1]))
+        return first
+
+    def occupied_at(self, cells, turn, history):
+        """
+        Obtiene la ocupación de varias celdas como la ve un coche en su turno:
+        con los cambios de los coches anteriores y sin los de los posteriores,
+        aunque ya hayan actuado.
+
+        Args:
+            cells (np.ndarray): Celdas.
+            turn (np.ndarray): Prioridad del coche que las lee (se difunde con cells).
+            history (tuple): Ocupación al inicio del paso y turno en que se
+                desocupó y en que se ocupó cada celda.
+
+        Returns:
+            np.ndarray: True para las celdas ocupadas.
+        """
+        start, vacated, entered = history
+        return (entered[cells] < turn) | ((vacated[cells] >= turn) & start[cells])
+
+    def act(self, cars, priority, arrived, footprint, history):
+        """
+        Ejecuta el turno de varios coches que no dependen entre sí, con las
+        reglas de Car.move: el que está en su destino se retira, el que tiene
+        al menos VISION_RANGE coches alrededor de la celda de enfrente se
+        cambia a la primera diagonal libre, y después intenta avanzar a la
+        siguiente celda de su ruta si no hay un coche ni un semáforo en rojo.
+
+        Args:
+            cars (np.ndarray): Índices de los coches.
+            priority (np.ndarray): Orden de todos los coches en este paso.
+            arrived (np.ndarray): Máscara de los coches que están en su destino.
+            footprint (tuple): Resultado de footprint().
+            history (tuple): Ver occupied_at(). Se actualiza con los cambios de estos coches.
+        """
+        _, _, next_cells, front_area, diagonals, diagonal_next = footprint
+        _, vacated, entered = history
+        occupancy = self.occupancy
+        leaving = cars[arrived[cars]]
+        vacated[self.cell[leaving]] = priority[leaving]
+        occupancy[self.cell[leaving]] = False
+
+        cars = cars[~arrived[cars]]
+        turn = priority[cars]
+        source = self.cell[cars]
+        position = source.copy()
+        target = next_cells[cars]
+        lane_change = np.zeros(len(cars), dtype=bool)
+
+        rows = np.flatnonzero(diagonals[cars, :].max(axis=1) >= 0)
+        if len(rows):
+            options = diagonals[cars[rows]]
+            area = front_area[cars[rows]]
+            crowded = np.where(area >= 0, self.occupied_at(area, turn[rows, None], history),
+                               False).sum(axis=1) >= VISION_RANGE
+            free = (options >= 0) & ~self.occupied_at(options, turn[rows, None], history)
+            first = free.argmax(axis=1)
+            picked = np.arange(len(rows))
+            change = crowded & free[picked, first]
+            rows, first, picked = rows[change], first[change], picked[change]
+            lane_change[rows] = True
+            position[rows] = options[picked, first]
+            target[rows] = diagonal_next[cars[rows], first]
+
+        routed = target >= 0
+        lights = self.light_index[np.where(routed, target, 0)]
+        green = (lights < 0) | self.light_states()[lights]
+        # Después de cambiar de carril la celda de origen ya está libre
+        moved = routed & green & (~self.occupied_at(target, turn, history) | (lane_change & (target == source)))
+        final = np.where(moved, target, position)
+
+        left = final != source
+        vacated[source[left]] = turn[left]
+        entered[final[left]] = turn[left]
+        occupancy[source[left]] = False
+        occupancy[final[left]] = True
+        changed = cars[lane_change]
+        self.time_since_lane_change[changed] = 0
+        self.stopped[changed] = False
+        self.routed[cars] |= routed
+        self.heading[cars[routed]] = self.headings(position[routed], target[routed])
+        self.stopped[cars[routed]] = ~moved[routed]
+        self.path_cursor[cars[moved]] += 1
+        self.cell[cars] = final
+
+    def car_arrays(self):
+        """
+        Obtiene el estado visible de todos los coches en arreglos.
+
+        Returns:
+            tuple: Identificadores numéricos (n,), posiciones (n, 2) y destinos (n, 2).
+        """
+        self.flush_spawns()
+        destinations = np.array(
+            self.model.router.destinations, dtype=np.int64).reshape(-1, 2)
+        positions = np.stack(np.divmod(self.cell, self.height), axis=1)
+        return self.car_id, positions, destinations[self.destination]
+
+    def car_spawns(self):
+        """
+        Obtiene el paso y la posición en que apareció cada coche.
+
+        Returns:
+            tuple: Pasos de aparición (n,) y posiciones de origen (n, 2), en el orden de car_arrays().
+        """
+        self.flush_spawns()
+        return self.spawn_step, np.stack(np.divmod(self.origin, self.height), axis=1)
+
+    def positions(self):
+        """
+        Obtiene el estado visible de todos los coches.
+
+        Returns:
+            list: Tuplas (id, posición, destino) de cada coche.
+        """
+        self.flush_spawns()
+        destinations = self.model.router.destinations
+        return [
+            (f"car_{step}_{origin // self.height}_{origin % self.height}",
+             divmod(int(cell), self.height), destinations[destination])
+            for step, origin, cell, destination in zip(
+                self.spawn_step.tolist(), self.origin.tolist(),
+                self.cell.tolist(), self.destination.tolist())
+        ]
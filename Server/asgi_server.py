@@ -0,0 +1,81 @@
+# ASGI version of the server. It serves every route of server.py unchanged (the Flask app is mounted as WSGI)
+# and adds /stream, a WebSocket that pushes a frame on every step instead of waiting for /update + /getCars.
+# Run it with: python asgi_server.py  (or uvicorn asgi_server:app --port 8585)
+
+import asyncio
+import uvicorn
+from starlette.applications import Starlette
+from starlette.routing import Mount, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+from agents.streaming import DEFAULT_TICK_RATE, SessionStream
+import server
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    from starlette.middleware.wsgi import WSGIMiddleware
+
+# Background streams by session id. A stream only runs while it has subscribers.
+streams = {}
+
+# This route streams a session: connect to /stream?session=<id>&tick=<steps per second> after /init.
+# The first message is a full frame and the next ones only have what changed, like /step.
+# The tick rate is set by the first client of the session. The socket is closed with code 4404 if the session doesn't exist
+# and with 4409 if it was created with prefetch or replay.
+
+
+async def streamSession(websocket):
+    sessionId = websocket.query_params.get('session') or server.sessions.default_id
+    await websocket.accept()
+    session = server.sessions.get(sessionId)
+    if session is None:
+        await websocket.close(code=4404)
+        return
+    # Sessions with prefetch are already stepped by their own thread, and replay sessions have no model.
+    if session.prefetcher is not None or session.model is None:
+        await websocket.close(code=4409)
+        return
+
+    stream = streams.get(sessionId)
+    if stream is None or not stream.subscribers:
+        tickRate = float(websocket.query_params.get('tick', DEFAULT_TICK_RATE))
+        stream = streams[sessionId] = SessionStream(server.sessions, sessionId, tickRate)
+    subscriber = stream.subscribe()
+
+    async def waitForDisconnect():
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            subscriber.push(None)
+
+    receiver = asyncio.create_task(waitForDisconnect())
+    try:
+        while True:
+            message = await subscriber.queue.get()
+            if message is None:
+                break
+            await websocket.send_text(message)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        receiver.cancel()
+        stream.unsubscribe(subscriber)
+        if not stream.subscribers and streams.get(sessionId) is stream:
+            del streams[sessionId]
+
+    # The session expired or the client left; closing an already closed socket fails, which is fine.
+    try:
+        await websocket.close(code=4404 if server.sessions.get(sessionId) is None else 1000)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+
+
+app = Starlette(routes=[
+    WebSocketRoute('/stream', streamSession),
+    Mount('/', app=WSGIMiddleware(server.app))
+])
+
+if __name__ == '__main__':
+    # Run the ASGI server in port 8585
+    uvicorn.run(app, host="localhost", port=8585)
@@ -0,0 +1,12 @@
+"""
+Benchmarks de la simulación de tráfico.
+
+Miden la construcción del modelo, los pasos por segundo a densidades fijas
+de coches y la latencia de las rutas del servidor Flask. Todas las
+ejecuciones usan semillas fijas y los resultados se guardan en JSON para
+poder comparar dos commits:
+
+    python -m benchmarks --output antes.json
+    python -m benchmarks --output despues.json
+    python -m benchmarks compare antes.json despues.json
+"""
@@ -0,0 +1,122 @@
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+from .model import MAPS, bench_model_build, bench_throughput
+from .endpoints import bench_endpoints
+
+DENSITIES = [0.1, 0.25, 0.4]
+
+
+def git_commit():
+    """
+    Obtiene el commit actual, si el código está en un repositorio de git.
+
+    Returns:
+        str: Hash del commit o None.
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed
+        },
+        "model_build": [bench_model_build(city_file, args.build_repeats, args.seed)
+                        for city_file in args.maps],
+        "throughput": [bench_throughput(city_file, density, args.steps, seed=args.seed, backend=backend)
+                       for city_file in args.maps
+                       for density in args.densities
+                       for backend in args.backends]
+    }
+    if not args.skip_endpoints:
+        results["endpoints"] = bench_endpoints(args.requests, seed=args.seed)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+def ratio(before, after):
+    return after / before if before else float("nan")
+
+
+def compare(before_path, after_path):
+    """
+    Imprime la razón después/antes de las métricas principales de dos resultados.
+
+    Args:
+        before_path (str): JSON del commit anterior.
+        after_path (str): JSON del commit nuevo.
+    """
+    with open(before_path) as before_file, open(after_path) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+
+    print("Construcción del modelo (mediana, después/antes):")
+    for old, new in zip(before["model_build"], after["model_build"]):
+        for phase in ("init", "load_city_map", "create_city_graph"):
+            print(f"  {old['map']:<16} {phase:<18} {old[phase]['median_ms']:9.3f} ms -> "
+                  f"{new[phase]['median_ms']:9.3f} ms  x{ratio(old[phase]['median_ms'], new[phase]['median_ms']):.2f}")
+
+    print("Pasos por segundo (después/antes):")
+    for old, new in zip(before["throughput"], after["throughput"]):
+        print(f"  {old['map']:<16} {old.get('backend', 'agents'):<7} densidad {old['density']:<5} "
+              f"{old['steps_per_second']:10.1f} -> {new['steps_per_second']:10.1f}  "
+              f"x{ratio(old['steps_per_second'], new['steps_per_second']):.2f}")
+
+    if "endpoints" in before and "endpoints" in after:
+        print("Latencia de rutas (p50 / p99, después/antes):")
+        for route, old in before["endpoints"].items():
+            new = after["endpoints"].get(route)
+            if new:
+                print(f"  {route:<18} p50 x{ratio(old['p50_ms'], new['p50_ms']):.2f}  "
+                      f"p99 x{ratio(old['p99_ms'], new['p99_ms']):.2f}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "compare":
+        if len(argv) != 3:
+            sys.exit("Uso: python -m benchmarks compare antes.json despues.json")
+        compare(argv[1], argv[2])
+        return
+
+    parser = argparse.ArgumentParser(
+        description="Benchmarks de la simulación de tráfico.")
+    parser.add_argument("--maps", nargs="+", default=MAPS,
+                        help="Mapas a medir.")
+    parser.add_argument("--densities", type=float, nargs="+", default=DENSITIES,
+                        help="Densidades de coches para medir pasos por segundo.")
+    parser.add_argument("--backends", nargs="+", default=["agents"], choices=("agents", "vector"),
+                        help="Motores de coches a medir.")
+    parser.add_argument("--steps", type=int, default=200,
+                        help="Pasos medidos por densidad.")
+    parser.add_argument("--build-repeats", type=int, default=10,
+                        help="Construcciones del modelo medidas por mapa.")
+    parser.add_argument("--requests", type=int, default=200,
+                        help="Peticiones medidas por ruta.")
+    parser.add_argument("--skip-endpoints", action="store_true",
+                        help="No medir las rutas del servidor.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Semilla de todas las ejecuciones.")
+    parser.add_argument("--output", default=None,
+                        help="Archivo JSON de salida.")
+    run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
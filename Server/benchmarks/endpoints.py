@@ -0,0 +1,94 @@
+import contextlib
+import os
+import time
+import numpy as np
+
+GET_ROUTES = ["/getCars", "/getObstacles", "/getTrafficLights",
+              "/getRoad", "/getDestination", "/update", "/step", "/sessions"]
+
+
+def latency(samples):
+    """
+    Resume una lista de latencias en segundos.
+
+    Args:
+        samples (list): Latencias medidas.
+
+    Returns:
+        dict: Percentiles 50 y 99 y media en milisegundos.
+    """
+    values = np.array(samples) * 1000
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean()),
+        "requests": len(samples)
+    }
+
+
+def timed_request(call, responses=None):
+    """
+    Mide una petición del cliente de prueba de Flask.
+
+    Args:
+        call (callable): Función que hace la petición.
+        responses (list): Si se da, se le agrega la respuesta.
+
+    Returns:
+        float: Latencia en segundos.
+    """
+    start = time.perf_counter()
+    response = call()
+    elapsed = time.perf_counter() - start
+    if response.status_code >= 400:
+        raise RuntimeError(
+            f"La petición falló con código {response.status_code}")
+    if responses is not None:
+        responses.append(response)
+    return elapsed
+
+
+def bench_endpoints(requests=200, init_requests=10, warmup_steps=100, seed=0):
+    """
+    Mide la latencia de cada ruta de server.py con el cliente de prueba de Flask.
+
+    La salida estándar se descarta mientras se mide, porque el modelo imprime
+    su estado en cada paso. Las rutas GET se miden sobre la última sesión
+    creada y al final se mide /close cerrando las sesiones que creó /init.
+
+    Args:
+        requests (int): Peticiones medidas por ruta.
+        init_requests (int): Peticiones medidas a /init y a /close.
+        warmup_steps (int): Pasos que se avanzan antes de medir, para que haya coches en el mapa.
+        seed (int): Semilla enviada a /init.
+
+    Returns:
+        dict: Latencias por ruta.
+    """
+    import server
+
+    client = server.app.test_client()
+    results = {}
+    init_responses = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results["/init"] = latency([
+            timed_request(lambda: client.post("/init", data={"seed": seed}), init_responses)
+            for _ in range(init_requests)
+        ])
+
+        for _ in range(warmup_steps):
+            client.get("/update")
+
+        for route in GET_ROUTES:
+            results[route] = latency([
+                timed_request(lambda: client.get(route))
+                for _ in range(requests)
+            ])
+
+        # Las sesiones que ya descartó el registro (más de MAX_SESSIONS) no se pueden cerrar
+        session_ids = [response.get_json()["session"] for response in init_responses]
+        results["/close"] = latency([
+            timed_request(lambda: client.post("/close", data={"session": session_id}))
+            for session_id in session_ids if session_id in server.sessions.sessions
+        ])
+    return results
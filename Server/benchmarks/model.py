@@ -0,0 +1,137 @@
+import statistics
+import time
+from agents.model import CityModel
+from agents.tiles import ROAD
+
+MAPS = ["2021_base.txt", "2022_base.txt", "2023_base.txt"]
+
+
+class TimedCityModel(CityModel):
+    """
+    CityModel que mide por separado load_city_map y create_city_graph.
+    """
+
+    def load_city_map(self, city_base_path):
+        start = time.perf_counter()
+        super().load_city_map(city_base_path)
+        self.load_city_map_time = time.perf_counter() - start
+
+    def create_city_graph(self):
+        start = time.perf_counter()
+        super().create_city_graph()
+        self.create_city_graph_time = time.perf_counter() - start
+
+
+def summarize(samples):
+    """
+    Resume una lista de tiempos en segundos.
+
+    Args:
+        samples (list): Tiempos medidos.
+
+    Returns:
+        dict: Mediana, mínimo y máximo en milisegundos.
+    """
+    return {
+        "median_ms": statistics.median(samples) * 1000,
+        "min_ms": min(samples) * 1000,
+        "max_ms": max(samples) * 1000,
+        "samples": len(samples)
+    }
+
+
+def bench_model_build(city_file, repeats=10, seed=0):
+    """
+    Mide CityModel.__init__ y sus dos fases más costosas, sin el caché de mapas compilados.
+
+    Args:
+        city_file (str): Archivo del mapa.
+        repeats (int): Número de construcciones a medir.
+        seed (int): Semilla del modelo.
+
+    Returns:
+        dict: Tiempos de __init__, load_city_map y create_city_graph.
+    """
+    init_times, load_times, graph_times = [], [], []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model = TimedCityModel(city_file=city_file,
+                               seed=seed, verbose=False, map_cache_dir=None)
+        init_times.append(time.perf_counter() - start)
+        load_times.append(model.load_city_map_time)
+        graph_times.append(model.create_city_graph_time)
+
+    return {
+        "map": city_file,
+        "init": summarize(init_times),
+        "load_city_map": summarize(load_times),
+        "create_city_graph": summarize(graph_times)
+    }
+
+
+def fill_to_density(model, density):
+    """
+    Agrega coches en carreteras libres elegidas al azar hasta que la fracción
+    de celdas transitables ocupadas llegue a la densidad pedida. Solo se usan
+    celdas desde las que hay camino al destino elegido.
+
+    Args:
+        model (CityModel): Modelo a llenar.
+        density (float): Fracción objetivo de celdas ocupadas.
+    """
+    target = int(density * model.tiles.walkable.sum())
+    missing = target - int(model.occupancy.sum())
+    if missing <= 0:
+        return
+
+    free_roads = [(int(x), int(y)) for x, y in zip(*((model.tiles.kind == ROAD) & ~model.occupancy).nonzero())]
+    model.random.shuffle(free_roads)
+    for pos in free_roads:
+        if missing <= 0:
+            break
+        destination = model.random.choice(model.destinations)
+        if model.router.has_path(pos, destination) and pos != destination:
+            model.add_car(pos, destination)
+            missing -= 1
+
+
+def bench_throughput(city_file, density, steps=200, warmup=20, seed=0, backend="agents"):
+    """
+    Mide los pasos por segundo manteniendo una densidad fija de coches. Antes
+    de cada paso (fuera del tiempo medido) se rellena el mapa hasta la densidad pedida.
+
+    Args:
+        city_file (str): Archivo del mapa.
+        density (float): Fracción de celdas transitables ocupadas por coches.
+        steps (int): Pasos medidos.
+        warmup (int): Pasos previos sin medir.
+        seed (int): Semilla del modelo.
+        backend (str): Motor de los coches.
+
+    Returns:
+        dict: Pasos por segundo y tiempos por paso.
+    """
+    model = CityModel(city_file=city_file, seed=seed,
+                      verbose=False, backend=backend)
+    for _ in range(warmup):
+        fill_to_density(model, density)
+        model.step()
+
+    step_times = []
+    for _ in range(steps):
+        fill_to_density(model, density)
+        start = time.perf_counter()
+        model.step()
+        step_times.append(time.perf_counter() - start)
+
+    total = sum(step_times)
+    return {
+        "map": city_file,
+        "backend": backend,
+        "density": density,
+        "steps": steps,
+        "steps_per_second": steps / total if total else 0.0,
+        "step": summarize(step_times),
+        "live_cars": model.car_counter,
+        "arrivals": model.carsInDestination
+    }
@@ -2,13 +2,26 @@
 # Python flask server to interact with Unity. Based on the code provided by Sergio Ruiz.
 # Octavio Navarro. October 2023
 
-from flask import Flask, request, jsonify
+import os
+from flask import Flask, Response, abort, make_response, request, jsonify
 from agents.model import CityModel
 from agents.agent import *
-
-# Size of the board:
-randomModel = None
-currentStep = 0
+from agents.frames import available_codecs, car_records, encode_cars, encode_lights, light_records
+from agents.prefetch import DEFAULT_CLIENT
+from agents.sessions import ReplaySession, SessionRegistry
+from agents.trajectory import TrajectoryReader
+
+# Each /init creates a session with its own model. At most MAX_SESSIONS models are kept alive
+# (the least recently used is dropped) and sessions idle for SESSION_IDLE_TIMEOUT seconds are removed.
+# Least recently used sessions are also dropped while the estimated memory of all of them is over
+# MAX_SESSION_MEMORY bytes. Set the MAX_SESSION_MEMORY environment variable to change it, or to 0 for no limit.
+MAX_SESSIONS = 16
+SESSION_IDLE_TIMEOUT = 600
+MAX_SESSION_MEMORY = int(os.environ.get('MAX_SESSION_MEMORY', 1024 ** 3)) or None
+sessions = SessionRegistry(MAX_SESSIONS, SESSION_IDLE_TIMEOUT, MAX_SESSION_MEMORY)
+
+# Recorded runs (python -m agents.run --record trajectories/<name>) that /init can replay.
+TRAJECTORIES_DIR = os.path.join(os.path.dirname(__file__), 'trajectories')
 
 # This application will be used to interact with Unity
 app = Flask("Traffic example")
@@ -19,64 +32,147 @@ app = Flask("Traffic example")
 
 @app.route('/init', methods=['POST'])
 def initModel():
-    global currentStep, randomModel, modelCells
-
     if request.method == 'POST':
-        currentStep = 0
+        # Create the model using the parameters sent by Unity.
+        # An optional "seed" makes the run reproducible.
+        # With "replay" the session plays a recorded run from TRAJECTORIES_DIR instead of creating a model.
+        replay = request.form.get("replay")
+        if replay:
+            path = os.path.join(TRAJECTORIES_DIR, os.path.basename(replay))
+            if not os.path.exists(path):
+                return jsonify({'message': f'Unknown trajectory {replay}.'}), 404
+            sessionId = sessions.add(ReplaySession(TrajectoryReader(path)))
+            return jsonify({"message": "Trajectory loaded.", "session": sessionId})
+
+        seed = request.form.get("seed", type=int)
+        # The static layers are served from the tile table, so roads, obstacles and destinations don't need agents.
+        # Sessions don't print every step; /sessions reports their step and cars instead.
+        sessionId = sessions.create(CityModel(seed=seed, verbose=False, static_agents=False))
+
+        # With "prefetch" > 0 the model is stepped in the background up to that many steps ahead of the
+        # slowest client, and /update, /getCars and /getTrafficLights only read frames that are already done.
+        prefetch = request.form.get("prefetch", 0, type=int)
+        if prefetch > 0:
+            sessions.get(sessionId).start_prefetch(prefetch)
+
+        # Return a message to Unity saying that the model was created successfully, and the id of its session
+        return jsonify({"message": "Parameters recieved, model initiated.", "session": sessionId})
+
+# The other routes use the session sent as "session" (query string or form) or in the X-Session-Id header.
+# Clients that don't send it use the last session created.
+
+
+def getSessionId():
+    return request.values.get('session') or request.headers.get('X-Session-Id')
+
+
+def getSession():
+    session = sessions.get(getSessionId())
+    if session is None:
+        abort(make_response(jsonify({'message': 'Unknown or expired session, call /init again.'}), 404))
+    return session
+
+# Sessions that prefetch can only be read through the prefetched frames; the model itself is ahead of the clients.
+# Several viewers of the same session are told apart by the optional "client" parameter.
+# Replay sessions have no model, only the recorded cars and traffic lights.
+
 
-        print(request.form)
+def getClientId():
+    return request.values.get('client', DEFAULT_CLIENT)
 
-        # Create the model using the parameters sent by Unity
-        randomModel = CityModel()
 
-        # Return a message to Unity saying that the model was created successfully
-        return jsonify({"message": "Parameters recieved, model initiated."})
+def requireModel(session):
+    if session.prefetcher is not None or session.model is None:
+        abort(make_response(jsonify({'message': 'Not available for sessions with prefetch or replay.'}), 409))
+
+# /getCars and /getTrafficLights answer with a binary frame (see agents/frames.py) instead of JSON
+# when the client sends format=binary or "Accept: application/octet-stream".
+# The optional compress=zlib|lz4 compresses the frame after its header.
+
+
+def wantsBinary():
+    return request.args.get('format') == 'binary' or request.accept_mimetypes.best == 'application/octet-stream'
+
+
+def binaryResponse(encode):
+    codec = request.args.get('compress', 'none')
+    if codec not in available_codecs():
+        return jsonify({'message': f'Unsupported compression {codec}.'}), 400
+    session = getSession()
+    requireModel(session)
+    with session.lock:
+        body = encode(session.model, codec)
+    return Response(body, mimetype='application/octet-stream')
 
 # This route will be used to get the positions of the agents
 
 
 @app.route('/getCars', methods=['GET'])
 def getCars():
-    global randomModel
-
     if request.method == 'GET':
         # Get the positions of the agents and return them to Unity in JSON format.
         # Note that the positions are sent as a list of dictionaries, where each dictionary has the id and position of an agent.
         # The y coordinate is set to 1, since the agents are in a 3D world. The z coordinate corresponds to the row (y coordinate) of the grid in mesa.
 
-        carsPos = [{"id": str(agent.unique_id), "x": x, "y": 1, "z": z - 1, "destX": agent.destination[0], "destZ": agent.destination[1] - 1} for agents, (x, z)
-                   in randomModel.grid.coord_iter() for agent in agents if isinstance(agent, Car)]
+        if wantsBinary():
+            return binaryResponse(encode_cars)
+
+        session = getSession()
+        if session.prefetcher is not None:
+            return Response(session.prefetcher.frame(getClientId())[1], mimetype='application/json')
+        if session.replay is not None:
+            # Reading a step moves the reader's shared cursor, so concurrent requests must not interleave
+            with session.lock:
+                carsPos = session.replay.car_records(session.current_step)
+            return jsonify({'positions': carsPos})
+
+        # The model can be stepped by another request or by a /stream task while it is being read
+        with session.lock:
+            carsPos = car_records(session.model)
 
         return jsonify({'positions': carsPos})
 
 
+def staticLayerResponse(name):
+    # Send the pre-encoded layer with its ETag. If the client already has it (If-None-Match), the answer is a 304 without body.
+    body, etag = getSession().static_layers.get(name)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
 # This route will be used to get the positions of the obstacles
 @app.route('/getObstacles', methods=['GET'])
 def getObstacles():
-    global randomModel
-
     if request.method == 'GET':
         # Get the positions of the obstacles and return them to Unity in JSON format.
         # Same as before, the positions are sent as a list of dictionaries, where each dictionary has the id and position of an obstacle.
 
-        obstaclesPos = [{"id": str(agent.unique_id), "x": x, "y": 1, "z": z - 1} for agents, (x, z)
-                        in randomModel.grid.coord_iter() for agent in agents if isinstance(agent, Obstacle)]
-
-        return jsonify({'positions': obstaclesPos})
+        return staticLayerResponse('obstacles')
 
 # This route will be used to get the positions of the obstacles
 
 
 @app.route('/getTrafficLights', methods=['GET'])
 def getTrafficLights():
-    global randomModel
-
     if request.method == 'GET':
         # Get the positions of the obstacles and return them to Unity in JSON format.
         # Same as before, the positions are sent as a list of dictionaries, where each dictionary has the id and position of an obstacle.
 
-        trafficLightsPos = [{"id": str(agent.unique_id), "x": x, "y": 1, "z": z - 1, "state": agent.state} for agents, (x, z)
-                            in randomModel.grid.coord_iter() for agent in agents if isinstance(agent, Traffic_Light)]
+        if wantsBinary():
+            return binaryResponse(encode_lights)
+
+        session = getSession()
+        if session.prefetcher is not None:
+            return Response(session.prefetcher.frame(getClientId())[2], mimetype='application/json')
+        if session.replay is not None:
+            with session.lock:
+                trafficLightsPos = session.replay.light_records(session.current_step)
+            return jsonify({'positions': trafficLightsPos})
+
+        with session.lock:
+            trafficLightsPos = light_records(session.model)
 
         return jsonify({'positions': trafficLightsPos})
 
@@ -85,44 +181,81 @@ def getTrafficLights():
 
 @app.route('/getRoad', methods=['GET'])
 def getRoad():
-    global randomModel
-
     if request.method == 'GET':
-        # Get the positions of the obstacles and return them to Unity in JSON format.
-        # Same as before, the positions are sent as a list of dictionaries, where each dictionary has the id and position of an obstacle.
-
-        roadPos = [{"id": str(agent.unique_id), "x": x, "y": 1, "z": z - 1} for agents, (x, z)
-                   in randomModel.grid.coord_iter() for agent in agents if isinstance(agent, Road)]
+        # Get the positions of the roads and return them to Unity in JSON format.
 
-        return jsonify({'positions': roadPos})
+        return staticLayerResponse('road')
 
 # This route will be used to get the positions of the obstacles
 
 
 @app.route('/getDestination', methods=['GET'])
 def getDestination():
-    global randomModel
-
     if request.method == 'GET':
-        # Get the positions of the obstacles and return them to Unity in JSON format.
-        # Same as before, the positions are sent as a list of dictionaries, where each dictionary has the id and position of an obstacle.
+        # Get the positions of the destinations and return them to Unity in JSON format.
 
-        destinationPos = [{"id": str(agent.unique_id), "x": x, "y": 1, "z": z - 1} for agents, (x, z)
-                          in randomModel.grid.coord_iter() for agent in agents if isinstance(agent, Destination)]
-
-        return jsonify({'positions': destinationPos})
+        return staticLayerResponse('destinations')
 
 # This route will be used to update the model
 
 
 @app.route('/update', methods=['GET'])
 def updateModel():
-    global currentStep, randomModel
     if request.method == 'GET':
         # Update the model and return a message to Unity saying that the model was updated successfully
-        randomModel.step()
-        currentStep += 1
-        return jsonify({'message': f'Model updated to step {currentStep}.', 'currentStep': currentStep})
+        session = getSession()
+        if session.prefetcher is not None:
+            try:
+                step = session.prefetcher.advance(getClientId())
+            except RuntimeError as error:
+                # The background thread stopped because a step failed; the session can't move forward
+                return jsonify({'message': str(error)}), 500
+            return jsonify({'message': f'Model updated to step {step}.', 'currentStep': step})
+        if session.replay is not None:
+            step = session.advance()
+            return jsonify({'message': f'Model updated to step {step}.', 'currentStep': step})
+
+        with session.lock:
+            session.model.step()
+            session.current_step += 1
+        return jsonify({'message': f'Model updated to step {session.current_step}.', 'currentStep': session.current_step})
+
+# This route advances the model and returns only what changed since the last /step:
+# cars that moved, spawned or arrived, and traffic lights that changed state.
+# Send full=1 to get the whole state instead, or since=<step> with the last step received;
+# if it doesn't match the last frame sent, the whole state is returned.
+
+
+@app.route('/step', methods=['GET'])
+def stepModel():
+    if request.method == 'GET':
+        session = getSession()
+        requireModel(session)
+        with session.lock:
+            session.model.step()
+            session.current_step += 1
+            frame = session.delta_tracker.frame(session.model, full=bool(request.args.get('full', 0, type=int)),
+                                                since=request.args.get('since', type=int))
+        return jsonify(frame)
+
+
+# This route lists the live sessions with their step, idle time and estimated memory.
+
+
+@app.route('/sessions', methods=['GET'])
+def listSessions():
+    if request.method == 'GET':
+        return jsonify(sessions.describe())
+
+# This route ends a session and frees its model.
+
+
+@app.route('/close', methods=['POST'])
+def closeSession():
+    if request.method == 'POST':
+        if not sessions.remove(getSessionId()):
+            return jsonify({'message': 'Unknown session.'}), 404
+        return jsonify({'message': 'Session closed.'})
 
 
 if __name__ == '__main__':
@@ -0,0 +1,142 @@
+"""
+Equivalencia de los modos de ruteo: las tablas de siguiente salto, A* con
+caché y A* dependiente del tiempo deben dar caminos igual de cortos.
+"""
+
+import os
+import networkx as nx
+import numpy as np
+import pytest
+from agents.mapcache import compile_map
+from agents.model import CITY_FILES_DIR, CityModel, resolve_city_file
+from agents.routing import LightPhases, Router
+
+CITY_FILES = ["2021_base.txt", "2022_base.txt", "2023_base.txt"]
+
+
+@pytest.fixture(params=CITY_FILES)
+def model(request):
+    return CityModel(city_file=request.param, verbose=False, seed=0, map_cache_dir=None)
+
+
+def make_router(model, mode="table", **kwargs):
+    return Router(model.city_graph, model.width, model.height, model.destinations, mode, **kwargs)
+
+
+def path_cost(graph, start, path):
+    cells = [start, *path]
+    return sum(graph[u][v]["weight"] for u, v in zip(cells, cells[1:]))
+
+
+def travel_time(phases, graph, start, path):
+    """
+    Costo de un camino con la misma cuenta que Router.timed_path: un paso
+    por movimiento, uno más por cambio de carril y la espera en cada semáforo.
+    """
+    now = phases.now()
+    cost = elapsed = 0
+    for node, neighbor in zip([start, *path], path):
+        assert graph.has_edge(node, neighbor)
+        wait = phases.wait(neighbor, now + elapsed)
+        cost += 1 + wait + (node[0] != neighbor[0] and node[1] != neighbor[1])
+        elapsed += 1 + wait
+    return cost
+
+
+def test_tables_are_built_lazily(model):
+    assert model.router.mode == "table"
+    assert not model.router.built.any()
+    assert model.router.table_bytes() == 0
+
+    goal = model.destinations[0]
+    model.router.table(goal)
+    assert model.router.built.sum() == 1
+    assert model.router.table_bytes() == model.width * model.height * 4
+
+
+def test_table_paths_are_shortest(model):
+    router = make_router(model)
+    reverse_graph = model.city_graph.reverse(copy=False)
+    for goal in model.destinations:
+        distances = nx.single_source_dijkstra_path_length(reverse_graph, goal, weight="weight")
+        for start in model.city_graph:
+            assert router.has_path(start, goal) == (start in distances)
+            if start in distances and start != goal:
+                assert path_cost(model.city_graph, start, router.path(start, goal)) == distances[start]
+
+
+def test_astar_matches_tables(model):
+    table_router = make_router(model)
+    astar_router = make_router(model, "astar")
+    starts = sorted(model.city_graph)[::7]
+    for goal in model.destinations:
+        for start in starts:
+            if start == goal or not table_router.has_path(start, goal):
+                continue
+            assert path_cost(model.city_graph, start, astar_router.path(start, goal)) == \
+                path_cost(model.city_graph, start, table_router.path(start, goal))
+
+
+def test_astar_cache_reuses_suffixes(model):
+    router = make_router(model, "astar")
+    goal = model.destinations[-1]
+    start = next(node for node in sorted(model.city_graph)
+                 if node != goal and router.has_path(node, goal) and len(router.path(node, goal)) > 3)
+    path = router.path(start, goal)
+    misses = router.cache_info()["misses"]
+
+    assert router.path(start, goal) == path
+    # Cualquier tramo final de un camino ya calculado sale del caché
+    assert router.path(path[1], goal) == path[2:]
+    assert router.cache_info()["misses"] == misses
+    assert router.cache_info()["hits"] >= 2
+
+
+def test_small_table_limit_falls_back_to_astar(model):
+    router = make_router(model, max_table_entries=model.width * model.height)
+    assert router.mode == "astar"
+    assert router.next_hop.shape[0] == 0
+    assert router.table(model.destinations[0]) is None
+    goal = model.destinations[0]
+    start = next(node for node in sorted(model.city_graph) if node != goal and router.has_path(node, goal))
+    assert path_cost(model.city_graph, start, router.path(start, goal)) == \
+        path_cost(model.city_graph, start, make_router(model).path(start, goal))
+
+
+@pytest.mark.parametrize("steps", [0, 7, 23])
+def test_timed_paths_never_arrive_later(model, steps):
+    for _ in range(steps):
+        model.step()
+    phases = LightPhases(model)
+    timed_router = make_router(model, "timed", light_phases=phases)
+    table_router = make_router(model)
+    starts = sorted(model.city_graph)[::11]
+    for goal in model.destinations:
+        for start in starts:
+            if start == goal or not table_router.has_path(start, goal):
+                continue
+            timed = timed_router.path(start, goal)
+            assert timed[-1] == goal
+            assert travel_time(phases, model.city_graph, start, timed) <= \
+                travel_time(phases, model.city_graph, start, table_router.path(start, goal))
+
+
+@pytest.mark.parametrize("city_file", CITY_FILES)
+def test_table_cache_round_trip(city_file, tmp_path):
+    model = CityModel(city_file=city_file, verbose=False, seed=0, map_cache_dir=None)
+    compiled = compile_map(resolve_city_file(city_file), os.path.join(CITY_FILES_DIR, "mapDictionary.json"),
+                           str(tmp_path))
+    assert compiled.destinations == model.destinations
+
+    router = make_router(model, table_cache=compiled)
+    router.build_tables()
+
+    def fail(destination):
+        raise AssertionError(f"La tabla de {destination} debía salir del caché.")
+
+    cached = make_router(model, table_cache=compiled)
+    cached.build_table = fail
+    cached.build_tables()
+    assert np.array_equal(cached.next_hop, router.next_hop)
+    assert np.array_equal(cached.next_hop, np.stack([make_router(model).table(goal)
+                                                     for goal in model.destinations]))